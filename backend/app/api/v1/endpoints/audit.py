@@ -2,19 +2,27 @@
 Audit endpoints for admin users.
 Provides access to audit logs and statistics.
 """
-from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import Response
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
 from typing import Optional, List
 from pydantic import BaseModel
 
 from ....core.auth import User, get_admin_user
+from ....core.pagination import encode_cursor, decode_cursor
+from ....infrastructure.database.async_storage import async_storage
 from ....infrastructure.database.audit_db import (
+    EXPORT_FORMATS,
+    LATENCY_ORDERS,
     AuditLog,
     AuditStats,
+    RouteLatency,
     get_audit_logs,
+    count_audit_logs,
     get_audit_stats,
-    export_audit_logs
+    get_route_latency,
+    iter_audit_export
 )
+from ....infrastructure.database.result_format import accepts_gzip, gzip_chunks
 
 router = APIRouter()
 
@@ -24,11 +32,13 @@ class AuditLogsResponse(BaseModel):
     total: int
     page: int
     limit: int
+    next_cursor: Optional[str] = None
 
 
 @router.get("/logs", response_model=AuditLogsResponse)
 async def list_audit_logs(
-    page: int = Query(1, ge=1),
+    cursor: Optional[str] = None,
+    page: int = Query(1, ge=1, deprecated=True),
     limit: int = Query(50, ge=1, le=100),
     user_id: Optional[int] = None,
     action: Optional[str] = None,
@@ -37,56 +47,80 @@ async def list_audit_logs(
     current_user: User = Depends(get_admin_user)
 ):
     """
-    Get paginated audit logs. Admin only.
+    Get audit logs, newest first. Admin only.
+    Pass the returned next_cursor to get the following page; total may lag
+    behind new logs by up to AUDIT_COUNT_CACHE_SECONDS. `page` (deprecated,
+    its cost grows with the depth) is used only without a cursor.
     """
-    offset = (page - 1) * limit
-    logs = get_audit_logs(
-        limit=limit,
-        offset=offset,
-        user_id=user_id,
-        action=action,
-        start_date=start_date,
-        end_date=end_date
-    )
+    filters = dict(user_id=user_id, action=action, start_date=start_date, end_date=end_date)
+    try:
+        before = decode_cursor(cursor, 2) if cursor else None
+        offset = 0 if cursor else (page - 1) * limit
+        logs = await async_storage.read(get_audit_logs, limit=limit + 1, offset=offset, before=before, **filters)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    next_cursor = None
+    if len(logs) > limit:
+        logs = logs[:limit]
+        next_cursor = encode_cursor(logs[-1].timestamp, logs[-1].id)
     
     return AuditLogsResponse(
         logs=logs,
-        total=len(logs),  # Simplified, in production would do a COUNT query
+        total=await async_storage.read(count_audit_logs, **filters),
         page=page,
-        limit=limit
+        limit=limit,
+        next_cursor=next_cursor
     )
 
 
 @router.get("/stats", response_model=AuditStats)
-async def get_stats(current_user: User = Depends(get_admin_user)):
+async def get_stats(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    current_user: User = Depends(get_admin_user)
+):
     """
-    Get audit statistics. Admin only.
+    Get audit statistics, optionally between two dates (inclusive). Admin only.
     """
-    return get_audit_stats()
+    return await async_storage.read(get_audit_stats, start_date, end_date)
+
+
+@router.get("/latency", response_model=List[RouteLatency])
+async def get_latency(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    order_by: str = Query("p99_ms", pattern=f"^({'|'.join(LATENCY_ORDERS)})$"),
+    limit: int = Query(20, ge=1, le=200),
+    current_user: User = Depends(get_admin_user)
+):
+    """
+    Get p50/p90/p99 response times and error rate per route, optionally
+    between two dates (inclusive), slowest first by default. Admin only.
+    """
+    return await async_storage.read(get_route_latency, start_date, end_date, order_by, limit)
 
 
 @router.get("/export")
 async def export_logs(
-    format: str = Query("json", regex="^(json|csv)$"),
+    http_request: Request,
+    format: str = Query("json", pattern="^(json|ndjson|csv)$"),
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     current_user: User = Depends(get_admin_user)
 ):
     """
-    Export audit logs in JSON or CSV format. Admin only.
+    Export audit logs in JSON, NDJSON or CSV format. Admin only.
+    The file is streamed as it is read, without a row limit, and
+    gzip-compressed if the client accepts it.
     """
-    content = export_audit_logs(format=format, start_date=start_date, end_date=end_date)
+    try:
+        chunks = iter_audit_export(format=format, start_date=start_date, end_date=end_date)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    headers = {"Content-Disposition": f"attachment; filename=audit_logs.{format}"}
+    if accepts_gzip(http_request.headers.get("accept-encoding")):
+        chunks = gzip_chunks(chunks)
+        headers["Content-Encoding"] = "gzip"
     
-    if format == "json":
-        return Response(
-            content=content,
-            media_type="application/json",
-            headers={"Content-Disposition": "attachment; filename=audit_logs.json"}
-        )
-    else:
-        return Response(
-            content=content,
-            media_type="text/csv",
-            headers={"Content-Disposition": "attachment; filename=audit_logs.csv"}
-        )
-
+    return StreamingResponse(chunks, media_type=EXPORT_FORMATS[format], headers=headers)
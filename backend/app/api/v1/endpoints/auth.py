@@ -5,20 +5,26 @@ from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+from typing import Literal, Optional
 
 from ....core.auth import (
     Token,
     User,
     UserCreate,
-    authenticate_user,
     create_access_token,
     create_user,
+    find_user,
     get_user,
     get_user_by_email,
     get_current_active_user,
     get_admin_user,
+    set_user_disabled,
+    set_user_role,
+    verify_password,
 )
 from ....core.config import settings
+from ....infrastructure.database.async_storage import async_storage
 
 router = APIRouter()
 
@@ -42,7 +48,11 @@ async def login(form_data: LoginRequest):
     Login endpoint - authenticate user and return JWT token.
     Accepts username or email for login.
     """
-    user = authenticate_user(form_data.username, form_data.password)
+    # Only the lookup runs on the storage reader lane: bcrypt runs in the
+    # threadpool, so a burst of logins cannot hold up the database reads
+    user = await async_storage.read(find_user, form_data.username)
+    if user and not await run_in_threadpool(verify_password, form_data.password, user.hashed_password):
+        user = None
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -71,14 +81,14 @@ async def register(user_data: UserCreate):
     Register a new user account.
     """
     # Check if username exists
-    if get_user(user_data.username):
+    if await async_storage.read(get_user, user_data.username):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Ce nom d'utilisateur est déjà pris"
         )
     
     # Check if email exists
-    if get_user_by_email(user_data.email):
+    if await async_storage.read(get_user_by_email, user_data.email):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Cette adresse email est déjà utilisée"
@@ -91,7 +101,7 @@ async def register(user_data: UserCreate):
             detail="Le mot de passe doit contenir au moins 6 caractères"
         )
     
-    user = create_user(user_data)
+    user = await async_storage.write(create_user, user_data)
     return UserResponse(
         id=user.id,
         username=user.username,
@@ -132,3 +142,45 @@ async def verify_token(current_user: User = Depends(get_current_active_user)):
         )
     }
 
+
+class UserUpdate(BaseModel):
+    role: Optional[Literal["user", "admin"]] = None
+    disabled: Optional[bool] = None
+
+
+@router.patch("/users/{username}", response_model=UserResponse)
+async def update_user(
+    username: str,
+    update: UserUpdate,
+    current_user: User = Depends(get_admin_user)
+):
+    """
+    Change a user's role, or disable / re-enable the account. Admin only.
+    The change applies from the user's next request (the user cache entry
+    is dropped).
+    """
+    if username == current_user.username and (update.disabled or update.role not in (None, "admin")):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Vous ne pouvez pas désactiver ou rétrograder votre propre compte"
+        )
+    
+    found = True
+    if update.role is not None:
+        found = await async_storage.write(set_user_role, username, update.role)
+    if found and update.disabled is not None:
+        found = await async_storage.write(set_user_disabled, username, update.disabled)
+    user = await async_storage.read(get_user, username) if found else None
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Utilisateur introuvable"
+        )
+    
+    return UserResponse(
+        id=user.id,
+        username=user.username,
+        email=user.email,
+        full_name=user.full_name,
+        role=user.role
+    )
@@ -1,22 +1,123 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.responses import StreamingResponse
-from app.domain.models.chat_models import ChatRequest
+from typing import List, Optional
+from datetime import datetime
+import asyncio
+from app.core.auth import User, get_optional_user
+from app.core.config import settings
+from app.core.metrics import record_prompt_tokens_saved
+from app.core.prompts import PromptManager
+from app.domain.models.chat_models import ChatRequest, Message
 from app.domain.services.chat_service import ChatService
+from app.domain.services.compaction_service import conversation_compactor, estimate_tokens
+from app.infrastructure.database.async_storage import async_storage
+from app.infrastructure.database.conversations_db import append_messages, get_chat_history, unreadable_images
+from app.infrastructure.llm.ollama_client import LLMStreamError
 
 router = APIRouter()
 
+# Replies still being generated after their client went away
+_background_replies = set()
+
 def get_chat_service():
     return ChatService()
 
+
+async def check_images(messages: List[Message], user: Optional[User]):
+    """Refuse image digests the user may not read, before they reach the model."""
+    images = [image for m in messages for image in m.images or []]
+    if images and await async_storage.read(unreadable_images, images, user.id if user else None):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Image non trouvée"
+        )
+
 import json
 
 @router.post("/chat")
-async def chat(request: ChatRequest, service: ChatService = Depends(get_chat_service)):
-    
+async def chat(
+    request: ChatRequest,
+    service: ChatService = Depends(get_chat_service),
+    current_user: Optional[User] = Depends(get_optional_user)
+):
+    """
+    Stream the assistant reply as server-sent events.
+    With conversation_id, only the new message is sent: the history comes
+    from the stored conversation (its running summary, then the recent
+    messages), and the user message and the reply are appended to it once
+    the reply is complete.
+    """
+    conversation_id = request.conversation_id
+    # Stored histories only hold images their owner could read
+    await check_images([request.message] if conversation_id else request.messages, current_user)
+    if conversation_id:
+        if current_user is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Authentification requise pour une conversation enregistrée",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        # One message more than the window, so the first message is trimmed
+        # exactly as it would be with the full history
+        history = await async_storage.read(
+            get_chat_history, conversation_id, current_user.id, settings.MAX_HISTORY_MESSAGES - 1
+        )
+        if history is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Conversation non trouvée"
+            )
+        messages = [Message(role=m.role, content=m.content, images=m.images) for m in history.messages]
+        if history.summary:
+            # Pinned first, so the history window never drops it
+            messages.insert(0, Message(role="system", content=PromptManager.get_summary_context(history.summary)))
+            record_prompt_tokens_saved(history.summarized_tokens - estimate_tokens(messages[0].content))
+        request = request.model_copy(update={"messages": messages + [request.message]})
+
+    async def generate_reply(events: asyncio.Queue):
+        """
+        Generate the reply into events, then save the turn; None marks the
+        end. Runs as its own task, so a reply is still completed and saved if
+        the client disconnects. A failed reply leaves the conversation
+        untouched.
+        """
+        reply = []
+        try:
+            try:
+                with conversation_compactor.chat_in_progress():
+                    async for chunk in service.generate_response(request):
+                        reply.append(chunk)
+                        events.put_nowait({"content": chunk})
+            except LLMStreamError as e:
+                events.put_nowait({"content": str(e), "error": True})
+                return
+
+            if conversation_id:
+                now = datetime.utcnow().isoformat()
+                turn = [
+                    {**request.message.model_dump(exclude_none=True), "timestamp": now},
+                    {"role": "assistant", "content": "".join(reply), "timestamp": now}
+                ]
+                saved = await async_storage.write(append_messages, conversation_id, current_user.id, turn)
+                if saved:
+                    message_count, version = saved
+                    events.put_nowait({"conversation": {"id": conversation_id, "message_count": message_count, "version": version}})
+                conversation_compactor.schedule(conversation_id)
+        except Exception as e:
+            events.put_nowait(e)
+        finally:
+            events.put_nowait(None)
+
     async def event_generator():
-        async for chunk in service.generate_response(request):
+        events = asyncio.Queue()
+        task = asyncio.create_task(generate_reply(events))
+        _background_replies.add(task)
+        task.add_done_callback(_background_replies.discard)
+        while (event := await events.get()) is not None:
+            if isinstance(event, Exception):
+                raise event
             # JSON encode the chunk to handle newlines and special chars safely
-            data = json.dumps({"content": chunk})
+            data = json.dumps(event)
             yield f"data: {data}\n\n"
         yield "data: [DONE]\n\n"
 
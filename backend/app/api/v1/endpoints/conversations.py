@@ -2,21 +2,28 @@
 Conversations API endpoints for Pstral.
 Manages user chat history.
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Header, Response
 from typing import List, Optional
 from pydantic import BaseModel
 
 from ....core.auth import User, get_current_active_user
+from ....core.pagination import encode_cursor, decode_cursor
+from ....infrastructure.database.async_storage import async_storage
 from ....infrastructure.database.conversations_db import (
     Conversation,
     ConversationSummary,
+    ConversationVersionConflict,
     Message,
     create_conversation,
     get_conversation,
+    get_conversation_version,
     get_user_conversations,
+    count_user_conversations,
     update_conversation,
+    append_messages,
     delete_conversation,
-    search_conversations
+    search_conversations,
+    unreadable_images
 )
 
 router = APIRouter()
@@ -33,6 +40,17 @@ class UpdateConversationRequest(BaseModel):
     title: Optional[str] = None
 
 
+class AppendMessagesRequest(BaseModel):
+    messages: List[dict]
+    title: Optional[str] = None
+
+
+class AppendMessagesResponse(BaseModel):
+    id: str
+    message_count: int
+    version: int
+
+
 class ConversationResponse(BaseModel):
     id: str
     title: str
@@ -40,23 +58,105 @@ class ConversationResponse(BaseModel):
     messages: List[dict]
     created_at: str
     updated_at: str
+    version: int = 1
 
 
 class ConversationsListResponse(BaseModel):
     conversations: List[ConversationSummary]
     total: int
+    next_cursor: Optional[str] = None
+
+
+def _etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def _etag_versions(header: str) -> List[str]:
+    """Versions listed in an If-Match / If-None-Match header ("*" matches any)."""
+    tags = [tag.strip() for tag in header.split(",")]
+    return [tag[2:] if tag.startswith("W/") else tag for tag in tags if tag]
+
+
+def _expected_versions(if_match: Optional[str]) -> Optional[List[int]]:
+    """Versions accepted by an If-Match header (any of its tags), None when any version is accepted."""
+    if not if_match:
+        return None
+    tags = _etag_versions(if_match)
+    if "*" in tags:
+        return None
+    versions = []
+    for tag in tags:
+        try:
+            versions.append(int(tag.strip('"')))
+        except ValueError:
+            # Not one of our ETags: it matches no version
+            continue
+    if not versions:
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail="En-tête If-Match invalide"
+        )
+    return versions
+
+
+async def _check_images(messages: List[dict], user: User):
+    """Refuse image digests the user may not read (uploaded by someone else, or unknown)."""
+    images = [image for m in messages for image in m.get("images") or []]
+    if images and await async_storage.read(unreadable_images, images, user.id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Image non trouvée"
+        )
+
+
+def _version_conflict(e: ConversationVersionConflict) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_412_PRECONDITION_FAILED,
+        detail="La conversation a été modifiée entre-temps, rechargez-la",
+        headers={"ETag": _etag(e.current_version)}
+    )
+
+
+def _to_response(conversation: Conversation) -> ConversationResponse:
+    return ConversationResponse(
+        id=conversation.id,
+        title=conversation.title,
+        mode=conversation.mode,
+        messages=[m.dict() for m in conversation.messages],
+        created_at=conversation.created_at,
+        updated_at=conversation.updated_at,
+        version=conversation.version
+    )
 
 
 @router.get("/", response_model=ConversationsListResponse)
 async def list_conversations(
-    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Get all conversations for the current user."""
-    conversations = get_user_conversations(current_user.id, limit)
+    """
+    Get the current user's conversations, most recently updated first.
+    Pass the returned next_cursor to get the following page. Pages hold at
+    most 100 conversations (a larger limit is lowered).
+    """
+    limit = min(limit, 100)
+    try:
+        before = decode_cursor(cursor, 2) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    conversations = await async_storage.read(get_user_conversations, current_user.id, limit + 1, before)
+    
+    next_cursor = None
+    if len(conversations) > limit:
+        conversations = conversations[:limit]
+        next_cursor = encode_cursor(conversations[-1].updated_at, conversations[-1].id)
+    
     return ConversationsListResponse(
         conversations=conversations,
-        total=len(conversations)
+        total=await async_storage.read(count_user_conversations, current_user.id),
+        next_cursor=next_cursor
     )
 
 
@@ -66,30 +166,41 @@ async def create_new_conversation(
     current_user: User = Depends(get_current_active_user)
 ):
     """Create a new conversation."""
-    conversation = create_conversation(
+    conversation = await async_storage.write(
+        create_conversation,
         user_id=current_user.id,
         conversation_id=request.id,
         mode=request.mode,
         title=request.title or "Nouvelle discussion"
     )
     
-    return ConversationResponse(
-        id=conversation.id,
-        title=conversation.title,
-        mode=conversation.mode,
-        messages=[],
-        created_at=conversation.created_at,
-        updated_at=conversation.updated_at
-    )
+    return _to_response(conversation)
 
 
 @router.get("/{conversation_id}", response_model=ConversationResponse)
 async def get_single_conversation(
     conversation_id: str,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Get a specific conversation."""
-    conversation = get_conversation(conversation_id, current_user.id)
+    """
+    Get a specific conversation.
+    With If-None-Match set to the ETag already held by the client, answers
+    304 Not Modified without loading the messages.
+    """
+    if if_none_match:
+        version = await async_storage.read(get_conversation_version, conversation_id, current_user.id)
+        if version is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Conversation non trouvée"
+            )
+        tags = _etag_versions(if_none_match)
+        if "*" in tags or _etag(version) in tags:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": _etag(version)})
+    
+    conversation = await async_storage.read(get_conversation, conversation_id, current_user.id)
     
     if not conversation:
         raise HTTPException(
@@ -97,55 +208,76 @@ async def get_single_conversation(
             detail="Conversation non trouvée"
         )
     
-    return ConversationResponse(
-        id=conversation.id,
-        title=conversation.title,
-        mode=conversation.mode,
-        messages=[m.dict() for m in conversation.messages],
-        created_at=conversation.created_at,
-        updated_at=conversation.updated_at
-    )
+    response.headers["ETag"] = _etag(conversation.version)
+    return _to_response(conversation)
 
 
 @router.put("/{conversation_id}", response_model=ConversationResponse)
 async def update_existing_conversation(
     conversation_id: str,
     request: UpdateConversationRequest,
+    response: Response,
+    if_match: Optional[str] = Header(None),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Update a conversation's messages or title."""
-    # Check if conversation exists
-    conversation = get_conversation(conversation_id, current_user.id)
-    if not conversation:
+    """
+    Update a conversation's messages or title.
+    With If-Match, the save only applies to one of its versions (412 otherwise).
+    """
+    await _check_images(request.messages, current_user)
+    try:
+        updated = await async_storage.write(
+            update_conversation,
+            conversation_id=conversation_id,
+            user_id=current_user.id,
+            messages=request.messages,
+            title=request.title,
+            expected_versions=_expected_versions(if_match)
+        )
+    except ConversationVersionConflict as e:
+        raise _version_conflict(e)
+    
+    if not updated:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Conversation non trouvée"
         )
     
-    success = update_conversation(
-        conversation_id=conversation_id,
-        user_id=current_user.id,
-        messages=request.messages,
-        title=request.title
-    )
+    response.headers["ETag"] = _etag(updated.version)
+    return _to_response(updated)
+
+
+@router.post("/{conversation_id}/messages", response_model=AppendMessagesResponse)
+async def append_conversation_messages(
+    conversation_id: str,
+    request: AppendMessagesRequest,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Append new messages to a conversation (only the new turn is sent and written)."""
+    await _check_images(request.messages, current_user)
+    try:
+        appended = await async_storage.write(
+            append_messages,
+            conversation_id=conversation_id,
+            user_id=current_user.id,
+            messages=request.messages,
+            title=request.title,
+            expected_versions=_expected_versions(if_match)
+        )
+    except ConversationVersionConflict as e:
+        raise _version_conflict(e)
     
-    if not success:
+    if appended is None:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Échec de la mise à jour"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Conversation non trouvée"
         )
     
-    # Fetch updated conversation
-    updated = get_conversation(conversation_id, current_user.id)
-    
-    return ConversationResponse(
-        id=updated.id,
-        title=updated.title,
-        mode=updated.mode,
-        messages=[m.dict() for m in updated.messages],
-        created_at=updated.created_at,
-        updated_at=updated.updated_at
-    )
+    message_count, version = appended
+    response.headers["ETag"] = _etag(version)
+    return AppendMessagesResponse(id=conversation_id, message_count=message_count, version=version)
 
 
 @router.delete("/{conversation_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -154,7 +286,7 @@ async def delete_existing_conversation(
     current_user: User = Depends(get_current_active_user)
 ):
     """Delete a conversation."""
-    success = delete_conversation(conversation_id, current_user.id)
+    success = await async_storage.write(delete_conversation, conversation_id, current_user.id)
     
     if not success:
         raise HTTPException(
@@ -172,7 +304,7 @@ async def search_user_conversations(
     current_user: User = Depends(get_current_active_user)
 ):
     """Search conversations by title or content."""
-    conversations = search_conversations(current_user.id, q, limit)
+    conversations = await async_storage.read(search_conversations, current_user.id, q, limit)
     return ConversationsListResponse(
         conversations=conversations,
         total=len(conversations)
@@ -0,0 +1,79 @@
+"""
+Image endpoints for Pstral.
+Chat images are uploaded once and then referenced by their SHA-256 digest.
+"""
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile, status
+from fastapi.responses import FileResponse
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+
+from ....core.auth import User, get_current_active_user
+from ....infrastructure.database.async_storage import async_storage
+from ....infrastructure.database.conversations_db import add_image_owner, can_read_image
+from ....infrastructure.database.image_store import image_store, sniff_media_type, ImageTooLarge
+
+router = APIRouter()
+
+
+class ImageUploadResponse(BaseModel):
+    hash: str
+    size: int
+    media_type: str
+
+
+@router.post("/", response_model=ImageUploadResponse, status_code=status.HTTP_201_CREATED)
+async def upload_image(
+    file: UploadFile = File(...),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Store an image and return the digest to put in message images."""
+    data = await file.read(image_store.max_bytes + 1)
+
+    media_type = sniff_media_type(data)
+    if media_type is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Format d'image non supporté (PNG, JPEG, GIF, WebP ou BMP)"
+        )
+
+    try:
+        digest = await run_in_threadpool(image_store.put, data)
+    except ImageTooLarge:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Image trop volumineuse (maximum {image_store.max_bytes // (1024 * 1024)} Mo)"
+        )
+    await async_storage.write(add_image_owner, digest, current_user.id)
+
+    return ImageUploadResponse(hash=digest, size=len(data), media_type=media_type)
+
+
+def _read_media_type(path: str) -> str:
+    with open(path, "rb") as f:
+        return sniff_media_type(f.read(16)) or "application/octet-stream"
+
+
+@router.get("/{image_hash}")
+async def get_image(
+    image_hash: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Serve a stored image to a user who uploaded it or has a conversation
+    referencing it (anyone else gets a 404, as for an unknown digest).
+    """
+    path = image_store.path(image_hash)
+    if path is None or not await async_storage.read(can_read_image, image_hash, current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Image non trouvée"
+        )
+
+    media_type = await run_in_threadpool(_read_media_type, path)
+
+    # Content-addressed: the bytes behind a digest never change
+    return FileResponse(
+        path,
+        media_type=media_type,
+        headers={"Cache-Control": "private, max-age=31536000, immutable", "ETag": f'"{image_hash}"'}
+    )
@@ -2,15 +2,20 @@
 SQL Execution endpoint for Pstral.
 Allows users to execute SQL queries generated by the AI.
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Literal, Optional
 import logging
 
 from ....core.auth import User, get_current_active_user
 from ....infrastructure.database.oracle_client import db_client
+from ....infrastructure.database.async_storage import async_storage
 from ....infrastructure.database.audit_db import log_action
+from ....infrastructure.database import result_format
 from ....core.security import filter_sql_prompt
+from ....core.sql_binds import prepare_query
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +25,8 @@ router = APIRouter()
 class SQLExecuteRequest(BaseModel):
     query: str
     max_rows: int = 100
+    # "rows": list of dicts, "columns"/"arrays": column names once + values in "data"
+    format: Literal["rows", "columns", "arrays"] = "rows"
 
 
 class SQLExecuteResponse(BaseModel):
@@ -29,6 +36,8 @@ class SQLExecuteResponse(BaseModel):
     row_count: int
     error: Optional[str] = None
     warning: Optional[str] = None
+    format: str = "rows"
+    data: Optional[List[List[Any]]] = None
 
 
 class SQLValidateRequest(BaseModel):
@@ -72,6 +81,63 @@ def validate_query(query: str) -> tuple[bool, str, str]:
     return True, "SELECT", "Requête valide"
 
 
+def use_arrow(http_request: Request) -> bool:
+    """
+    Whether the result is sent as Arrow IPC. Raises 406 when the client
+    accepts nothing else and pyarrow (requirements-arrow.txt) is not installed.
+    """
+    accept = http_request.headers.get("accept")
+    if not result_format.accepts_arrow(accept):
+        return False
+    if result_format.HAS_ARROW:
+        return True
+    if result_format.accepts_json(accept):
+        return False
+    raise HTTPException(
+        status_code=status.HTTP_406_NOT_ACCEPTABLE,
+        detail="Format Arrow indisponible sur ce serveur (pyarrow non installé)."
+    )
+
+
+def build_result_response(
+    http_request: Request,
+    columns: List[str],
+    rows: list,
+    fmt: str,
+    warning: Optional[str] = None,
+    json_ready: Optional[List[bool]] = None
+):
+    """
+    Encode a result set according to the requested format.
+    Arrow IPC is served when asked for via Accept, compact JSON formats are
+    serialized directly, and both are gzip-compressed if the client accepts it.
+    json_ready tells which columns need no conversion (all if None).
+    """
+    accept_encoding = http_request.headers.get("accept-encoding")
+
+    if use_arrow(http_request):
+        body = result_format.encode_arrow(columns, rows, json_ready)
+        media_type = result_format.ARROW_MEDIA_TYPE
+    elif fmt != result_format.FORMAT_ROWS:
+        body = result_format.encode_json(columns, rows, fmt, warning=warning, json_ready=json_ready)
+        media_type = "application/json"
+    else:
+        records = result_format.to_records(columns, rows, json_ready)
+        return SQLExecuteResponse(
+            success=True,
+            columns=columns,
+            rows=records,
+            row_count=len(records),
+            warning=warning
+        )
+
+    body, content_encoding = result_format.maybe_gzip(body, accept_encoding)
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if content_encoding:
+        headers["Content-Encoding"] = content_encoding
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
 @router.post("/validate", response_model=SQLValidateResponse)
 async def validate_sql(
     request: SQLValidateRequest,
@@ -91,17 +157,24 @@ async def validate_sql(
 @router.post("/execute", response_model=SQLExecuteResponse)
 async def execute_sql(
     request: SQLExecuteRequest,
+    http_request: Request,
     current_user: User = Depends(get_current_active_user)
 ):
     """
     Execute a SQL query and return results.
     Only SELECT queries are allowed for security.
+    Set "format" to "columns" or "arrays" for a compact encoding, or send
+    Accept: application/vnd.apache.arrow.stream for Arrow IPC.
     """
+    # Refuse an Arrow-only request the server cannot serve before running it
+    use_arrow(http_request)
+    
     # Validate the query
     is_valid, query_type, message = validate_query(request.query)
     
     if not is_valid:
-        log_action(
+        await async_storage.write(
+            log_action,
             user_id=current_user.id,
             username=current_user.username,
             action="SQL_EXECUTE_BLOCKED",
@@ -117,7 +190,8 @@ async def execute_sql(
     # Check if database is connected
     if not db_client.pool:
         # Return mock data for demo/testing
-        log_action(
+        await async_storage.write(
+            log_action,
             user_id=current_user.id,
             username=current_user.username,
             action="SQL_EXECUTE_MOCK",
@@ -125,64 +199,55 @@ async def execute_sql(
             details={"query": request.query[:500]},
             status="success"
         )
-        return SQLExecuteResponse(
-            success=True,
+        return build_result_response(
+            http_request,
             columns=["info"],
-            rows=[{"info": "Base de données Oracle non connectée. Mode démo activé."}],
-            row_count=1,
+            rows=[("Base de données Oracle non connectée. Mode démo activé.",)],
+            fmt=request.format,
             warning="Base de données non disponible - résultats de démonstration"
         )
     
+    prepared = prepare_query(request.query)
+    
     try:
-        # Execute the query
-        async with db_client.pool.acquire() as connection:
-            async with connection.cursor() as cursor:
-                await cursor.execute(request.query)
-                
-                # Get column names
-                columns = [desc[0] for desc in cursor.description] if cursor.description else []
-                
-                # Fetch rows with limit
-                rows_raw = await cursor.fetchmany(request.max_rows)
-                
-                # Convert to list of dicts
-                rows = []
-                for row in rows_raw:
-                    row_dict = {}
-                    for i, col in enumerate(columns):
-                        value = row[i]
-                        # Convert non-serializable types to strings
-                        if value is not None and not isinstance(value, (str, int, float, bool)):
-                            value = str(value)
-                        row_dict[col] = value
-                    rows.append(row_dict)
-                
-                # Log successful execution
-                log_action(
-                    user_id=current_user.id,
-                    username=current_user.username,
-                    action="SQL_EXECUTE_SUCCESS",
-                    resource="/api/v1/sql/execute",
-                    details={"query": request.query[:500], "rows_returned": len(rows)},
-                    status="success"
-                )
-                
-                return SQLExecuteResponse(
-                    success=True,
-                    columns=columns,
-                    rows=rows,
-                    row_count=len(rows)
-                )
-                
+        # Execute the query (blocking driver call, values converted by the driver)
+        columns, rows, json_ready = await run_in_threadpool(
+            db_client.fetch, prepared.sql, request.max_rows, prepared.binds
+        )
+        
+        # Log successful execution
+        await async_storage.write(
+            log_action,
+            user_id=current_user.id,
+            username=current_user.username,
+            action="SQL_EXECUTE_SUCCESS",
+            resource="/api/v1/sql/execute",
+            details={
+                "query": request.query[:500],
+                "rows_returned": len(rows),
+                "statement_shape": prepared.shape[:500],
+                "shape_id": prepared.shape_id
+            },
+            status="success"
+        )
+        
+        return build_result_response(http_request, columns, rows, request.format, json_ready=json_ready)
+        
     except Exception as e:
         logger.error(f"SQL execution error: {e}")
         
-        log_action(
+        await async_storage.write(
+            log_action,
             user_id=current_user.id,
             username=current_user.username,
             action="SQL_EXECUTE_ERROR",
             resource="/api/v1/sql/execute",
-            details={"query": request.query[:500], "error": str(e)[:500]},
+            details={
+                "query": request.query[:500],
+                "error": str(e)[:500],
+                "statement_shape": prepared.shape[:500],
+                "shape_id": prepared.shape_id
+            },
             status="error"
         )
         
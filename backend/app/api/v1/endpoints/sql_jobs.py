@@ -0,0 +1,190 @@
+"""
+SQL jobs endpoints for Pstral.
+Runs long SQL queries in the background instead of holding the HTTP request open.
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import FileResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Optional
+import os
+
+from ....core.auth import User, get_current_active_user
+from ....core.config import settings
+from ....domain.services.sql_job_service import sql_job_service
+from ....infrastructure.database import sql_jobs_db
+from ....infrastructure.database.async_storage import async_storage
+from ....infrastructure.database.audit_db import log_action
+from ....infrastructure.database.result_format import accepts_gzip
+from .sql_execute import validate_query
+
+router = APIRouter()
+
+
+class SQLJobRequest(BaseModel):
+    query: str
+    max_rows: int = Field(10000, ge=1)
+
+
+class SQLJobResponse(BaseModel):
+    id: str
+    status: str
+    query: str
+    max_rows: int
+    columns: Optional[List[str]] = None
+    row_count: int
+    error: Optional[str] = None
+    created_at: str
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+
+
+class SQLJobsListResponse(BaseModel):
+    jobs: List[SQLJobResponse]
+    total: int
+
+
+def _to_response(job: sql_jobs_db.SQLJob) -> SQLJobResponse:
+    return SQLJobResponse(
+        id=job.id,
+        status=job.status,
+        query=job.query,
+        max_rows=job.max_rows,
+        columns=job.columns,
+        row_count=job.row_count,
+        error=job.error,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at
+    )
+
+
+async def _get_user_job(job_id: str, user: User) -> sql_jobs_db.SQLJob:
+    job = await async_storage.read(sql_jobs_db.get_job, job_id, user.id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Tâche SQL non trouvée"
+        )
+    return job
+
+
+@router.post("/", response_model=SQLJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def submit_sql_job(
+    request: SQLJobRequest,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Submit a SELECT query for background execution.
+    Poll GET /sql/jobs/{id} and download the result once it has succeeded.
+    """
+    is_valid, query_type, message = validate_query(request.query)
+    if not is_valid:
+        await async_storage.write(
+            log_action,
+            user_id=current_user.id,
+            username=current_user.username,
+            action="SQL_JOB_BLOCKED",
+            resource="/api/v1/sql/jobs",
+            details={"query": request.query[:500], "reason": message},
+            status="error"
+        )
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=message
+        )
+
+    max_rows = min(request.max_rows, settings.SQL_JOBS_MAX_ROWS)
+    job = await async_storage.write(sql_job_service.submit, current_user.id, current_user.username, request.query, max_rows)
+
+    await async_storage.write(
+        log_action,
+        user_id=current_user.id,
+        username=current_user.username,
+        action="SQL_JOB_SUBMITTED",
+        resource="/api/v1/sql/jobs",
+        details={"job_id": job.id, "query": request.query[:500]},
+        status="success"
+    )
+
+    return _to_response(job)
+
+
+@router.get("/", response_model=SQLJobsListResponse)
+async def list_sql_jobs(
+    limit: int = Query(50, ge=1, le=100),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Get the current user's recent SQL jobs."""
+    jobs = await async_storage.read(sql_jobs_db.get_user_jobs, current_user.id, limit)
+    return SQLJobsListResponse(
+        jobs=[_to_response(job) for job in jobs],
+        total=len(jobs)
+    )
+
+
+@router.get("/{job_id}", response_model=SQLJobResponse)
+async def get_sql_job(
+    job_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Get the status of a SQL job."""
+    return _to_response(await _get_user_job(job_id, current_user))
+
+
+@router.post("/{job_id}/cancel", response_model=SQLJobResponse)
+async def cancel_sql_job(
+    job_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Cancel a pending or running SQL job."""
+    job = await _get_user_job(job_id, current_user)
+
+    if job.status in sql_jobs_db.FINISHED_STATUSES or not await async_storage.write(sql_job_service.cancel, job_id):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="La tâche est déjà terminée"
+        )
+
+    return _to_response(await async_storage.read(sql_jobs_db.get_job, job_id, current_user.id))
+
+
+@router.get("/{job_id}/result")
+async def download_sql_job_result(
+    job_id: str,
+    http_request: Request,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Download the result of a succeeded job as NDJSON: a {"columns": [...]}
+    header line followed by one JSON array per row. The stored gzip file is
+    sent as-is when the client accepts gzip.
+    """
+    job = await _get_user_job(job_id, current_user)
+
+    if job.status != sql_jobs_db.JOB_SUCCEEDED:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Résultat indisponible (statut: {job.status})"
+        )
+    if not job.result_path or not os.path.exists(job.result_path):
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Le résultat a expiré"
+        )
+
+    filename = f"sql_job_{job.id}.ndjson"
+    if accepts_gzip(http_request.headers.get("accept-encoding")):
+        return FileResponse(
+            job.result_path,
+            media_type="application/x-ndjson",
+            headers={
+                "Content-Encoding": "gzip",
+                "Content-Disposition": f"attachment; filename={filename}"
+            }
+        )
+
+    return StreamingResponse(
+        sql_job_service.iter_result_lines(job),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
@@ -0,0 +1,149 @@
+"""
+Audit middleware: one audit event and the request metrics per HTTP request.
+
+A plain ASGI middleware rather than @app.middleware("http")
+(BaseHTTPMiddleware), which runs the endpoint in a separate task and
+relays every chunk of a streamed body (the /chat SSE stream, exports)
+through a memory stream. Here the status comes from the
+http.response.start message and the duration ends with the last body
+message, so a stream is timed to its last byte, and messages are passed
+to the server unchanged.
+
+A response that fails after its start message keeps the status it sent; it
+is counted as interrupted and its audit event carries {"interrupted": true}.
+Only a request that sent no response at all is recorded as a 500.
+
+Metrics are labelled by route template (the matched route, known once the
+request is routed) and go through method_label/endpoint_label, so client
+input cannot create new series.
+"""
+import logging
+import time
+from typing import Optional
+
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .auth import resolve_principal
+from .metrics import (
+    endpoint_label,
+    method_label,
+    record_request,
+    record_request_finished,
+    record_request_interrupted,
+    record_request_started,
+    record_session,
+    record_stream_finished,
+    record_stream_started,
+)
+from ..infrastructure.database.audit_writer import audit_writer
+
+logger = logging.getLogger(__name__)
+
+# Not audited (health checks and static files)
+SKIPPED_PREFIXES = ("/health", "/static")
+
+
+class AuditMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        request = Request(scope)
+        method = method_label(scope["method"])
+        record_request_started(method)
+
+        # Get user info from token if available
+        user_id = None
+        username = "anonymous"
+        auth_header = request.headers.get("authorization")
+        if auth_header and auth_header.startswith("Bearer "):
+            token = auth_header.split(" ")[1]
+            # Kept on request.state: the auth dependencies reuse it
+            token_data = resolve_principal(request, token)
+            if token_data:
+                username = token_data.username
+                record_session(username)
+
+        status_code: Optional[int] = None
+        end_time: Optional[float] = None
+        response_size = 0
+        chunks = 0
+        endpoint: Optional[str] = None  # Set once a streamed body starts
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code, end_time, response_size, chunks, endpoint
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                response_size += len(message.get("body", b""))
+                chunks += 1
+                if not message.get("more_body", False):
+                    end_time = time.perf_counter()
+                elif endpoint is None:
+                    endpoint = self._endpoint(scope)
+                    record_stream_started(endpoint, time.perf_counter() - start_time)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Unhandled exception before any response: the server answers 500
+            interrupted = status_code is not None and end_time is None
+            if status_code is None:
+                status_code = 500
+            duration = (end_time or time.perf_counter()) - start_time
+            record_request_finished(method)
+            if endpoint is not None:
+                record_stream_finished(endpoint, duration, chunks)
+            endpoint = endpoint or self._endpoint(scope)
+            record_request(method, endpoint, status_code, duration, response_size)
+            if interrupted:
+                record_request_interrupted(method, endpoint)
+            self._log(scope, request, user_id, username, status_code, duration, interrupted)
+
+    @staticmethod
+    def _endpoint(scope: Scope) -> str:
+        route = scope.get("route")
+        return endpoint_label(route.path if route else None)
+
+    @staticmethod
+    def _log(
+        scope: Scope,
+        request: Request,
+        user_id: Optional[int],
+        username: str,
+        status_code: int,
+        duration: float,
+        interrupted: bool
+    ):
+        path = scope.get("root_path", "") + scope["path"]
+        if path.startswith(SKIPPED_PREFIXES):
+            return
+        method = scope["method"]
+        client = scope.get("client")
+        # Route template of the matched endpoint, for latency statistics
+        route = scope.get("route")
+
+        # Queue the event for the batched audit writer: the response (a chat
+        # stream included) does not wait for it to be written
+        try:
+            audit_writer.log(
+                user_id=user_id,
+                username=username,
+                action=f"{method} {path}",
+                resource=path,
+                details={"interrupted": True} if interrupted else None,
+                ip_address=client[0] if client else None,
+                user_agent=request.headers.get("user-agent"),
+                status="success" if status_code < 400 else "error",
+                response_time_ms=int(duration * 1000),
+                route=f"{method} {route.path}" if route else None
+            )
+        except Exception as e:
+            logger.error(f"Failed to log audit: {e}")
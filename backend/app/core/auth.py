@@ -2,28 +2,39 @@
 Authentication module for Pstral.
 Handles JWT token creation, validation, and user management.
 """
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from pydantic import BaseModel
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
-import sqlite3
+import hashlib
 import os
+import threading
+import time
 
 from .config import settings
+from .metrics import record_user_cache, record_users_total
+from ..infrastructure.database.async_storage import async_storage
+from ..infrastructure.database.sqlite_storage import SQLiteStorage, get_storage
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login", auto_error=False)
 
 # Database path
 DB_PATH = os.path.join(os.path.dirname(__file__), "..", "infrastructure", "database", "users.db")
 
 
+def _db() -> SQLiteStorage:
+    return get_storage(DB_PATH)
+
+
 # Models
 class Token(BaseModel):
     access_token: str
@@ -58,33 +69,31 @@ class UserInDB(User):
 def init_users_db():
     """Initialize the users database."""
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            full_name TEXT NOT NULL,
-            hashed_password TEXT NOT NULL,
-            role TEXT DEFAULT 'user',
-            disabled INTEGER DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    conn.commit()
-    
-    # Create default admin user if not exists
-    cursor.execute("SELECT * FROM users WHERE username = 'admin'")
-    if not cursor.fetchone():
-        hashed = get_password_hash("admin123")  # Default password - should be changed!
-        cursor.execute(
-            "INSERT INTO users (username, email, full_name, hashed_password, role) VALUES (?, ?, ?, ?, ?)",
-            ("admin", "admin@pack-solutions.com", "Administrateur", hashed, "admin")
-        )
-        conn.commit()
-    
-    conn.close()
+    with _db().transaction() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                email TEXT UNIQUE NOT NULL,
+                full_name TEXT NOT NULL,
+                hashed_password TEXT NOT NULL,
+                role TEXT DEFAULT 'user',
+                disabled INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        # Create default admin user if not exists
+        cursor.execute("SELECT * FROM users WHERE username = 'admin'")
+        if not cursor.fetchone():
+            hashed = get_password_hash("admin123")  # Default password - should be changed!
+            cursor.execute(
+                "INSERT INTO users (username, email, full_name, hashed_password, role) VALUES (?, ?, ?, ?, ?)",
+                ("admin", "admin@pack-solutions.com", "Administrateur", hashed, "admin")
+            )
+        cursor.execute("SELECT COUNT(*) FROM users")
+        record_users_total(cursor.fetchone()[0])
 
 
 # Password utilities
@@ -108,24 +117,69 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 
-def decode_token(token: str) -> Optional[TokenData]:
+# Verified tokens, by SHA-256 of the token: (exp as a timestamp, TokenData),
+# least recently used first. Only valid tokens with an exp are kept, until
+# that exp; invalid ones are verified (and rejected) every time.
+_verified_tokens: "OrderedDict[bytes, Tuple[float, TokenData]]" = OrderedDict()
+_verified_tokens_lock = threading.Lock()
+
+
+def _verify_token(token: str) -> Tuple[Optional[float], Optional[TokenData]]:
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            return None
-        return TokenData(username=username)
     except JWTError:
-        return None
+        return None, None
+    username: str = payload.get("sub")
+    if username is None:
+        return None, None
+    exp = payload.get("exp")
+    return (float(exp) if isinstance(exp, (int, float)) else None), TokenData(username=username)
+
+
+def decode_token(token: str) -> Optional[TokenData]:
+    """TokenData of a valid token, None otherwise; the signature of a token is verified once, then cached until its exp."""
+    key = hashlib.sha256(token.encode("utf-8")).digest()
+    with _verified_tokens_lock:
+        cached = _verified_tokens.get(key)
+        if cached is not None:
+            if cached[0] > time.time():
+                _verified_tokens.move_to_end(key)
+                return cached[1]
+            del _verified_tokens[key]
+
+    exp, token_data = _verify_token(token)
+    if token_data is not None and exp is not None and settings.AUTH_TOKEN_CACHE_SIZE > 0:
+        with _verified_tokens_lock:
+            _verified_tokens[key] = (exp, token_data)
+            while len(_verified_tokens) > settings.AUTH_TOKEN_CACHE_SIZE:
+                _verified_tokens.popitem(last=False)
+    return token_data
+
+
+def clear_token_cache():
+    with _verified_tokens_lock:
+        _verified_tokens.clear()
+
+
+def resolve_principal(request: Request, token: str) -> Optional[TokenData]:
+    """TokenData of the request's bearer token, decoded once per request.
+
+    The audit middleware resolves it first; the auth dependencies then read
+    it back from request.state (shared through the ASGI scope).
+    """
+    principal = getattr(request.state, "principal", None)
+    if principal is not None and principal[0] == token:
+        return principal[1]
+    token_data = decode_token(token)
+    request.state.principal = (token, token_data)
+    return token_data
 
 
 # User database operations
 def get_user(username: str) -> Optional[UserInDB]:
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    cursor = _db().connection().cursor()
     cursor.execute("SELECT * FROM users WHERE username = ?", (username,))
     row = cursor.fetchone()
-    conn.close()
     
     if row:
         return UserInDB(
@@ -141,11 +195,9 @@ def get_user(username: str) -> Optional[UserInDB]:
 
 
 def get_user_by_email(email: str) -> Optional[UserInDB]:
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    cursor = _db().connection().cursor()
     cursor.execute("SELECT * FROM users WHERE email = ?", (email,))
     row = cursor.fetchone()
-    conn.close()
     
     if row:
         return UserInDB(
@@ -160,18 +212,63 @@ def get_user_by_email(email: str) -> Optional[UserInDB]:
     return None
 
 
+# Authenticated users, by username: (monotonic expiry, User), least recently
+# used first. Every change to a user goes through invalidate_user, and the
+# TTL bounds how long another process' change can go unnoticed.
+_user_cache: "OrderedDict[str, Tuple[float, User]]" = OrderedDict()
+_user_cache_lock = threading.Lock()
+# Bumped on every invalidation: a lookup started before it is not cached
+_user_cache_generation = 0
+
+
+def _cached_user(username: str) -> Optional[User]:
+    with _user_cache_lock:
+        cached = _user_cache.get(username)
+        if cached is not None:
+            if cached[0] > time.monotonic():
+                _user_cache.move_to_end(username)
+                record_user_cache(True)
+                return cached[1]
+            del _user_cache[username]
+    record_user_cache(False)
+    return None
+
+
+def _cache_user(user: User, generation: int):
+    if settings.USER_CACHE_SIZE <= 0 or settings.USER_CACHE_TTL_SECONDS <= 0:
+        return
+    with _user_cache_lock:
+        if generation != _user_cache_generation:
+            return
+        _user_cache[user.username] = (time.monotonic() + settings.USER_CACHE_TTL_SECONDS, user)
+        _user_cache.move_to_end(user.username)
+        while len(_user_cache) > settings.USER_CACHE_SIZE:
+            _user_cache.popitem(last=False)
+
+
+def invalidate_user(username: Optional[str] = None):
+    """Drop a user (every user if None) from the cache."""
+    global _user_cache_generation
+    with _user_cache_lock:
+        _user_cache_generation += 1
+        if username is None:
+            _user_cache.clear()
+        else:
+            _user_cache.pop(username, None)
+
+
 def create_user(user: UserCreate) -> User:
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
     hashed_password = get_password_hash(user.password)
-    cursor.execute(
-        "INSERT INTO users (username, email, full_name, hashed_password) VALUES (?, ?, ?, ?)",
-        (user.username, user.email, user.full_name, hashed_password)
-    )
-    conn.commit()
-    user_id = cursor.lastrowid
-    conn.close()
+    with _db().transaction() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO users (username, email, full_name, hashed_password) VALUES (?, ?, ?, ?)",
+            (user.username, user.email, user.full_name, hashed_password)
+        )
+        user_id = cursor.lastrowid
+        cursor.execute("SELECT COUNT(*) FROM users")
+        record_users_total(cursor.fetchone()[0])
+    invalidate_user(user.username)
     
     return User(
         id=user_id,
@@ -182,11 +279,27 @@ def create_user(user: UserCreate) -> User:
     )
 
 
+def set_user_role(username: str, role: str) -> bool:
+    with _db().transaction() as conn:
+        updated = conn.execute("UPDATE users SET role = ? WHERE username = ?", (role, username)).rowcount
+    invalidate_user(username)
+    return updated > 0
+
+
+def set_user_disabled(username: str, disabled: bool) -> bool:
+    with _db().transaction() as conn:
+        updated = conn.execute("UPDATE users SET disabled = ? WHERE username = ?", (int(disabled), username)).rowcount
+    invalidate_user(username)
+    return updated > 0
+
+
+def find_user(username: str) -> Optional[UserInDB]:
+    """User by username, or else by email (login accepts both)."""
+    return get_user(username) or get_user_by_email(username)
+
+
 def authenticate_user(username: str, password: str) -> Optional[UserInDB]:
-    user = get_user(username)
-    if not user:
-        # Try by email
-        user = get_user_by_email(username)
+    user = find_user(username)
     if not user:
         return None
     if not verify_password(password, user.hashed_password):
@@ -195,29 +308,36 @@ def authenticate_user(username: str, password: str) -> Optional[UserInDB]:
 
 
 # Dependency for protected routes
-async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
+async def get_current_user(request: Request, token: str = Depends(oauth2_scheme)) -> User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Identifiants invalides",
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    token_data = decode_token(token)
+    token_data = resolve_principal(request, token)
     if token_data is None:
         raise credentials_exception
     
-    user = get_user(token_data.username)
-    if user is None:
+    user = _cached_user(token_data.username)
+    if user is not None:
+        return user
+    
+    generation = _user_cache_generation
+    user_in_db = await async_storage.read(get_user, token_data.username)
+    if user_in_db is None:
         raise credentials_exception
     
-    return User(
-        id=user.id,
-        username=user.username,
-        email=user.email,
-        full_name=user.full_name,
-        role=user.role,
-        disabled=user.disabled
+    user = User(
+        id=user_in_db.id,
+        username=user_in_db.username,
+        email=user_in_db.email,
+        full_name=user_in_db.full_name,
+        role=user_in_db.role,
+        disabled=user_in_db.disabled
     )
+    _cache_user(user, generation)
+    return user
 
 
 async def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
@@ -226,6 +346,13 @@ async def get_current_active_user(current_user: User = Depends(get_current_user)
     return current_user
 
 
+async def get_optional_user(request: Request, token: Optional[str] = Depends(optional_oauth2_scheme)) -> Optional[User]:
+    """The authenticated user, or None for anonymous requests (a sent token must be valid)."""
+    if token is None:
+        return None
+    return await get_current_active_user(await get_current_user(request, token))
+
+
 async def get_admin_user(current_user: User = Depends(get_current_active_user)) -> User:
     if current_user.role != "admin":
         raise HTTPException(
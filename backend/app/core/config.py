@@ -16,16 +16,69 @@ class Settings(BaseSettings):
     # Context Management (to avoid token overflow)
     MAX_HISTORY_MESSAGES: int = 10  # Maximum messages to send to LLM
     MAX_FILE_CONTENT_LENGTH: int = 3000  # Max characters for uploaded files
+    CONTEXT_SUMMARY_TRIGGER_TOKENS: int = 3000  # Summarize once unsummarized messages exceed this (estimated)
+    CONTEXT_SUMMARY_KEEP_MESSAGES: int = 6  # Most recent messages never folded into the summary
+    CONTEXT_SUMMARY_MAX_TOKENS: int = 400  # Length cap of a generated summary
+    CONTEXT_SUMMARY_TIMEOUT_SECONDS: int = 120
     
     # ORACLE
     ORACLE_DSN: str = "localhost/XEPDB1"
     ORACLE_USER: str = "system"
     ORACLE_PASSWORD: str = "oracle"
+    ORACLE_POOL_MIN: int = 1
+    ORACLE_POOL_MAX: int = 5  # Initial max size, grown adaptively up to the ceiling
+    ORACLE_POOL_INCREMENT: int = 1
+    ORACLE_POOL_CEILING: int = 20  # Hard limit for adaptive growth
+    ORACLE_POOL_GROW_WAIT_MS: int = 100  # Grow when acquiring a connection waits longer
+    ORACLE_POOL_IDLE_SHRINK_SECONDS: int = 300  # Shrink back after this long without pressure
+    ORACLE_POOL_IDLE_TIMEOUT: int = 600  # Idle sessions above min are closed after this
+    ORACLE_STMT_CACHE_SIZE: int = 50  # Statements cached per pooled session
+    ORACLE_FETCH_ARRAYSIZE: int = 1000  # Max rows fetched per round-trip
+    SQL_BIND_STRING_LITERALS: bool = False  # Also lift string literals (bound as VARCHAR2: no blank-padded comparison with CHAR columns)
+    
+    # Background SQL jobs (long-running queries)
+    SQL_JOBS_MAX_WORKERS: int = 2  # Concurrent jobs, separate from interactive queries
+    SQL_JOBS_MAX_ROWS: int = 1_000_000
+    SQL_JOBS_RESULTS_DIR: str = "sql_jobs_results"  # Compressed result files
+    SQL_JOBS_RETENTION_HOURS: int = 24
+    
+    # SQLite storage (users, conversations, audit, feedback, jobs)
+    SQLITE_CACHE_SIZE_KIB: int = 16384  # Page cache per connection
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024  # Memory-mapped I/O for reads
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_READER_THREADS: int = 4  # Threads serving reads for async endpoints
+    SQLITE_QUEUE_SIZE: int = 1000  # Pending operations per lane before callers wait
+
+    # Chat images (content-addressed store)
+    IMAGE_STORE_DIR: str = "image_store"
+    IMAGE_MAX_BYTES: int = 10 * 1024 * 1024  # Larger uploads are rejected
+
+    # Audit
+    AUDIT_COUNT_CACHE_SECONDS: int = 60  # Listing totals are recounted at most this often
+    AUDIT_COUNT_CACHE_SIZE: int = 1000  # Distinct filter combinations whose total is kept
+    AUDIT_QUEUE_SIZE: int = 10000  # Request events buffered in memory before spooling to disk
+    AUDIT_BATCH_SIZE: int = 500  # Max events inserted per transaction
+    AUDIT_FLUSH_INTERVAL_SECONDS: float = 0.5  # Max time an event waits for its batch
+    AUDIT_SPOOL_PATH: str = "audit_spool.ndjson"  # Events that could not be queued or written
+    AUDIT_PARTITION_MONTHS: int = 1  # Months of logs per partition file
+    AUDIT_RETENTION_MONTHS: int = 0  # Partitions older than this are removed (0, the default, keeps everything)
+    AUDIT_ARCHIVE_EXPIRED: bool = True  # Gzip expired partitions into the archive directory instead of deleting them
+    AUDIT_MAINTENANCE_INTERVAL_HOURS: int = 24  # Retention, then VACUUM/ANALYZE of cold partitions
+    
+    # Request metrics (buckets in seconds, except the response sizes in bytes)
+    METRICS_LATENCY_BUCKETS: List[float] = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+    METRICS_STREAM_BUCKETS: List[float] = [0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0]  # Streamed responses, to the last byte
+    METRICS_SIZE_BUCKETS: List[float] = [256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216]
+    METRICS_MAX_ENDPOINTS: int = 200  # Route templates labelled individually, the others count as "other"
+    ACTIVE_SESSION_MINUTES: int = 15  # A user counts as active this long after their last request
     
     # JWT Authentication
     SECRET_KEY: str = secrets.token_urlsafe(32)
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24  # 24 hours
+    AUTH_TOKEN_CACHE_SIZE: int = 10_000  # Verified tokens kept until their expiry (0 disables the cache)
+    USER_CACHE_SIZE: int = 10_000  # Authenticated users kept in memory (0 disables the cache)
+    USER_CACHE_TTL_SECONDS: int = 60  # Upper bound on how long a change made elsewhere goes unnoticed
 
     class Config:
         case_sensitive = True
@@ -0,0 +1,69 @@
+"""
+DDSketch for approximate quantiles (request latencies).
+
+Positive values are counted in logarithmic buckets: bucket k holds the
+values in (gamma^(k-1), gamma^k], with gamma = (1 + a) / (1 - a), so every
+quantile is returned with a relative error of at most a (RELATIVE_ACCURACY,
+1%). Sketches are merged by adding their bucket counts, so the quantiles of
+any set of stored periods come from their sketches, without the values;
+the size depends on the spread of the values (a few hundred buckets from
+1 ms to a minute), not on their number.
+"""
+import math
+import struct
+from collections import Counter
+from typing import Optional
+
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(GAMMA)
+
+# Serialized as the zero count, then one (bucket, count) pair per bucket
+_HEADER = struct.Struct("<I")
+_BUCKET = struct.Struct("<iI")
+
+
+class DDSketch:
+    def __init__(self, data: Optional[bytes] = None):
+        self.zero_count = 0  # Values <= 0 (e.g. sub-millisecond response times)
+        self.buckets: Counter = Counter()
+        if data:
+            self.zero_count = _HEADER.unpack_from(data)[0]
+            for key, count in _BUCKET.iter_unpack(data[_HEADER.size:]):
+                self.buckets[key] = count
+
+    @property
+    def count(self) -> int:
+        return self.zero_count + sum(self.buckets.values())
+
+    def add(self, value: float, count: int = 1):
+        if value <= 0:
+            self.zero_count += count
+        else:
+            self.buckets[math.ceil(math.log(value) / _LOG_GAMMA)] += count
+
+    def merge(self, *others: "DDSketch"):
+        for other in others:
+            self.zero_count += other.zero_count
+            self.buckets.update(other.buckets)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Value at quantile q (0 to 1), None if the sketch is empty."""
+        total = self.count
+        if not total:
+            return None
+        rank = q * (total - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if rank < seen:
+                # Middle of the bucket, in relative terms
+                return 2 * GAMMA ** key / (GAMMA + 1)
+        return 2 * GAMMA ** max(self.buckets) / (GAMMA + 1)
+
+    def to_bytes(self) -> bytes:
+        return _HEADER.pack(self.zero_count) + b"".join(
+            _BUCKET.pack(key, count) for key, count in sorted(self.buckets.items())
+        )
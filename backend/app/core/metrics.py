@@ -5,8 +5,12 @@ Provides observability into application performance.
 from prometheus_client import Counter, Histogram, Gauge, Info
 from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 from fastapi import Response
+from typing import Dict, Optional, Set
+import threading
 import time
 
+from .config import settings
+
 # Application info
 APP_INFO = Info('pstral', 'Pstral application information')
 APP_INFO.info({
@@ -15,7 +19,7 @@ APP_INFO.info({
     'company': 'Pack Solutions'
 })
 
-# Request metrics
+# Request metrics (endpoint: route template, never the raw path)
 REQUEST_COUNT = Counter(
     'pstral_requests_total',
     'Total number of HTTP requests',
@@ -24,9 +28,55 @@ REQUEST_COUNT = Counter(
 
 REQUEST_LATENCY = Histogram(
     'pstral_request_latency_seconds',
-    'Request latency in seconds',
+    'Request latency in seconds (to the last byte of the response)',
+    ['method', 'endpoint'],
+    buckets=settings.METRICS_LATENCY_BUCKETS
+)
+
+RESPONSE_SIZE = Histogram(
+    'pstral_response_size_bytes',
+    'Response body size in bytes',
     ['method', 'endpoint'],
-    buckets=[0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+    buckets=settings.METRICS_SIZE_BUCKETS
+)
+
+REQUESTS_IN_PROGRESS = Gauge(
+    'pstral_requests_in_progress',
+    'HTTP requests being processed',
+    ['method']
+)
+
+# Streamed responses (chat SSE, exports, downloads)
+STREAMS_IN_PROGRESS = Gauge(
+    'pstral_streams_in_progress',
+    'Streamed responses still sending their body',
+    ['endpoint']
+)
+
+STREAM_FIRST_BYTE = Histogram(
+    'pstral_stream_first_byte_seconds',
+    'Time from the request to the first body chunk of a streamed response',
+    ['endpoint'],
+    buckets=settings.METRICS_LATENCY_BUCKETS
+)
+
+STREAM_DURATION = Histogram(
+    'pstral_stream_duration_seconds',
+    'Duration of a streamed response, to its last byte',
+    ['endpoint'],
+    buckets=settings.METRICS_STREAM_BUCKETS
+)
+
+STREAM_CHUNKS = Counter(
+    'pstral_stream_chunks_total',
+    'Body chunks sent by streamed responses',
+    ['endpoint']
+)
+
+REQUESTS_INTERRUPTED = Counter(
+    'pstral_requests_interrupted_total',
+    'Responses started but not completed (exception or disconnect during the body)',
+    ['method', 'endpoint']
 )
 
 # Chat metrics
@@ -49,10 +99,34 @@ CHAT_TOKENS = Counter(
     ['mode']
 )
 
+# Conversation context summaries
+CONTEXT_SUMMARIES = Counter(
+    'pstral_context_summaries_total',
+    'Running conversation summaries generated',
+    ['status']
+)
+
+CONTEXT_SUMMARY_LATENCY = Histogram(
+    'pstral_context_summary_latency_seconds',
+    'Time spent generating a conversation summary',
+    buckets=[1.0, 5.0, 10.0, 30.0, 60.0, 120.0]
+)
+
+CONTEXT_SUMMARY_TOKENS = Counter(
+    'pstral_context_summary_tokens_total',
+    'Model tokens spent generating conversation summaries',
+    ['kind']
+)
+
+PROMPT_TOKENS_SAVED = Counter(
+    'pstral_prompt_tokens_saved_total',
+    'Estimated prompt tokens replaced by conversation summaries'
+)
+
 # Active sessions
 ACTIVE_SESSIONS = Gauge(
     'pstral_active_sessions',
-    'Number of active user sessions'
+    'Users with an authenticated request in the last ACTIVE_SESSION_MINUTES'
 )
 
 # SQL execution metrics
@@ -62,12 +136,28 @@ SQL_EXECUTIONS = Counter(
     ['status']
 )
 
+SQL_DISTINCT_TEXTS = Gauge(
+    'pstral_sql_distinct_texts',
+    'Distinct SQL texts executed since startup (each one a hard parse without binds)'
+)
+
+SQL_DISTINCT_SHAPES = Gauge(
+    'pstral_sql_distinct_shapes',
+    'Distinct SQL statement shapes after literal parameterization'
+)
+
 # User metrics
 USERS_TOTAL = Gauge(
     'pstral_users_total',
     'Total number of registered users'
 )
 
+USER_CACHE_LOOKUPS = Counter(
+    'pstral_user_cache_lookups_total',
+    'Authenticated user lookups in the in-memory cache',
+    ['result']
+)
+
 LOGIN_ATTEMPTS = Counter(
     'pstral_login_attempts_total',
     'Total login attempts',
@@ -81,6 +171,59 @@ DB_CONNECTIONS = Gauge(
     ['database']
 )
 
+DB_POOL_BUSY = Gauge(
+    'pstral_db_pool_busy',
+    'Database pool connections currently in use',
+    ['database']
+)
+
+DB_POOL_WAITING = Gauge(
+    'pstral_db_pool_waiting',
+    'Requests waiting to acquire a database pool connection',
+    ['database']
+)
+
+DB_POOL_MAX = Gauge(
+    'pstral_db_pool_max',
+    'Current maximum size of the database pool',
+    ['database']
+)
+
+DB_POOL_ACQUIRE_WAIT = Histogram(
+    'pstral_db_pool_acquire_wait_seconds',
+    'Time spent waiting to acquire a database pool connection',
+    ['database'],
+    buckets=[0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0]
+)
+
+AUDIT_QUEUE_DEPTH = Gauge(
+    'pstral_audit_queue_depth',
+    'Audit events waiting to be written'
+)
+
+AUDIT_BATCH_SIZE = Histogram(
+    'pstral_audit_batch_size',
+    'Audit events written per transaction',
+    buckets=[1, 5, 10, 25, 50, 100, 250, 500, 1000]
+)
+
+AUDIT_EVENTS_SPOOLED = Counter(
+    'pstral_audit_events_spooled_total',
+    'Audit events diverted to the spool file',
+    ['reason']
+)
+
+AUDIT_EVENTS_DROPPED = Counter(
+    'pstral_audit_events_dropped_total',
+    'Audit events lost (could not be written nor spooled)'
+)
+
+SQLITE_QUEUE_DEPTH = Gauge(
+    'pstral_sqlite_queue_depth',
+    'SQLite operations queued for the storage threads',
+    ['lane']
+)
+
 
 def get_metrics() -> Response:
     """Generate Prometheus metrics response."""
@@ -90,10 +233,95 @@ def get_metrics() -> Response:
     )
 
 
-def record_request(method: str, endpoint: str, status: int, duration: float):
+_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+# Endpoint labels in use: at most METRICS_MAX_ENDPOINTS series per metric
+_endpoints: Set[str] = set()
+_endpoints_lock = threading.Lock()
+
+
+def method_label(method: str) -> str:
+    """HTTP method as a label (any other method sent by a client is "OTHER")."""
+    return method if method in _METHODS else "OTHER"
+
+
+def endpoint_label(route: Optional[str]) -> str:
+    """Route template as a label: "unmatched" without a route, "other" beyond METRICS_MAX_ENDPOINTS."""
+    if route is None:
+        return "unmatched"
+    if route in _endpoints:
+        return route
+    with _endpoints_lock:
+        if len(_endpoints) >= settings.METRICS_MAX_ENDPOINTS:
+            return "other"
+        _endpoints.add(route)
+    return route
+
+
+def record_request(method: str, endpoint: str, status: int, duration: float, response_size: int = 0):
     """Record a request for metrics."""
     REQUEST_COUNT.labels(method=method, endpoint=endpoint, status=str(status)).inc()
     REQUEST_LATENCY.labels(method=method, endpoint=endpoint).observe(duration)
+    RESPONSE_SIZE.labels(method=method, endpoint=endpoint).observe(response_size)
+
+
+def record_request_started(method: str):
+    """Count a request as in progress, until record_request_finished."""
+    REQUESTS_IN_PROGRESS.labels(method=method).inc()
+
+
+def record_request_finished(method: str):
+    REQUESTS_IN_PROGRESS.labels(method=method).dec()
+
+
+def record_request_interrupted(method: str, endpoint: str):
+    """Record a response cut after its status was sent (counted in record_request with that status)."""
+    REQUESTS_INTERRUPTED.labels(method=method, endpoint=endpoint).inc()
+
+
+def record_stream_started(endpoint: str, first_byte: float):
+    """Record the first chunk of a streamed response (seconds since the request)."""
+    STREAMS_IN_PROGRESS.labels(endpoint=endpoint).inc()
+    STREAM_FIRST_BYTE.labels(endpoint=endpoint).observe(first_byte)
+
+
+def record_stream_finished(endpoint: str, duration: float, chunks: int):
+    """Record the end of a streamed response (seconds since the request)."""
+    STREAMS_IN_PROGRESS.labels(endpoint=endpoint).dec()
+    STREAM_DURATION.labels(endpoint=endpoint).observe(duration)
+    STREAM_CHUNKS.labels(endpoint=endpoint).inc(chunks)
+
+
+# Last request time of each authenticated user, for the active sessions gauge
+_sessions: Dict[str, float] = {}
+_sessions_lock = threading.Lock()
+
+
+def record_session(username: str):
+    """Mark a user as active (authenticated request)."""
+    _sessions[username] = time.monotonic()
+
+
+def _active_sessions() -> int:
+    cutoff = time.monotonic() - settings.ACTIVE_SESSION_MINUTES * 60
+    with _sessions_lock:
+        for username in [u for u, seen in list(_sessions.items()) if seen < cutoff]:
+            if _sessions.get(username, cutoff) < cutoff:
+                del _sessions[username]
+        return len(_sessions)
+
+
+# Computed when the metrics are scraped
+ACTIVE_SESSIONS.set_function(_active_sessions)
+
+
+def record_users_total(count: int):
+    """Publish the number of registered users."""
+    USERS_TOTAL.set(count)
+
+
+def record_user_cache(hit: bool):
+    """Record a user cache lookup for metrics."""
+    USER_CACHE_LOOKUPS.labels(result="hit" if hit else "miss").inc()
 
 
 def record_chat(mode: str, duration: float, tokens: int = 0):
@@ -104,14 +332,83 @@ def record_chat(mode: str, duration: float, tokens: int = 0):
         CHAT_TOKENS.labels(mode=mode).inc(tokens)
 
 
+def record_context_summary(success: bool, duration: float, prompt_tokens: int = 0, completion_tokens: int = 0):
+    """Record the generation of a conversation summary and its model cost."""
+    CONTEXT_SUMMARIES.labels(status="success" if success else "error").inc()
+    CONTEXT_SUMMARY_LATENCY.observe(duration)
+    if prompt_tokens > 0:
+        CONTEXT_SUMMARY_TOKENS.labels(kind="prompt").inc(prompt_tokens)
+    if completion_tokens > 0:
+        CONTEXT_SUMMARY_TOKENS.labels(kind="completion").inc(completion_tokens)
+
+
+def record_prompt_tokens_saved(tokens: int):
+    """Record prompt tokens a chat request did not send thanks to a summary."""
+    if tokens > 0:
+        PROMPT_TOKENS_SAVED.inc(tokens)
+
+
 def record_sql_execution(success: bool):
     """Record a SQL execution for metrics."""
     status = "success" if success else "error"
     SQL_EXECUTIONS.labels(status=status).inc()
 
 
+# Bounded sets of hashes backing the distinct texts/shapes gauges
+_SQL_TRACKING_LIMIT = 100_000
+_sql_texts: set = set()
+_sql_shapes: set = set()
+
+
+def record_sql_shape(text: str, shape: str):
+    """Track distinct SQL texts vs. shapes (hard parses saved by binding)."""
+    if len(_sql_texts) < _SQL_TRACKING_LIMIT:
+        _sql_texts.add(hash(text))
+        SQL_DISTINCT_TEXTS.set(len(_sql_texts))
+    if len(_sql_shapes) < _SQL_TRACKING_LIMIT:
+        _sql_shapes.add(hash(shape))
+        SQL_DISTINCT_SHAPES.set(len(_sql_shapes))
+
+
+def record_pool_stats(database: str, opened: int, busy: int, waiting: int, max_size: int):
+    """Publish the current state of a connection pool."""
+    DB_CONNECTIONS.labels(database=database).set(opened)
+    DB_POOL_BUSY.labels(database=database).set(busy)
+    DB_POOL_WAITING.labels(database=database).set(waiting)
+    DB_POOL_MAX.labels(database=database).set(max_size)
+
+
+def record_pool_acquire(database: str, wait_seconds: float):
+    """Record how long a pool connection acquisition waited."""
+    DB_POOL_ACQUIRE_WAIT.labels(database=database).observe(wait_seconds)
+
+
+def record_audit_queue(depth: int):
+    """Publish how many audit events wait to be written."""
+    AUDIT_QUEUE_DEPTH.set(depth)
+
+
+def record_audit_batch(size: int):
+    """Record the size of a written audit batch."""
+    AUDIT_BATCH_SIZE.observe(size)
+
+
+def record_audit_spooled(reason: str, count: int = 1):
+    """Record audit events diverted to the spool file (queue_full, write_error, shutdown)."""
+    AUDIT_EVENTS_SPOOLED.labels(reason=reason).inc(count)
+
+
+def record_audit_dropped(count: int = 1):
+    """Record audit events that were lost."""
+    AUDIT_EVENTS_DROPPED.inc(count)
+
+
 def record_login(success: bool):
     """Record a login attempt for metrics."""
     status = "success" if success else "failure"
     LOGIN_ATTEMPTS.labels(status=status).inc()
 
+
+def record_sqlite_queue(lane: str, depth: int):
+    """Publish how many SQLite operations wait for a storage thread."""
+    SQLITE_QUEUE_DEPTH.labels(lane=lane).set(depth)
@@ -0,0 +1,28 @@
+"""
+Opaque cursors for keyset pagination.
+
+A cursor carries the sort key of the last row of a page (e.g. updated_at and
+id); the next page is read with a "(key, id) < (?, ?)" range on an index, so
+every page costs the same whatever its depth, unlike LIMIT/OFFSET.
+"""
+import base64
+import json
+from typing import Any, Tuple
+
+
+def encode_cursor(*values: Any) -> str:
+    """Encode the sort key of the last row of a page."""
+    raw = json.dumps(list(values), separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> Tuple[Any, ...]:
+    """Decode a cursor made of `size` values. Raises ValueError if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Curseur de pagination invalide") from e
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Curseur de pagination invalide")
+    return tuple(values)
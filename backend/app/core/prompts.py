@@ -170,3 +170,26 @@ class PromptManager:
 - Nom: Ministral
 - Traits: Utile, Intelligent, Concis, Amical
 """
+
+    @staticmethod
+    def get_summary_prompt() -> str:
+        """
+        Returns the system prompt used to fold old messages into the running
+        summary of a conversation.
+        """
+        return """Tu résumes une conversation entre un utilisateur et un assistant IA.
+
+# RÈGLES :
+- Intègre le résumé précédent (s'il existe) et les nouveaux messages en UN seul résumé.
+- Conserve les faits, décisions, noms (tables, colonnes, personnes), contraintes et questions restées ouvertes.
+- Conserve tel quel le code et les requêtes SQL encore utiles.
+- Supprime les politesses, répétitions et détails sans suite.
+- Écris en français, à la troisième personne, sans introduction ni conclusion.
+"""
+
+    @staticmethod
+    def get_summary_context(summary: str) -> str:
+        """
+        Returns the message standing for the summarized part of a conversation.
+        """
+        return f"Résumé de la conversation jusqu'ici :\n{summary}"
@@ -0,0 +1,180 @@
+"""
+Literal parameterization for generated SQL.
+
+The LLM writes queries with inline literals (WHERE client_id = 1234), so
+every variant is a distinct statement for Oracle (hard parse) and for any
+cache. This module lifts literals from predicates into bind variables and
+returns the normalized statement shape.
+
+Literals are only lifted in WHERE / HAVING / ON / START WITH / CONNECT BY
+clauses. They are kept in place when they must stay literal or change the
+result metadata: select list, ORDER BY / GROUP BY positions, FETCH FIRST /
+OFFSET row counts, typed literals (DATE '...', INTERVAL '...') and format
+masks of conversion functions (TO_CHAR(d, 'YYYY-MM')).
+
+String literals are kept unless SQL_BIND_STRING_LITERALS is set: a literal
+compares with blank-padded semantics against a CHAR column, a VARCHAR2 bind
+does not (WHERE code = 'AB' matches 'AB  ', WHERE code = :b1 does not), and
+the column types of generated queries are not known here.
+"""
+import hashlib
+import logging
+import re
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+from .config import settings
+from .metrics import record_sql_shape
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"""
+      (?P<ws>\s+)
+    | (?P<comment>--[^\n]*|/\*.*?\*/)
+    | (?P<string>[nN]?'(?:[^']|'')*')
+    | (?P<qident>"[^"]*")
+    | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?[fFdD]?)
+    | (?P<bind>:\w+)
+    | (?P<word>[A-Za-z_][\w$#]*)
+    | (?P<op>\|\||<=|>=|<>|!=|=>|.)
+""", re.VERBOSE | re.DOTALL)
+
+# Clauses in which literals are values compared against data
+_LIFT_CLAUSES = {"WHERE", "HAVING", "ON", "START", "CONNECT"}
+
+_CLAUSE_KEYWORDS = {
+    "SELECT", "FROM", "WHERE", "GROUP", "HAVING", "ORDER", "ON", "FETCH",
+    "OFFSET", "CONNECT", "START", "JOIN", "UNION", "INTERSECT", "MINUS",
+    "USING", "PARTITION", "MODEL", "PIVOT", "UNPIVOT",
+}
+
+# Literals right after these keywords are typed literals (DATE '2024-01-01')
+_TYPED_LITERAL_KEYWORDS = {"DATE", "TIMESTAMP", "INTERVAL"}
+
+# Functions whose arguments after the first are format masks / NLS params
+_FORMAT_FUNCTIONS = {"TO_CHAR", "TO_DATE", "TO_TIMESTAMP", "TO_TIMESTAMP_TZ", "TO_NUMBER", "TRUNC", "ROUND", "TO_DSINTERVAL", "TO_YMINTERVAL"}
+
+
+@dataclass
+class ParameterizedQuery:
+    sql: str
+    binds: Dict[str, Any] = field(default_factory=dict)
+    shape: str = ""
+
+    @property
+    def shape_id(self) -> str:
+        """Short stable identifier of the statement shape."""
+        return hashlib.sha1(self.shape.encode("utf-8")).hexdigest()[:16]
+
+
+def _literal_value(kind: str, text: str) -> Any:
+    if kind == "string":
+        if text[0] in "nN":
+            text = text[1:]
+        return text[1:-1].replace("''", "'")
+    text = text.rstrip("fFdD")
+    if re.fullmatch(r"\d+", text):
+        return int(text)
+    return Decimal(text)
+
+
+def normalize_shape(sql: str) -> str:
+    """Collapse whitespace and drop comments so equivalent texts share a shape."""
+    parts = []
+    for match in _TOKEN_RE.finditer(sql):
+        kind = match.lastgroup
+        if kind in ("ws", "comment"):
+            continue
+        text = match.group()
+        parts.append(text.upper() if kind == "word" else text)
+    return " ".join(parts)
+
+
+def parameterize_sql(sql: str, lift_strings: Optional[bool] = None) -> ParameterizedQuery:
+    """
+    Rewrite inline literals of predicates into bind variables (:b1, :b2, ...).
+    String literals are lifted only with lift_strings (default:
+    SQL_BIND_STRING_LITERALS). Queries that already use bind variables are
+    returned unchanged.
+    """
+    if lift_strings is None:
+        lift_strings = settings.SQL_BIND_STRING_LITERALS
+    tokens = [(m.lastgroup, m.group()) for m in _TOKEN_RE.finditer(sql)]
+    if any(kind == "bind" for kind, _ in tokens):
+        return ParameterizedQuery(sql=sql, shape=normalize_shape(sql))
+
+    # One frame per parenthesis level: current clause + enclosing function call
+    stack: List[dict] = [{"clause": None, "function": None, "arg": 0}]
+    binds: Dict[str, Any] = {}
+    out: List[str] = []
+    shape: List[str] = []
+    previous_word: Optional[str] = None
+    previous_significant: Optional[str] = None
+
+    for kind, text in tokens:
+        frame = stack[-1]
+
+        if kind in ("ws", "comment"):
+            out.append(text)
+            continue
+
+        if kind == "word":
+            upper = text.upper()
+            if upper in _CLAUSE_KEYWORDS:
+                frame["clause"] = upper
+            out.append(text)
+            shape.append(upper)
+            previous_word = upper
+            previous_significant = upper
+            continue
+
+        if kind == "op":
+            if text == "(":
+                function = previous_word if previous_significant == previous_word else None
+                stack.append({"clause": frame["clause"], "function": function, "arg": 0})
+            elif text == ")" and len(stack) > 1:
+                stack.pop()
+            elif text == ",":
+                frame["arg"] += 1
+            out.append(text)
+            shape.append(text)
+            previous_significant = text
+            continue
+
+        if kind in ("string", "number"):
+            is_format_arg = frame["function"] in _FORMAT_FUNCTIONS and frame["arg"] > 0
+            keep = (
+                (kind == "string" and not lift_strings)
+                or frame["clause"] not in _LIFT_CLAUSES
+                or previous_significant in _TYPED_LITERAL_KEYWORDS
+                or is_format_arg
+            )
+            if not keep:
+                name = f"b{len(binds) + 1}"
+                binds[name] = _literal_value(kind, text)
+                out.append(f":{name}")
+                shape.append(f":{name}")
+                previous_significant = ":bind"
+                continue
+
+        out.append(text)
+        shape.append(text)
+        previous_significant = text
+
+    return ParameterizedQuery(sql="".join(out), binds=binds, shape=" ".join(shape))
+
+
+def prepare_query(query: str) -> ParameterizedQuery:
+    """
+    Lift inline literals into bind variables before execution so that
+    variants of the same query share one parsed statement in Oracle.
+    A query the rewrite fails on runs as written.
+    """
+    try:
+        parameterized = parameterize_sql(query)
+    except Exception as e:
+        logger.warning(f"SQL parameterization skipped: {e}")
+        parameterized = ParameterizedQuery(sql=query, shape=query)
+    record_sql_shape(query, parameterized.shape)
+    return parameterized
@@ -1,16 +1,31 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from typing import List, Optional, Literal
 
 class Message(BaseModel):
     role: Literal["user", "assistant", "system"]
     content: str
+    # SHA-256 digests returned by POST /images (inline base64 is still accepted)
     images: Optional[List[str]] = None
 
 class ChatRequest(BaseModel):
-    messages: List[Message]
+    # Either the full history in messages, or the id of a stored conversation
+    # plus only the new user message: the history is then loaded and the
+    # turn saved server-side
+    messages: List[Message] = []
+    conversation_id: Optional[str] = None
+    message: Optional[Message] = None
     stream: bool = True
     mode: Literal["sql", "email", "wiki", "chat"] = "chat"
 
+    @model_validator(mode="after")
+    def check_history(self):
+        if self.conversation_id:
+            if self.message is None:
+                raise ValueError("message est requis avec conversation_id")
+        elif not self.messages:
+            raise ValueError("messages ou conversation_id est requis")
+        return self
+
 class ChatResponse(BaseModel):
     content: str
     done: bool
@@ -0,0 +1,162 @@
+"""
+Background compaction of long conversations.
+
+Without it, a conversation longer than the history window loses its middle
+messages. Once the messages not yet covered by a conversation's running
+summary exceed CONTEXT_SUMMARY_TRIGGER_TOKENS, the older ones (all but the
+CONTEXT_SUMMARY_KEEP_MESSAGES most recent) are folded into the summary by
+the model. /chat then sends the summary followed by the recent messages.
+
+Compaction runs off the request path: conversations are queued after a chat
+turn is saved and summarized one at a time, only while no chat reply is
+being generated, so interactive requests always get the model first.
+"""
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Set
+
+from app.core.config import settings
+from app.core.metrics import record_context_summary
+from app.core.prompts import PromptManager
+from app.infrastructure.database import conversations_db
+from app.infrastructure.database.async_storage import async_storage
+from app.infrastructure.database.conversations_db import Message
+from app.infrastructure.llm.ollama_client import OllamaClient
+
+logger = logging.getLogger("compaction")
+
+# Rough size of a token for French/English text (no tokenizer for the model here)
+CHARS_PER_TOKEN = 4
+# Conversations waiting for compaction; more are dropped until the queue drains
+QUEUE_SIZE = 1000
+# How often a queued compaction checks whether chat replies are still streaming
+IDLE_POLL_SECONDS = 1.0
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    return len(text or "") // CHARS_PER_TOKEN + 1
+
+
+def _transcript(messages: List[Message]) -> str:
+    roles = {"user": "Utilisateur", "assistant": "Assistant"}
+    return "\n\n".join(f"{roles.get(m.role, m.role)} : {m.content}" for m in messages)
+
+
+class ConversationCompactor:
+    def __init__(self, llm_client: Optional[OllamaClient] = None):
+        self.llm_client = llm_client or OllamaClient()
+        self._queue: Optional[asyncio.Queue] = None
+        self._queued: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._active_chats = 0
+
+    # --- Lifecycle ---
+
+    def start(self):
+        """Start the background worker (on the running event loop)."""
+        self._queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self._task = asyncio.create_task(self._run())
+
+    def shutdown(self):
+        """Stop the worker; queued conversations are compacted after their next turn."""
+        if self._task:
+            self._task.cancel()
+        self._task = None
+        self._queue = None
+        self._queued.clear()
+
+    # --- Public API ---
+
+    @contextmanager
+    def chat_in_progress(self) -> Iterator[None]:
+        """Mark a chat reply as being generated (compaction waits meanwhile)."""
+        self._active_chats += 1
+        try:
+            yield
+        finally:
+            self._active_chats -= 1
+
+    def schedule(self, conversation_id: str):
+        """Queue a conversation for compaction (no-op if the worker is not running)."""
+        if self._queue is None or conversation_id in self._queued:
+            return
+        try:
+            self._queue.put_nowait(conversation_id)
+            self._queued.add(conversation_id)
+        except asyncio.QueueFull:
+            logger.warning(f"Compaction queue full, conversation {conversation_id} skipped")
+
+    async def compact(self, conversation_id: str) -> bool:
+        """
+        Fold the older unsummarized messages of a conversation into its
+        running summary if they exceed the threshold. Returns True if a new
+        summary was saved.
+        """
+        source = await async_storage.read(conversations_db.get_compaction_source, conversation_id)
+        if source is None:
+            return False
+
+        pending_tokens = sum(estimate_tokens(m.content) for m in source.messages)
+        keep = settings.CONTEXT_SUMMARY_KEEP_MESSAGES
+        folded = source.messages[:len(source.messages) - keep] if keep else source.messages
+        if pending_tokens < settings.CONTEXT_SUMMARY_TRIGGER_TOKENS or not folded:
+            return False
+
+        prompt = _transcript(folded)
+        if source.summary:
+            prompt = f"Résumé précédent :\n{source.summary}\n\nNouveaux messages :\n{prompt}"
+        messages = [
+            {"role": "system", "content": PromptManager.get_summary_prompt()},
+            {"role": "user", "content": prompt}
+        ]
+
+        start_time = time.perf_counter()
+        try:
+            response = await self.llm_client.complete(
+                messages, settings.CONTEXT_SUMMARY_MAX_TOKENS, timeout=settings.CONTEXT_SUMMARY_TIMEOUT_SECONDS
+            )
+            summary = response["message"]["content"].strip()
+        except Exception:
+            record_context_summary(False, time.perf_counter() - start_time)
+            raise
+        record_context_summary(
+            True,
+            time.perf_counter() - start_time,
+            prompt_tokens=response.get("prompt_eval_count") or sum(estimate_tokens(m["content"]) for m in messages),
+            completion_tokens=response.get("eval_count") or estimate_tokens(summary)
+        )
+        if not summary:
+            return False
+
+        summarized_tokens = source.summarized_tokens + sum(estimate_tokens(m.content) for m in folded)
+        return await async_storage.write(
+            conversations_db.save_context_summary,
+            conversation_id,
+            summary,
+            source.summary_until + len(folded),
+            summarized_tokens,
+            source.summary_until,
+            folded
+        )
+
+    # --- Worker ---
+
+    async def _run(self):
+        queue = self._queue
+        while True:
+            conversation_id = await queue.get()
+            # Low priority: the model serves interactive chats first
+            while self._active_chats > 0:
+                await asyncio.sleep(IDLE_POLL_SECONDS)
+            self._queued.discard(conversation_id)
+            try:
+                if await self.compact(conversation_id):
+                    logger.info(f"Conversation {conversation_id} compacted")
+            except Exception as e:
+                logger.error(f"Compaction of conversation {conversation_id} failed: {e}")
+
+
+# Global instance
+conversation_compactor = ConversationCompactor()
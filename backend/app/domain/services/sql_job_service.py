@@ -0,0 +1,218 @@
+"""
+Background execution of long-running SQL queries.
+
+Jobs run on a dedicated thread pool (separate from the threads serving
+interactive queries), stream their rows to a gzip-compressed NDJSON file and
+keep their state in the SQL jobs database so finished results survive a
+restart. Expired results are removed by a periodic retention sweep.
+
+Result file layout: first line {"columns": [...]}, then one JSON array per row.
+"""
+import asyncio
+import gzip
+import json
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, Optional
+
+from app.core.config import settings
+from app.core.sql_binds import prepare_query
+from app.infrastructure.database.oracle_client import db_client
+from app.infrastructure.database import sql_jobs_db
+from app.infrastructure.database.sql_jobs_db import SQLJob
+
+logger = logging.getLogger("sql_jobs")
+
+# Returned in place of real rows when Oracle is not connected (same as /sql/execute)
+MOCK_COLUMNS = ["info"]
+MOCK_ROW = ["Base de données Oracle non connectée. Mode démo activé."]
+
+
+class JobCancelled(Exception):
+    """Raised inside a worker when its job has been cancelled."""
+
+
+class SQLJobService:
+    def __init__(self, max_workers: int = settings.SQL_JOBS_MAX_WORKERS, results_dir: str = settings.SQL_JOBS_RESULTS_DIR):
+        self.max_workers = max_workers
+        self.results_dir = results_dir
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        # job_id -> cancel event / active Oracle connection for running jobs
+        self._cancel_events: Dict[str, threading.Event] = {}
+        self._connections: Dict[str, Any] = {}
+
+    # --- Lifecycle ---
+
+    def start(self):
+        """Start the worker pool and resume jobs interrupted by a restart."""
+        self._ensure_executor()
+
+        for job in sql_jobs_db.get_jobs_by_status((sql_jobs_db.JOB_RUNNING,)):
+            # The query was running when the process stopped: its partial result is lost
+            sql_jobs_db.finish_job(job.id, sql_jobs_db.JOB_FAILED, error="Interrompu par un redémarrage du serveur")
+            self._remove_file(self._result_path(job.id))
+
+        for job in sql_jobs_db.get_jobs_by_status((sql_jobs_db.JOB_PENDING,)):
+            self._enqueue(job.id)
+
+    def shutdown(self):
+        """
+        Stop the workers and interrupt running queries.
+        Pending jobs stay pending and are resumed by the next start().
+        """
+        with self._lock:
+            events = list(self._cancel_events.values())
+            connections = list(self._connections.values())
+        for event in events:
+            event.set()
+        for connection in connections:
+            try:
+                connection.cancel()
+            except Exception:
+                pass
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def run_retention_loop(self, interval_seconds: int = 3600):
+        """Periodically delete expired job results."""
+        while True:
+            try:
+                await asyncio.to_thread(self.cleanup_expired)
+            except Exception as e:
+                logger.error(f"SQL jobs retention sweep failed: {e}")
+            await asyncio.sleep(interval_seconds)
+
+    def cleanup_expired(self) -> int:
+        """Delete finished jobs (and their files) older than the retention period."""
+        cutoff = (datetime.utcnow() - timedelta(hours=settings.SQL_JOBS_RETENTION_HOURS)).isoformat()
+        expired = sql_jobs_db.delete_jobs_finished_before(cutoff)
+        for job in expired:
+            self._remove_file(job.result_path)
+        if expired:
+            logger.info(f"Removed {len(expired)} expired SQL jobs")
+        return len(expired)
+
+    # --- Public API ---
+
+    def submit(self, user_id: int, username: str, query: str, max_rows: int) -> SQLJob:
+        """Persist a new job and queue it for execution."""
+        job = sql_jobs_db.create_job(str(uuid.uuid4()), user_id, username, query, max_rows)
+        self._enqueue(job.id)
+        return job
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancel a pending or running job.
+        Returns False if the job had already finished.
+        """
+        with self._lock:
+            event = self._cancel_events.get(job_id)
+            connection = self._connections.get(job_id)
+        if event:
+            event.set()
+        if connection is not None:
+            try:
+                connection.cancel()
+            except Exception as e:
+                logger.warning(f"Failed to interrupt SQL job {job_id}: {e}")
+        return sql_jobs_db.finish_job(job_id, sql_jobs_db.JOB_CANCELLED, error="Annulé par l'utilisateur")
+
+    def iter_result_lines(self, job: SQLJob) -> Iterator[bytes]:
+        """Yield the decompressed NDJSON lines of a finished job."""
+        with gzip.open(job.result_path, "rb") as f:
+            for line in f:
+                yield line
+
+    # --- Worker ---
+
+    def _result_path(self, job_id: str) -> str:
+        return os.path.join(self.results_dir, f"{job_id}.ndjson.gz")
+
+    @staticmethod
+    def _remove_file(path: Optional[str]):
+        if path and os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Could not remove SQL job result {path}: {e}")
+
+    def _ensure_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                os.makedirs(self.results_dir, exist_ok=True)
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="sql-job")
+            return self._executor
+
+    def _enqueue(self, job_id: str):
+        executor = self._ensure_executor()
+        with self._lock:
+            self._cancel_events[job_id] = threading.Event()
+        executor.submit(self._run, job_id)
+
+    def _register_connection(self, job_id: str, connection):
+        with self._lock:
+            self._connections[job_id] = connection
+
+    def _run(self, job_id: str):
+        cancelled = self._cancel_events.get(job_id) or threading.Event()
+        path = self._result_path(job_id)
+
+        try:
+            if cancelled.is_set() or not sql_jobs_db.mark_job_running(job_id):
+                return
+            job = sql_jobs_db.get_job(job_id)
+
+            columns, row_count = self._spill(job, path, cancelled)
+            if not sql_jobs_db.finish_job(job_id, sql_jobs_db.JOB_SUCCEEDED, columns, row_count, path):
+                # Cancelled while the last batch was being written
+                self._remove_file(path)
+        except JobCancelled:
+            self._remove_file(path)
+        except Exception as e:
+            self._remove_file(path)
+            if cancelled.is_set():
+                return
+            logger.error(f"SQL job {job_id} failed: {e}")
+            sql_jobs_db.finish_job(job_id, sql_jobs_db.JOB_FAILED, error=f"Erreur d'exécution: {str(e)[:500]}")
+        finally:
+            with self._lock:
+                self._cancel_events.pop(job_id, None)
+                self._connections.pop(job_id, None)
+
+    def _spill(self, job: SQLJob, path: str, cancelled: threading.Event) -> tuple:
+        """Stream the job's rows into the compressed result file."""
+        if db_client.pool:
+            prepared = prepare_query(job.query)
+            batches = db_client.stream(
+                prepared.sql,
+                job.max_rows,
+                binds=prepared.binds,
+                on_connection=lambda connection: self._register_connection(job.id, connection)
+            )
+        else:
+            batches = iter([MOCK_COLUMNS, [MOCK_ROW]])
+
+        row_count = 0
+        with gzip.open(path, "wt", encoding="utf-8", compresslevel=5) as f:
+            columns = next(batches)
+            f.write(json.dumps({"columns": columns}, ensure_ascii=False) + "\n")
+            for batch in batches:
+                if cancelled.is_set():
+                    raise JobCancelled()
+                f.writelines(
+                    json.dumps(list(row), ensure_ascii=False, default=str) + "\n"
+                    for row in batch
+                )
+                row_count += len(batch)
+
+        return columns, row_count
+
+
+# Global instance
+sql_job_service = SQLJobService()
@@ -0,0 +1,130 @@
+"""
+Async facade over the SQLite storage for Pstral.
+
+The *_db modules are synchronous: called directly from an async endpoint or
+middleware, every query blocks the event loop and stalls all other requests,
+including token streaming. Async code awaits them through this facade
+instead:
+
+- writes run on one dedicated writer thread (SQLite allows a single writer
+  per database anyway, so they are serialized without busy waits),
+- reads run on a small pool of reader threads (WAL lets them proceed while
+  a write is in progress).
+
+Each lane has a bounded queue: when it is full, callers wait for a free slot
+(without blocking the event loop) instead of piling up work without limit.
+Every thread keeps its own connections through SQLiteStorage.
+
+Usage:
+    conversations = await async_storage.read(get_user_conversations, user.id, 50)
+    await async_storage.write(create_conversation, user.id, conversation_id, "chat")
+    await async_storage.enqueue_write(log_action, user_id=user.id, action="LOGIN")
+"""
+import asyncio
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional
+
+from app.core.config import settings
+from app.core.metrics import record_sqlite_queue
+
+logger = logging.getLogger("async_storage")
+
+
+def _log_failure(future: Future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error(f"Queued SQLite write failed: {future.exception()}")
+
+
+class _Lane:
+    """Threads consuming a bounded queue of storage calls."""
+
+    def __init__(self, name: str, threads: int, max_pending: int):
+        self.name = name
+        self.threads = threads
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=max_pending)
+        self._workers: List[threading.Thread] = []
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._workers:
+                return
+            for i in range(self.threads):
+                worker = threading.Thread(target=self._run, name=f"sqlite-{self.name}-{i}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            record_sqlite_queue(self.name, self._queue.qsize())
+            if item is None:
+                return
+            future, fn, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+    async def submit(self, fn: Callable, args: tuple, kwargs: dict) -> Future:
+        if not self._workers:
+            self._start()
+        future: Future = Future()
+        item = (future, fn, args, kwargs)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            # Back-pressure: wait for a slot in a helper thread, not on the loop
+            await asyncio.to_thread(self._queue.put, item)
+        record_sqlite_queue(self.name, self._queue.qsize())
+        return future
+
+    def shutdown(self):
+        """Finish the queued calls, then stop the threads."""
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for _ in workers:
+            self._queue.put(None)
+        for worker in workers:
+            worker.join()
+
+
+class AsyncStorage:
+    def __init__(self, reader_threads: int, max_pending: int):
+        self._reader = _Lane("reader", reader_threads, max_pending)
+        self._writer = _Lane("writer", 1, max_pending)
+
+    async def read(self, fn: Callable, *args: Any, **kwargs: Any) -> Any:
+        """Run a read-only storage function on a reader thread."""
+        future = await self._reader.submit(fn, args, kwargs)
+        return await asyncio.wrap_future(future)
+
+    async def write(self, fn: Callable, *args: Any, **kwargs: Any) -> Any:
+        """
+        Run a storage function that writes on the writer thread.
+        The write still completes if the awaiting request is cancelled.
+        """
+        future = await self._writer.submit(fn, args, kwargs)
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    async def enqueue_write(self, fn: Callable, *args: Any, **kwargs: Any):
+        """
+        Queue a write without waiting for it to run (failures are logged).
+        Only waits when the writer queue is full.
+        """
+        future = await self._writer.submit(fn, args, kwargs)
+        future.add_done_callback(_log_failure)
+
+    def shutdown(self):
+        """Drain both lanes and stop their threads (they restart on next use)."""
+        self._writer.shutdown()
+        self._reader.shutdown()
+
+
+# Global instance
+async_storage = AsyncStorage(settings.SQLITE_READER_THREADS, settings.SQLITE_QUEUE_SIZE)
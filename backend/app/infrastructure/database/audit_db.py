@@ -2,21 +2,43 @@
 Audit logging system for Pstral.
 Logs all user actions for compliance and monitoring.
 """
-import sqlite3
+import asyncio
+import csv
+import io
 import os
+import gzip
 import json
-from datetime import datetime
-from typing import Optional, List
+import logging
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Iterator, List, Dict, NamedTuple, Tuple
 from pydantic import BaseModel
 
+from app.core.config import settings
+from app.core.ddsketch import DDSketch
+from app.core.hyperloglog import HyperLogLog
+from .sqlite_storage import SQLiteStorage, close_storage, get_storage
+
+logger = logging.getLogger("audit")
+
 # Database path
 DB_PATH = os.path.join(os.path.dirname(__file__), "audit.db")
 
 
+def _db() -> SQLiteStorage:
+    return get_storage(DB_PATH)
+
+
 class AuditLog(BaseModel):
     id: int
     timestamp: str
-    user_id: int
+    user_id: Optional[int] = None  # Not known for request events logged by the middleware
     username: str
     action: str
     resource: str
@@ -33,38 +55,495 @@ class AuditStats(BaseModel):
     top_actions: List[dict]
 
 
+class RouteLatency(BaseModel):
+    route: str
+    count: int
+    error_rate: float
+    p50_ms: float
+    p90_ms: float
+    p99_ms: float
+
+
+class AuditInsertError(Exception):
+    """Raised by insert_audit_rows when a partition cannot be written; rows are the events not stored."""
+    
+    def __init__(self, rows: List[tuple], error: Exception):
+        super().__init__(f"{len(rows)} audit events not stored: {error}")
+        self.rows = rows
+
+
 def init_audit_db():
-    """Initialize the audit database."""
+    """
+    Initialize the audit database: the rollups in DB_PATH, the logs in
+    monthly partition files. Logs of the former single audit_logs table are
+    moved to their partitions once, partitions written before the
+    dictionary encoding are converted, and logs missing from the rollups
+    are added to them.
+    """
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    _upgrade_partitions()
+    _migrate_legacy_logs()
+    with _db().transaction() as conn:
+        _init_rollups(conn.cursor())
+    catch_up_rollups()
+
+
+# --- Partitions ---
+#
+# Logs are stored in one SQLite file per AUDIT_PARTITION_MONTHS months, in a
+# directory next to DB_PATH. A file is named after the months it covers
+# ("2024-06_2024-07.db": June included, July excluded), so queries only open
+# the partitions overlapping their date range and retention removes a whole
+# period by removing its file instead of deleting rows.
+
+_PARTITION_FILE = re.compile(r"^(\d{4}-\d{2})_(\d{4}-\d{2})\.db$")
+
+# Logs are dictionary-encoded: repeated strings (action, resource, user
+# agent...) are stored once per partition in a dimension table, and each
+# event row only holds their integer ids, the Unix timestamp and the
+# response time. The audit_logs view joins them back into the former row
+# shape; filters apply to the audit_events columns (ts, user_id, action_id)
+# so that they use its indexes.
+
+# (audit_row index, column, dimension table)
+_DIMENSIONS = [
+    (2, "username", "audit_usernames"),
+    (3, "action", "audit_actions"),
+    (4, "resource", "audit_resources"),
+    (6, "ip_address", "audit_ip_addresses"),
+    (7, "user_agent", "audit_user_agents"),
+    (8, "status", "audit_statuses"),
+]
+
+_PARTITION_SCHEMA = [
+    *(f"CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY, value TEXT NOT NULL UNIQUE)" for _, _, table in _DIMENSIONS),
+    """
+    CREATE TABLE IF NOT EXISTS audit_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ts INTEGER NOT NULL,
+        user_id INTEGER,
+        username_id INTEGER,
+        action_id INTEGER NOT NULL,
+        resource_id INTEGER,
+        details TEXT,
+        ip_address_id INTEGER,
+        user_agent_id INTEGER,
+        status_id INTEGER,
+        response_time_ms INTEGER
+    )
+    """,
+    # Index entries end with the rowid (id), so each one serves the
+    # (ts, id) keyset order directly.
+    "CREATE INDEX IF NOT EXISTS idx_audit_events_ts ON audit_events(ts)",
+    "CREATE INDEX IF NOT EXISTS idx_audit_events_user_ts ON audit_events(user_id, ts)",
+    "CREATE INDEX IF NOT EXISTS idx_audit_events_action_ts ON audit_events(action_id, ts)",
+]
+
+_PARTITION_VIEW = """
+    CREATE VIEW IF NOT EXISTS audit_logs AS
+    SELECT
+        e.id, strftime('%Y-%m-%d %H:%M:%S', e.ts, 'unixepoch') AS timestamp, e.user_id,
+        u.value AS username, a.value AS action, r.value AS resource, e.details,
+        ip.value AS ip_address, ua.value AS user_agent, s.value AS status, e.response_time_ms,
+        e.ts, e.action_id
+    FROM audit_events e
+    LEFT JOIN audit_usernames u ON u.id = e.username_id
+    LEFT JOIN audit_actions a ON a.id = e.action_id
+    LEFT JOIN audit_resources r ON r.id = e.resource_id
+    LEFT JOIN audit_ip_addresses ip ON ip.id = e.ip_address_id
+    LEFT JOIN audit_user_agents ua ON ua.id = e.user_agent_id
+    LEFT JOIN audit_statuses s ON s.id = e.status_id
+"""
+
+# Serializes partition creation and removal (and opening against removal)
+_partition_lock = threading.Lock()
+# Partition files whose schema was created by this process
+_ready_partitions = set()
+# Queries running on each partition: retention closes a partition's
+# connections only once its readers are done
+_partition_readers: Dict[str, int] = defaultdict(int)
+_partition_idle = threading.Condition(_partition_lock)
+# Partitions being removed, no longer handed to new readers
+_retiring_partitions = set()
+# Longest wait for the readers of an expired partition (retried on the next run)
+_RETENTION_WAIT_SECONDS = 30
+
+
+class _Partition(NamedTuple):
+    start: str  # First month, "YYYY-MM"
+    end: str  # Month after the last one
+    path: str
+
+
+def _partition_dir() -> str:
+    return os.path.splitext(DB_PATH)[0] + "_partitions"
+
+
+def _month_index(month: str) -> int:
+    return int(month[:4]) * 12 + int(month[5:7]) - 1
+
+
+def _month(index: int) -> str:
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def _list_partitions() -> List[_Partition]:
+    """Existing partitions, oldest first."""
+    directory = _partition_dir()
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    partitions = []
+    for name in names:
+        match = _PARTITION_FILE.match(name)
+        if match:
+            partitions.append(_Partition(match[1], match[2], os.path.join(directory, name)))
+    return sorted(partitions)
+
+
+def _partition_for(month: str, partitions: List[_Partition]) -> _Partition:
+    """
+    Partition of a month: the existing one covering it, or else a new period
+    of AUDIT_PARTITION_MONTHS, shortened if it would overlap existing
+    partitions (after a change of AUDIT_PARTITION_MONTHS).
+    """
+    for partition in partitions:
+        if partition.start <= month < partition.end:
+            return partition
     
+    months = max(1, settings.AUDIT_PARTITION_MONTHS)
+    first = _month_index(month) // months * months
+    start, end = _month(first), _month(first + months)
+    for partition in partitions:
+        if partition.start <= month:
+            start = max(start, partition.end)
+        else:
+            end = min(end, partition.start)
+    return _Partition(start, end, os.path.join(_partition_dir(), f"{start}_{end}.db"))
+
+
+def _write_partition(partition: _Partition) -> SQLiteStorage:
+    """Storage of a partition to write to, created if needed."""
+    storage = get_storage(partition.path)
+    if partition.path not in _ready_partitions:
+        with _partition_lock:
+            if partition.path not in _ready_partitions:
+                with storage.transaction() as conn:
+                    _create_partition_schema(conn, partition)
+                    conn.execute(_PARTITION_VIEW)
+                _ready_partitions.add(partition.path)
+    return storage
+
+
+def _create_partition_schema(conn: sqlite3.Connection, partition: _Partition):
+    for statement in _PARTITION_SCHEMA:
+        conn.execute(statement)
+    # Ids stay unique across partitions, and increase with the period
+    conn.execute("""
+        INSERT INTO sqlite_sequence (name, seq)
+        SELECT 'audit_events', ? WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'audit_events')
+    """, (_month_index(partition.start) << 32,))
+
+
+def _intern(conn: sqlite3.Connection, table: str, values) -> Dict[str, int]:
+    """Ids of values in a dimension table, adding the missing ones."""
+    values = [value for value in values if value is not None]
+    if not values:
+        return {}
+    conn.executemany(f"INSERT OR IGNORE INTO {table} (value) VALUES (?)", [(value,) for value in values])
+    ids = {}
+    for i in range(0, len(values), 500):
+        chunk = values[i:i + 500]
+        placeholders = ", ".join("?" * len(chunk))
+        ids.update(conn.execute(f"SELECT value, id FROM {table} WHERE value IN ({placeholders})", chunk).fetchall())
+    return ids
+
+
+def _copy_legacy_logs(conn: sqlite3.Connection, schema: str, source: str, where: str = "", params: tuple = ()):
+    """
+    Copy rows of a former audit_logs table (one text column per value) into
+    the dictionary-encoded tables of `schema`, keeping their ids so that an
+    interrupted copy can be run again.
+    """
+    for _, column, table in _DIMENSIONS:
+        conn.execute(f"""
+            INSERT OR IGNORE INTO {schema}.{table} (value)
+            SELECT DISTINCT {column} FROM {source} WHERE {column} IS NOT NULL{where}
+        """, params)
+    lookups = ", ".join(
+        f"(SELECT id FROM {schema}.{table} WHERE value = l.{column})" for _, column, table in _DIMENSIONS
+    )
+    conn.execute(f"""
+        INSERT OR IGNORE INTO {schema}.audit_events
+        (id, ts, user_id, details, response_time_ms, {", ".join(column + "_id" for _, column, _ in _DIMENSIONS)})
+        SELECT l.id, CAST(strftime('%s', l.timestamp) AS INTEGER), l.user_id, l.details, l.response_time_ms, {lookups}
+        FROM {source} l WHERE 1=1{where}
+    """, params)
+
+
+def _upgrade_partitions():
+    """Convert partitions with one text column per value to the dictionary-encoded schema."""
+    for partition in _list_partitions():
+        with _read_partition(partition) as conn:
+            if conn is None or not conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'audit_logs'"
+            ).fetchone():
+                continue
+            with get_storage(partition.path).transaction():
+                _create_partition_schema(conn, partition)
+                _copy_legacy_logs(conn, "main", "audit_logs")
+                conn.execute("DROP TABLE audit_logs")
+                conn.execute(_PARTITION_VIEW)
+            conn.execute("VACUUM")
+        logger.info(f"Converted audit partition {os.path.basename(partition.path)} to the compact schema")
+
+
+@contextmanager
+def _read_partition(partition: _Partition) -> Iterator[Optional[sqlite3.Connection]]:
+    """
+    This thread's connection to a partition for the block, None if it was
+    removed (or is being removed) meanwhile. The block counts as a reader:
+    retention waits for it before closing the partition's connections.
+    """
+    with _partition_lock:
+        available = partition.path not in _retiring_partitions and os.path.exists(partition.path)
+        if available:
+            _partition_readers[partition.path] += 1
+    try:
+        yield get_storage(partition.path).connection() if available else None
+    finally:
+        if available:
+            with _partition_lock:
+                _partition_readers[partition.path] -= 1
+                if not _partition_readers[partition.path]:
+                    del _partition_readers[partition.path]
+                    _partition_idle.notify_all()
+
+
+def _overlapping_partitions(start_date: Optional[str], end_date: Optional[str]) -> List[_Partition]:
+    """Partitions that can hold logs between two dates/timestamps, newest first."""
+    lo = start_date.replace("T", " ") if start_date else None
+    hi = end_date.replace("T", " ") if end_date else None
+    return [
+        partition for partition in reversed(_list_partitions())
+        if (not lo or partition.end > lo) and (not hi or partition.start <= hi)
+    ]
+
+
+def _migrate_legacy_logs():
+    """Move the logs of the former single audit_logs table (in DB_PATH) to their partitions."""
+    conn = _db().connection()
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'audit_logs'").fetchone():
+        return
+    
+    partitions = _list_partitions()
+    targets = []
+    for (month,) in conn.execute("SELECT DISTINCT substr(timestamp, 1, 7) FROM audit_logs ORDER BY 1").fetchall():
+        if not month or not re.match(r"^\d{4}-\d{2}$", month):
+            continue
+        partition = _partition_for(month, partitions)
+        if partition not in partitions:
+            partitions.append(partition)
+        if partition not in targets:
+            targets.append(partition)
+    
+    covered = 0
+    for partition in targets:
+        _write_partition(partition)
+        conn.execute("ATTACH DATABASE ? AS partition", (partition.path,))
+        try:
+            with _db().transaction():
+                _copy_legacy_logs(
+                    conn, "partition", "main.audit_logs",
+                    " AND timestamp >= ? AND timestamp < ?", (partition.start, partition.end)
+                )
+            covered += conn.execute(
+                "SELECT COUNT(*) FROM main.audit_logs WHERE timestamp >= ? AND timestamp < ?",
+                (partition.start, partition.end)
+            ).fetchone()[0]
+        finally:
+            conn.execute("DETACH DATABASE partition")
+    
+    left = conn.execute("SELECT COUNT(*) FROM audit_logs").fetchone()[0] - covered
+    if left:
+        logger.warning(f"{left} audit logs without a valid timestamp kept in the legacy audit_logs table")
+        return
+    conn.execute("DROP TABLE audit_logs")
+    conn.execute("VACUUM")
+    logger.info(f"Moved {covered} audit logs to their partitions")
+
+
+# Username of requests without a valid token (not counted as a user)
+ANONYMOUS = "anonymous"
+
+_ROLLUP_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS audit_rollup_hourly (
+        hour TEXT NOT NULL,
+        action TEXT NOT NULL,
+        status TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (hour, action, status)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS audit_rollup_daily (
+        day TEXT NOT NULL,
+        action TEXT NOT NULL,
+        status TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (day, action, status)
+    ) WITHOUT ROWID
+    """,
+    # HyperLogLog sketch of the distinct usernames seen each day
+    """
+    CREATE TABLE IF NOT EXISTS audit_users_daily (
+        day TEXT PRIMARY KEY,
+        sketch BLOB NOT NULL
+    )
+    """,
+    # Requests, errors and DDSketch of the response times per route template
+    # ("GET /api/v1/conversations/{conversation_id}"), per hour and per day
+    """
+    CREATE TABLE IF NOT EXISTS audit_latency_hourly (
+        hour TEXT NOT NULL,
+        route TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        errors INTEGER NOT NULL,
+        sketch BLOB NOT NULL,
+        PRIMARY KEY (hour, route)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS audit_latency_daily (
+        day TEXT NOT NULL,
+        route TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        errors INTEGER NOT NULL,
+        sketch BLOB NOT NULL,
+        PRIMARY KEY (day, route)
+    )
+    """,
+    # Highest event id of each partition file already in the rollups
+    """
+    CREATE TABLE IF NOT EXISTS audit_rollup_progress (
+        partition TEXT PRIMARY KEY,
+        last_id INTEGER NOT NULL
+    )
+    """,
+]
+
+
+_UPSERT_HOURLY = """
+    INSERT INTO audit_rollup_hourly (hour, action, status, count) VALUES (?, ?, ?, ?)
+    ON CONFLICT (hour, action, status) DO UPDATE SET count = count + excluded.count
+"""
+
+_UPSERT_DAILY = """
+    INSERT INTO audit_rollup_daily (day, action, status, count) VALUES (?, ?, ?, ?)
+    ON CONFLICT (day, action, status) DO UPDATE SET count = count + excluded.count
+"""
+
+_UPSERT_PROGRESS = """
+    INSERT INTO audit_rollup_progress (partition, last_id) VALUES (?, ?)
+    ON CONFLICT (partition) DO UPDATE SET last_id = MAX(last_id, excluded.last_id)
+"""
+
+# Serializes inserting logs and rolling them up, so that the rollup progress
+# of a partition never gets ahead of rows not rolled up yet
+_insert_lock = threading.Lock()
+
+
+def _init_rollups(cursor):
+    """
+    Create the rollup tables used by the statistics. They are kept up to date
+    by insert_audit_rows; logs written before they existed are rolled up once.
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'audit_rollup_hourly'")
+    exists = cursor.fetchone() is not None
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'audit_rollup_progress'")
+    tracked = cursor.fetchone() is not None
+    for table in _ROLLUP_TABLES:
+        cursor.execute(table)
+    if not tracked:
+        # Every existing log is (or is about to be) in the rollups
+        for partition in _list_partitions():
+            with _read_partition(partition) as source:
+                if source is not None:
+                    last_id = source.execute("SELECT MAX(id) FROM audit_events").fetchone()[0]
+                    cursor.execute(_UPSERT_PROGRESS, (os.path.basename(partition.path), last_id or 0))
+    if exists:
+        return
+    
+    sketches = defaultdict(HyperLogLog)
+    for partition in _list_partitions():
+        with _read_partition(partition) as source:
+            if source is None:
+                continue
+            cursor.executemany(_UPSERT_HOURLY, source.execute("""
+                SELECT substr(timestamp, 1, 13), action, COALESCE(status, ''), COUNT(*)
+                FROM audit_logs GROUP BY 1, 2, 3
+            """).fetchall())
+            for day, username in source.execute("""
+                SELECT DISTINCT substr(timestamp, 1, 10), username FROM audit_logs
+                WHERE username IS NOT NULL AND username != ?
+            """, (ANONYMOUS,)):
+                sketches[day].add(username)
     cursor.execute("""
-        CREATE TABLE IF NOT EXISTS audit_logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            user_id INTEGER,
-            username TEXT,
-            action TEXT NOT NULL,
-            resource TEXT,
-            details TEXT,
-            ip_address TEXT,
-            user_agent TEXT,
-            status TEXT DEFAULT 'success',
-            response_time_ms INTEGER
-        )
+        INSERT INTO audit_rollup_daily (day, action, status, count)
+        SELECT substr(hour, 1, 10), action, status, SUM(count)
+        FROM audit_rollup_hourly GROUP BY 1, 2, 3
     """)
+    cursor.executemany(
+        "INSERT INTO audit_users_daily (day, sketch) VALUES (?, ?)",
+        [(day, sketch.to_bytes()) for day, sketch in sketches.items()]
+    )
+
+
+def _update_rollups(conn, rows: List[tuple]):
+    """Add rows built by audit_row to the rollups (in the caller's transaction)."""
+    hourly = Counter((row[0][:13], row[3], row[8] or "") for row in rows)
+    daily = Counter()
+    for (hour, action, status), count in hourly.items():
+        daily[(hour[:10], action, status)] += count
     
-    # Create indexes for common queries
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_audit_timestamp ON audit_logs(timestamp)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_audit_user ON audit_logs(user_id)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_audit_action ON audit_logs(action)")
+    conn.executemany(_UPSERT_HOURLY, [(*key, count) for key, count in hourly.items()])
+    conn.executemany(_UPSERT_DAILY, [(*key, count) for key, count in daily.items()])
+    
+    users = defaultdict(set)
+    for row in rows:
+        if row[2] and row[2] != ANONYMOUS:
+            users[row[0][:10]].add(row[2])
+    for day, usernames in users.items():
+        stored = conn.execute("SELECT sketch FROM audit_users_daily WHERE day = ?", (day,)).fetchone()
+        sketch = HyperLogLog(stored[0] if stored else None)
+        sketch.update(usernames)
+        conn.execute(
+            "INSERT OR REPLACE INTO audit_users_daily (day, sketch) VALUES (?, ?)",
+            (day, sketch.to_bytes())
+        )
     
-    conn.commit()
-    conn.close()
+    # Response times of request events (rows spooled before routes were recorded have none)
+    timed = [row for row in rows if len(row) > 10 and row[10] and row[9] is not None]
+    for table, key_column, key_length in (("audit_latency_hourly", "hour", 13), ("audit_latency_daily", "day", 10)):
+        groups = defaultdict(list)
+        for row in timed:
+            groups[(row[0][:key_length], row[10])].append(row)
+        for (key, route), group in groups.items():
+            stored = conn.execute(
+                f"SELECT count, errors, sketch FROM {table} WHERE {key_column} = ? AND route = ?", (key, route)
+            ).fetchone()
+            count, errors, sketch = (stored[0], stored[1], DDSketch(stored[2])) if stored else (0, 0, DDSketch())
+            for row in group:
+                sketch.add(row[9])
+            conn.execute(
+                f"INSERT OR REPLACE INTO {table} ({key_column}, route, count, errors, sketch) VALUES (?, ?, ?, ?, ?)",
+                (key, route, count + len(group), errors + sum(row[8] != "success" for row in group), sketch.to_bytes())
+            )
 
 
-def log_action(
+def audit_row(
     user_id: Optional[int],
     username: Optional[str],
     action: str,
@@ -73,47 +552,175 @@ def log_action(
     ip_address: Optional[str] = None,
     user_agent: Optional[str] = None,
     status: str = "success",
-    response_time_ms: Optional[int] = None
-):
-    """Log a user action to the audit database."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    details_json = json.dumps(details) if details else None
-    
-    cursor.execute("""
-        INSERT INTO audit_logs 
-        (user_id, username, action, resource, details, ip_address, user_agent, status, response_time_ms)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
+    response_time_ms: Optional[int] = None,
+    route: Optional[str] = None
+) -> tuple:
+    """
+    Build the audit_logs row of an action, timestamped now (same format as
+    CURRENT_TIMESTAMP) so that it can be inserted later. `route` is the
+    route template of a request event; it only feeds the latency rollups.
+    """
+    return (
+        datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
         user_id,
         username or "anonymous",
         action,
         resource,
-        details_json,
+        json.dumps(details) if details else None,
         ip_address,
         user_agent,
         status,
-        response_time_ms
-    ))
+        response_time_ms,
+        route
+    )
+
+
+def insert_audit_rows(rows: List[tuple]):
+    """
+    Insert rows built by audit_row into their partitions, then add them to
+    the rollups (one transaction per partition, one for the rollups).
+    Partitions and rollups are separate files, so the rollup transaction
+    also records the last rolled-up id of each partition: logs committed
+    without their rollup update (error, crash) are added by catch_up_rollups,
+    which runs at startup and with the maintenance. When a partition
+    transaction fails, AuditInsertError carries the rows of the partitions
+    not committed, so that only those are written again.
+    """
+    with _insert_lock:
+        _insert_partition_rows(rows)
+
+
+def _insert_partition_rows(rows: List[tuple]):
+    partitions = _list_partitions()
+    by_month: Dict[str, _Partition] = {}
+    groups: Dict[_Partition, List[tuple]] = defaultdict(list)
+    for row in rows:
+        month = row[0][:7]
+        partition = by_month.get(month)
+        if partition is None:
+            partition = by_month[month] = _partition_for(month, partitions)
+            if partition not in partitions:
+                partitions.append(partition)
+        groups[partition].append(row)
+    
+    last_ids = {}
+    stored = []
+    error = None
+    batches = list(groups.values())
+    for index, (partition, partition_rows) in enumerate(groups.items()):
+        try:
+            _insert_partition(partition, partition_rows, last_ids)
+        except Exception as e:
+            error = AuditInsertError([row for batch in batches[index:] for row in batch], e)
+            break
+        stored.extend(partition_rows)
     
-    conn.commit()
-    conn.close()
+    if stored:
+        try:
+            with _db().transaction() as conn:
+                _update_rollups(conn, stored)
+                conn.executemany(_UPSERT_PROGRESS, last_ids.items())
+        except Exception as e:
+            # The logs are stored: inserting them again would duplicate them
+            logger.error(f"Failed to update the audit rollups, left to catch_up_rollups: {e}")
+    if error:
+        raise error
 
 
-def get_audit_logs(
-    limit: int = 100,
-    offset: int = 0,
+def _insert_partition(partition: _Partition, rows: List[tuple], last_ids: Dict[str, int]):
+    """Insert rows into one partition, in one transaction, and note its last id."""
+    with _write_partition(partition).transaction() as conn:
+        ids = {
+            column: _intern(conn, table, {row[index] for row in rows})
+            for index, column, table in _DIMENSIONS
+        }
+        conn.executemany("""
+            INSERT INTO audit_events
+            (ts, user_id, username_id, action_id, resource_id, details, ip_address_id, user_agent_id, status_id, response_time_ms)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, [(
+            _to_ts(row[0]),
+            row[1],
+            ids["username"].get(row[2]),
+            ids["action"][row[3]],
+            ids["resource"].get(row[4]),
+            row[5],
+            ids["ip_address"].get(row[6]),
+            ids["user_agent"].get(row[7]),
+            ids["status"].get(row[8]),
+            row[9]
+        ) for row in rows])
+        last_ids[os.path.basename(partition.path)] = conn.execute("SELECT MAX(id) FROM audit_events").fetchone()[0]
+
+
+def catch_up_rollups() -> int:
+    """
+    Add to the rollups the logs of each partition above its last rolled-up
+    id, in the same transaction as the progress; running it again adds
+    nothing. The partitions keep each log's response_time_ms but not its
+    route template, which keys the latency rollups, so these logs are
+    missing from the latency statistics. Returns the number of logs added.
+    """
+    added = 0
+    for partition in _list_partitions():
+        name = os.path.basename(partition.path)
+        with _insert_lock:
+            stored = _db().connection().execute(
+                "SELECT last_id FROM audit_rollup_progress WHERE partition = ?", (name,)
+            ).fetchone()
+            with _read_partition(partition) as source:
+                if source is None:
+                    continue
+                rows = source.execute("""
+                    SELECT id, timestamp, user_id, username, action, resource, details, ip_address, user_agent, status, response_time_ms
+                    FROM audit_logs WHERE id > ? ORDER BY id
+                """, (stored[0] if stored else 0,)).fetchall()
+            if not rows:
+                continue
+            with _db().transaction() as conn:
+                _update_rollups(conn, [row[1:] for row in rows])
+                conn.execute(_UPSERT_PROGRESS, (name, rows[-1][0]))
+        logger.warning(f"Rolled up {len(rows)} audit logs of {name} missing from the statistics")
+        added += len(rows)
+    return added
+
+
+def log_action(
+    user_id: Optional[int],
+    username: Optional[str],
+    action: str,
+    resource: str,
+    details: Optional[dict] = None,
+    ip_address: Optional[str] = None,
+    user_agent: Optional[str] = None,
+    status: str = "success",
+    response_time_ms: Optional[int] = None
+):
+    """Log a user action to the audit database."""
+    insert_audit_rows([audit_row(
+        user_id, username, action, resource, details, ip_address, user_agent, status, response_time_ms
+    )])
+
+
+def _to_ts(value: str) -> int:
+    """Unix time of a UTC date or timestamp ("YYYY-MM-DD[ HH:MM[:SS]]", "T" accepted)."""
+    try:
+        return int(datetime.fromisoformat(value).replace(tzinfo=timezone.utc).timestamp())
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Date invalide : {value}") from e
+
+
+def _filters(
     user_id: Optional[int] = None,
     action: Optional[str] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None
-) -> List[AuditLog]:
-    """Retrieve audit logs with optional filters."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    query = "SELECT id, timestamp, user_id, username, action, resource, details, ip_address, user_agent, status FROM audit_logs WHERE 1=1"
+) -> Tuple[str, list]:
+    """
+    Build the WHERE clause shared by listings, counts and exports, on the
+    audit_events columns. Raises ValueError if a date is invalid.
+    """
+    query = " WHERE 1=1"
     params = []
     
     if user_id:
@@ -121,26 +728,59 @@ def get_audit_logs(
         params.append(user_id)
     
     if action:
-        query += " AND action = ?"
+        query += " AND action_id = (SELECT id FROM audit_actions WHERE value = ?)"
         params.append(action)
     
     if start_date:
-        query += " AND timestamp >= ?"
-        params.append(start_date)
+        query += " AND ts >= ?"
+        params.append(_to_ts(start_date))
     
     if end_date:
-        query += " AND timestamp <= ?"
-        params.append(end_date)
+        query += " AND ts <= ?"
+        params.append(_to_ts(end_date))
+    
+    return query, params
+
+
+def get_audit_logs(
+    limit: int = 100,
+    offset: int = 0,
+    user_id: Optional[int] = None,
+    action: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    before: Optional[tuple] = None
+) -> List[AuditLog]:
+    """
+    Retrieve audit logs with optional filters, newest first.
+    `before` is the (timestamp, id) of the last log of the previous page;
+    prefer it to `offset`, whose cost grows with the page depth.
+    Partitions are read newest first, and only until the page is full.
+    """
+    where, params = _filters(user_id, action, start_date, end_date)
+    query = "SELECT id, timestamp, user_id, username, action, resource, details, ip_address, user_agent, status FROM audit_logs" + where
+    
+    upper = end_date
+    if before:
+        query += " AND (ts, id) < (?, ?)"
+        params.extend([_to_ts(before[0]), before[1]])
+        if not upper or before[0] < upper:
+            upper = before[0]
     
-    query += " ORDER BY timestamp DESC LIMIT ? OFFSET ?"
-    params.extend([limit, offset])
+    query += " ORDER BY ts DESC, id DESC LIMIT ?"
     
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
-    conn.close()
+    wanted = offset + limit
+    rows = []
+    for partition in _overlapping_partitions(start_date, upper):
+        with _read_partition(partition) as conn:
+            if conn is None:
+                continue
+            rows.extend(conn.execute(query, params + [wanted - len(rows)]).fetchall())
+        if len(rows) >= wanted:
+            break
     
     logs = []
-    for row in rows:
+    for row in rows[offset:]:
         logs.append(AuditLog(
             id=row[0],
             timestamp=row[1],
@@ -157,70 +797,402 @@ def get_audit_logs(
     return logs
 
 
-def get_audit_stats() -> AuditStats:
-    """Get audit statistics for the dashboard."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+# (filters) -> (computed at, count)
+_count_cache: "OrderedDict[tuple, Tuple[float, int]]" = OrderedDict()
+_count_cache_lock = threading.Lock()
+
+
+def count_audit_logs(
+    user_id: Optional[int] = None,
+    action: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+) -> int:
+    """
+    Count the audit logs matching the filters. The exact count is cached for
+    AUDIT_COUNT_CACHE_SECONDS, so paging through millions of rows does not
+    recount them for every page; the AUDIT_COUNT_CACHE_SIZE most recently
+    used filters are kept.
+    """
+    key = (DB_PATH, user_id, action, start_date, end_date)
+    now = time.monotonic()
+    with _count_cache_lock:
+        cached = _count_cache.get(key)
+        if cached:
+            if now - cached[0] < settings.AUDIT_COUNT_CACHE_SECONDS:
+                _count_cache.move_to_end(key)
+                return cached[1]
+            del _count_cache[key]
     
-    # Total requests
-    cursor.execute("SELECT COUNT(*) FROM audit_logs")
-    total_requests = cursor.fetchone()[0]
+    where, params = _filters(user_id, action, start_date, end_date)
+    count = 0
+    for partition in _overlapping_partitions(start_date, end_date):
+        with _read_partition(partition) as conn:
+            if conn is not None:
+                count += conn.execute("SELECT COUNT(*) FROM audit_events" + where, params).fetchone()[0]
     
-    # Requests today
-    today = datetime.now().strftime("%Y-%m-%d")
-    cursor.execute("SELECT COUNT(*) FROM audit_logs WHERE DATE(timestamp) = ?", (today,))
-    requests_today = cursor.fetchone()[0]
+    if settings.AUDIT_COUNT_CACHE_SIZE > 0:
+        with _count_cache_lock:
+            _count_cache[key] = (now, count)
+            _count_cache.move_to_end(key)
+            while len(_count_cache) > settings.AUDIT_COUNT_CACHE_SIZE:
+                _count_cache.popitem(last=False)
+    return count
+
+
+def _hour_bound(value: Optional[str], default_hour: str) -> Optional[str]:
+    """Rollup hour key ("YYYY-MM-DD HH") of a date or datetime bound."""
+    if not value:
+        return None
+    value = value.replace("T", " ")
+    return value[:13] if len(value) >= 13 else f"{value[:10]} {default_hour}"
+
+
+def _shift_day(day: str, days: int) -> str:
+    return (datetime.strptime(day, "%Y-%m-%d") + timedelta(days=days)).strftime("%Y-%m-%d")
+
+
+def _rollup_ranges(
+    start_date: Optional[str],
+    end_date: Optional[str]
+) -> Tuple[Optional[Tuple[Optional[str], Optional[str]]], List[Tuple[str, str]]]:
+    """
+    Split [start_date, end_date] into whole days, read from the daily rollup,
+    and the hours of partially covered days, read from the hourly rollup.
+    Returns ((first day, last day) or None, [(first hour, last hour), ...]);
+    a None day bound is open.
+    """
+    lo = _hour_bound(start_date, "00")
+    hi = _hour_bound(end_date, "23")
+    if lo and hi and lo[:10] == hi[:10] and (lo[11:] != "00" or hi[11:] != "23"):
+        return None, [(lo, hi)]
     
-    # Unique users
-    cursor.execute("SELECT COUNT(DISTINCT user_id) FROM audit_logs WHERE user_id IS NOT NULL")
-    unique_users = cursor.fetchone()[0]
+    hours = []
+    first_day = lo[:10] if lo else None
+    last_day = hi[:10] if hi else None
+    if lo and lo[11:] != "00":
+        hours.append((lo, f"{lo[:10]} 23"))
+        first_day = _shift_day(first_day, 1)
+    if hi and hi[11:] != "23":
+        hours.append((f"{hi[:10]} 00", hi))
+        last_day = _shift_day(last_day, -1)
     
-    # Top actions
-    cursor.execute("""
-        SELECT action, COUNT(*) as count 
-        FROM audit_logs 
-        GROUP BY action 
-        ORDER BY count DESC 
-        LIMIT 10
-    """)
-    top_actions = [{"action": row[0], "count": row[1]} for row in cursor.fetchall()]
+    if first_day and last_day and first_day > last_day:
+        return None, hours
+    return (first_day, last_day), hours
+
+
+def get_audit_stats(start_date: Optional[str] = None, end_date: Optional[str] = None) -> AuditStats:
+    """
+    Get audit statistics for the dashboard, over all logs or between two
+    dates/datetimes (inclusive, hour precision; a date alone covers the whole
+    day). Answered from the rollups: the cost depends on the number of days
+    and actions, not of logs. unique_users is a HyperLogLog estimate over
+    the days touched by the range.
+    """
+    cursor = _db().connection().cursor()
+    days, hours = _rollup_ranges(start_date, end_date)
+    
+    parts = []
+    params = []
+    if days:
+        where = []
+        if days[0]:
+            where.append("day >= ?")
+            params.append(days[0])
+        if days[1]:
+            where.append("day <= ?")
+            params.append(days[1])
+        parts.append("SELECT action, count FROM audit_rollup_daily" + (" WHERE " + " AND ".join(where) if where else ""))
+    for first_hour, last_hour in hours:
+        parts.append("SELECT action, count FROM audit_rollup_hourly WHERE hour >= ? AND hour <= ?")
+        params.extend([first_hour, last_hour])
+    
+    actions = []
+    if parts:
+        cursor.execute(f"""
+            SELECT action, SUM(count) AS total FROM ({" UNION ALL ".join(parts)})
+            GROUP BY action ORDER BY total DESC
+        """, params)
+        actions = cursor.fetchall()
     
-    conn.close()
+    # Requests today (timestamps are UTC)
+    today = datetime.utcnow().strftime("%Y-%m-%d")
+    cursor.execute("SELECT COALESCE(SUM(count), 0) FROM audit_rollup_daily WHERE day = ?", (today,))
+    requests_today = cursor.fetchone()[0]
+    
+    # Unique users: merged daily sketches
+    query = "SELECT sketch FROM audit_users_daily WHERE 1=1"
+    sketch_params = []
+    if start_date:
+        query += " AND day >= ?"
+        sketch_params.append(_hour_bound(start_date, "00")[:10])
+    if end_date:
+        query += " AND day <= ?"
+        sketch_params.append(_hour_bound(end_date, "23")[:10])
+    cursor.execute(query, sketch_params)
+    users = HyperLogLog()
+    users.merge(*(HyperLogLog(sketch) for (sketch,) in cursor.fetchall()))
     
     return AuditStats(
-        total_requests=total_requests,
+        total_requests=sum(count for _, count in actions),
         requests_today=requests_today,
-        unique_users=unique_users,
-        top_actions=top_actions
+        unique_users=users.count(),
+        top_actions=[{"action": action, "count": count} for action, count in actions[:10]]
     )
 
 
-def export_audit_logs(
-    format: str = "json",
+# Orders accepted by get_route_latency
+LATENCY_ORDERS = ("p50_ms", "p90_ms", "p99_ms", "count", "error_rate")
+
+
+def get_route_latency(
     start_date: Optional[str] = None,
-    end_date: Optional[str] = None
-) -> str:
-    """Export audit logs to JSON or CSV format."""
-    logs = get_audit_logs(limit=10000, start_date=start_date, end_date=end_date)
-    
-    if format == "json":
-        return json.dumps([log.dict() for log in logs], indent=2, ensure_ascii=False)
-    
-    elif format == "csv":
-        import csv
-        from io import StringIO
-        
-        output = StringIO()
+    end_date: Optional[str] = None,
+    order_by: str = "p99_ms",
+    limit: int = 20
+) -> List[RouteLatency]:
+    """
+    Latency percentiles and error rate per route template, over all logs or
+    between two dates/datetimes (same bounds as get_audit_stats), highest
+    first. Merged from the hourly/daily response time sketches: percentiles
+    are within 1% of the exact values, whatever the number of requests.
+    """
+    cursor = _db().connection().cursor()
+    days, hours = _rollup_ranges(start_date, end_date)
+    
+    parts = []
+    params = []
+    if days:
+        where = []
+        if days[0]:
+            where.append("day >= ?")
+            params.append(days[0])
+        if days[1]:
+            where.append("day <= ?")
+            params.append(days[1])
+        parts.append("SELECT route, count, errors, sketch FROM audit_latency_daily" + (" WHERE " + " AND ".join(where) if where else ""))
+    for first_hour, last_hour in hours:
+        parts.append("SELECT route, count, errors, sketch FROM audit_latency_hourly WHERE hour >= ? AND hour <= ?")
+        params.extend([first_hour, last_hour])
+    if not parts:
+        return []
+    
+    routes: Dict[str, list] = {}
+    for route, count, errors, sketch in cursor.execute(" UNION ALL ".join(parts), params):
+        totals = routes.setdefault(route, [0, 0, []])
+        totals[0] += count
+        totals[1] += errors
+        totals[2].append(DDSketch(sketch))
+    
+    results = []
+    for route, (count, errors, sketches) in routes.items():
+        merged = DDSketch()
+        merged.merge(*sketches)
+        results.append(RouteLatency(
+            route=route,
+            count=count,
+            error_rate=errors / count,
+            p50_ms=round(merged.quantile(0.5), 1),
+            p90_ms=round(merged.quantile(0.9), 1),
+            p99_ms=round(merged.quantile(0.99), 1)
+        ))
+    results.sort(key=lambda r: getattr(r, order_by), reverse=True)
+    return results[:limit]
+
+
+# --- Maintenance ---
+
+def _current_month(now: Optional[datetime]) -> int:
+    now = now or datetime.utcnow()
+    return now.year * 12 + now.month - 1
+
+
+def apply_audit_retention(now: Optional[datetime] = None) -> List[str]:
+    """
+    Remove the partitions whose logs are all older than AUDIT_RETENTION_MONTHS
+    (0 keeps everything). A period is removed with its file, without
+    deleting rows; with AUDIT_ARCHIVE_EXPIRED the file is moved into the
+    archive directory, then gzipped there. The rollups keep their counts,
+    so statistics still cover expired periods. Returns the removed
+    partition names.
+    """
+    if settings.AUDIT_RETENTION_MONTHS <= 0:
+        return []
+    cutoff = _month(_current_month(now) - settings.AUDIT_RETENTION_MONTHS)
+    archive_dir = os.path.join(_partition_dir(), "archive")
+    
+    expired = []
+    for partition in _list_partitions():
+        if partition.end > cutoff:
+            break
+        name = os.path.basename(partition.path)
+        with _partition_lock:
+            # No new readers; the running queries finish before their
+            # connections are closed
+            _retiring_partitions.add(partition.path)
+            try:
+                if not _partition_idle.wait_for(
+                    lambda: not _partition_readers.get(partition.path), _RETENTION_WAIT_SECONDS
+                ):
+                    logger.warning(f"Audit partition {name} still in use, retention postponed")
+                    continue
+                # Fold the WAL into the file, then close every connection to it
+                get_storage(partition.path).connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                close_storage(partition.path)
+                _ready_partitions.discard(partition.path)
+                # Only a rename or an unlink while readers wait on the lock
+                if settings.AUDIT_ARCHIVE_EXPIRED:
+                    os.makedirs(archive_dir, exist_ok=True)
+                    os.replace(partition.path, os.path.join(archive_dir, name))
+                for suffix in ("-wal", "-shm", ""):
+                    if os.path.exists(partition.path + suffix):
+                        os.remove(partition.path + suffix)
+            finally:
+                _retiring_partitions.discard(partition.path)
+        expired.append(name)
+    
+    if os.path.isdir(archive_dir):
+        _compress_archived(archive_dir)
+    return expired
+
+
+def _compress_archived(archive_dir: str):
+    """Gzip the partition files moved into the archive (left over by an interrupted run too)."""
+    for name in sorted(os.listdir(archive_dir)):
+        if not _PARTITION_FILE.match(name):
+            continue
+        path = os.path.join(archive_dir, name)
+        with open(path, "rb") as src, gzip.open(path + ".gz.tmp", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(path + ".gz.tmp", path + ".gz")
+        os.remove(path)
+
+
+def compact_cold_partitions(now: Optional[datetime] = None) -> List[str]:
+    """
+    VACUUM then ANALYZE, once, the partitions of past months (no longer
+    written to): the file is rebuilt without free pages and the query
+    planner gets statistics for its indexes. PRAGMA user_version marks a
+    compacted partition. Returns the compacted partition names.
+    """
+    current = _month(_current_month(now))
+    compacted = []
+    for partition in _list_partitions():
+        if partition.end > current:
+            break
+        with _read_partition(partition) as conn:
+            if conn is None or conn.execute("PRAGMA user_version").fetchone()[0]:
+                continue
+            conn.execute("VACUUM")
+            conn.execute("ANALYZE")
+            conn.execute("PRAGMA user_version = 1")
+        compacted.append(os.path.basename(partition.path))
+    return compacted
+
+
+def run_audit_maintenance(now: Optional[datetime] = None):
+    """Roll up missed logs, apply the retention policy, then compact the cold partitions."""
+    catch_up_rollups()
+    expired = apply_audit_retention(now)
+    if expired:
+        action = "Archived" if settings.AUDIT_ARCHIVE_EXPIRED else "Removed"
+        logger.info(f"{action} expired audit partitions: {', '.join(expired)}")
+    compacted = compact_cold_partitions(now)
+    if compacted:
+        logger.info(f"Compacted audit partitions: {', '.join(compacted)}")
+
+
+async def run_audit_maintenance_loop():
+    """Run the audit maintenance every AUDIT_MAINTENANCE_INTERVAL_HOURS."""
+    while True:
+        try:
+            await asyncio.to_thread(run_audit_maintenance)
+        except Exception as e:
+            logger.error(f"Audit maintenance failed: {e}")
+        await asyncio.sleep(settings.AUDIT_MAINTENANCE_INTERVAL_HOURS * 3600)
+
+
+# Export formats and their media types
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "json": "application/json",
+}
+
+_EXPORT_COLUMNS = ["id", "timestamp", "user_id", "username", "action", "resource", "details", "ip_address", "user_agent", "status"]
+_EXPORT_CSV_HEADER = ["ID", "Timestamp", "User ID", "Username", "Action", "Resource", "Details", "IP Address", "Status"]
+
+
+def _export_connection(partition: _Partition) -> Optional[sqlite3.Connection]:
+    """
+    Dedicated read-only connection for an export: the stream is consumed
+    from several threads, and keeps its cursor open for its whole duration.
+    """
+    with _partition_lock:
+        if partition.path in _retiring_partitions or not os.path.exists(partition.path):
+            return None
+        return sqlite3.connect(f"file:{partition.path}?mode=ro", uri=True, check_same_thread=False)
+
+
+def _encode_export_rows(format: str, rows: List[tuple], first: bool) -> str:
+    if format == "csv":
+        output = io.StringIO()
         writer = csv.writer(output)
-        writer.writerow(["ID", "Timestamp", "User ID", "Username", "Action", "Resource", "Details", "IP Address", "Status"])
-        
-        for log in logs:
-            writer.writerow([
-                log.id, log.timestamp, log.user_id, log.username,
-                log.action, log.resource, log.details, log.ip_address, log.status
-            ])
-        
+        if first:
+            writer.writerow(_EXPORT_CSV_HEADER)
+        # Same columns as before (no user agent)
+        writer.writerows(row[:8] + row[9:] for row in rows)
         return output.getvalue()
     
-    return ""
+    lines = [json.dumps(dict(zip(_EXPORT_COLUMNS, row)), ensure_ascii=False) for row in rows]
+    if format == "ndjson":
+        return "".join(line + "\n" for line in lines)
+    return ("[\n" if first else ",\n") + ",\n".join(lines)
+
 
+def iter_audit_export(
+    format: str = "json",
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    batch_size: int = 1000
+) -> Iterator[bytes]:
+    """
+    Export audit logs, newest first, as CSV, NDJSON or a JSON array.
+    Yields one encoded chunk per batch_size rows read from an open cursor,
+    so memory stays constant whatever the number of logs; the date range
+    is applied on the timestamp index of each overlapping partition.
+    Raises ValueError (before streaming) if a date is invalid.
+    """
+    where, params = _filters(start_date=start_date, end_date=end_date)
+    query = f"SELECT {', '.join(_EXPORT_COLUMNS)} FROM audit_logs{where} ORDER BY ts DESC, id DESC"
+    return _export_chunks(format, query, params, _overlapping_partitions(start_date, end_date), batch_size)
+
+
+def _export_chunks(
+    format: str,
+    query: str,
+    params: list,
+    partitions: List[_Partition],
+    batch_size: int
+) -> Iterator[bytes]:
+    first = True
+    for partition in partitions:
+        conn = _export_connection(partition)
+        if conn is None:
+            continue
+        try:
+            cursor = conn.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield _encode_export_rows(format, rows, first).encode("utf-8")
+                first = False
+        finally:
+            conn.close()
+    
+    if first and format == "csv":
+        yield _encode_export_rows(format, [], True).encode("utf-8")
+    elif format == "json":
+        yield b"[]\n" if first else b"\n]\n"
@@ -0,0 +1,175 @@
+"""
+Batched writer for request audit events.
+
+The audit middleware logs every request. Writing each event in its own
+transaction puts a commit on every response; instead events are pushed to a
+bounded in-memory queue and a background thread inserts them in batches
+(executemany, one transaction) of up to AUDIT_BATCH_SIZE events or every
+AUDIT_FLUSH_INTERVAL_SECONDS.
+
+Events are not lost when the queue is full or the database cannot be
+written: they are appended to a spool file (one JSON row per line), which
+is replayed into the database at the next startup. A batch spanning several
+partitions is committed partition by partition, so only the events of the
+partitions that failed are spooled. The lifespan drains the queue on
+shutdown.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import List, Optional
+
+from app.core.config import settings
+from app.core.metrics import record_audit_batch, record_audit_dropped, record_audit_queue, record_audit_spooled
+from .audit_db import AuditInsertError, audit_row, insert_audit_rows
+
+logger = logging.getLogger("audit_writer")
+
+# Queued after the last event to stop the writer thread
+_STOP = object()
+
+
+class AuditWriter:
+    def __init__(self, queue_size: int, batch_size: int, flush_interval: float, spool_path: str):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spool_path = spool_path
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._spool_lock = threading.Lock()
+
+    # --- Public API ---
+
+    def log(self, **fields):
+        """
+        Queue an audit event (arguments of audit_db.log_action). Never
+        blocks: when the queue is full the event goes to the spool file.
+        """
+        row = audit_row(**fields)
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self._spool([row], "queue_full")
+        record_audit_queue(self._queue.qsize())
+
+    def drain(self):
+        """
+        Write every queued event and stop the writer thread (it restarts on
+        the next event). Events that cannot be written are spooled with the
+        "shutdown" reason.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread:
+            self._queue.put(_STOP)
+            thread.join()
+
+        rows = []
+        while True:
+            try:
+                row = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if row is not _STOP:
+                rows.append(row)
+        for i in range(0, len(rows), self.batch_size):
+            self._write(rows[i:i + self.batch_size], "shutdown")
+        record_audit_queue(0)
+
+    def replay_spool(self) -> int:
+        """
+        Insert the events spooled by a previous run, then empty the spool.
+        If a write fails, the spool keeps only the events not stored yet.
+        Returns the number of events inserted.
+        """
+        with self._spool_lock:
+            if not os.path.exists(self.spool_path):
+                return 0
+            with open(self.spool_path, "r", encoding="utf-8") as f:
+                rows = [tuple(json.loads(line)) for line in f if line.strip()]
+            for i in range(0, len(rows), self.batch_size):
+                try:
+                    insert_audit_rows(rows[i:i + self.batch_size])
+                except Exception as e:
+                    failed = e.rows if isinstance(e, AuditInsertError) else rows[i:i + self.batch_size]
+                    left = failed + rows[i + self.batch_size:]
+                    with open(self.spool_path, "w", encoding="utf-8") as f:
+                        f.writelines(json.dumps(list(row)) + "\n" for row in left)
+                    logger.error(f"Failed to replay the audit spool, {len(left)} events kept: {e}")
+                    return len(rows) - len(left)
+            os.remove(self.spool_path)
+        if rows:
+            logger.info(f"Replayed {len(rows)} spooled audit events")
+        return len(rows)
+
+    # --- Writer thread ---
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            row = self._queue.get()
+            if row is _STOP:
+                return
+            batch = [row]
+            stop = False
+            # Fill the batch until it is full or the oldest event waited long enough
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    row = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if row is _STOP:
+                    stop = True
+                    break
+                batch.append(row)
+            self._write(batch)
+            record_audit_queue(self._queue.qsize())
+            if stop:
+                return
+
+    def _write(self, rows: List[tuple], reason: str = "write_error"):
+        try:
+            insert_audit_rows(rows)
+            record_audit_batch(len(rows))
+        except Exception as e:
+            # Partitions already committed must not be written again by the replay
+            failed = e.rows if isinstance(e, AuditInsertError) else rows
+            logger.error(f"Failed to write {len(failed)} audit events, spooling them: {e}")
+            self._spool(failed, reason)
+
+    def _spool(self, rows: List[tuple], reason: str):
+        try:
+            with self._spool_lock:
+                directory = os.path.dirname(self.spool_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.spool_path, "a", encoding="utf-8") as f:
+                    f.writelines(json.dumps(list(row)) + "\n" for row in rows)
+            record_audit_spooled(reason, len(rows))
+        except OSError as e:
+            logger.error(f"Lost {len(rows)} audit events, spool file not writable: {e}")
+            record_audit_dropped(len(rows))
+
+
+# Global instance
+audit_writer = AuditWriter(
+    settings.AUDIT_QUEUE_SIZE,
+    settings.AUDIT_BATCH_SIZE,
+    settings.AUDIT_FLUSH_INTERVAL_SECONDS,
+    settings.AUDIT_SPOOL_PATH
+)
@@ -1,18 +1,50 @@
 """
 Conversations database for Pstral.
 Centralizes chat history storage for multi-user access.
+
+Messages are stored one row per message in conversation_messages, keyed by
+(conversation_id, seq), so saving a turn only inserts the new messages
+instead of rewriting the whole history. The legacy conversations.messages
+JSON column is migrated on startup and no longer written.
+
+message_count, preview (start of the last message) and size_bytes are kept
+on the conversations row by triggers, so listing conversations only reads
+the covering index on (user_id, updated_at) and never message content.
+
+Message images are stored as SHA-256 digests of the image store; inline
+base64 sent by older clients is moved into the store on write. image_owners
+lists who may read each image: its uploader, or the sender of its inline
+base64. Referencing a digest in a message grants nothing, since knowing a
+digest must not be enough to read the image.
+
+Every write bumps conversations.version in the same UPDATE that checks
+ownership (and, for conditional saves, the expected version), so callers
+get optimistic concurrency and an ETag without re-reading the conversation.
+
+Search uses an FTS5 index (conversation_search) holding one document per
+title and per message, maintained by triggers on both tables. Each document
+carries an "owner" token (u<user_id>) so the MATCH itself is scoped to the
+user; conversation_search_docs maps (conversation_id, seq) to the FTS rowid,
+with seq = -1 for the title.
 """
-import sqlite3
 import os
+import re
 import json
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Tuple
 from pydantic import BaseModel
 
+from .image_store import image_store, is_image_ref
+from .sqlite_storage import HAS_FTS5, SQLiteStorage, get_storage
+
 # Database path
 DB_PATH = os.path.join(os.path.dirname(__file__), "conversations.db")
 
 
+def _db() -> SQLiteStorage:
+    return get_storage(DB_PATH)
+
+
 class Message(BaseModel):
     role: str
     content: str
@@ -28,6 +60,30 @@ class Conversation(BaseModel):
     messages: List[Message]
     created_at: str
     updated_at: str
+    version: int = 1
+
+
+class ConversationVersionConflict(Exception):
+    """Raised when a conditional write targets an outdated conversation version."""
+    
+    def __init__(self, current_version: int):
+        super().__init__(f"Conversation is at version {current_version}")
+        self.current_version = current_version
+
+
+class ChatHistory(BaseModel):
+    """History sent to the LLM for a stored conversation."""
+    summary: Optional[str] = None
+    summarized_tokens: int = 0  # Estimated tokens of the messages the summary replaces
+    messages: List[Message]
+
+
+class CompactionSource(BaseModel):
+    """Running summary of a conversation and the messages after it."""
+    summary: Optional[str] = None
+    summary_until: int = 0
+    summarized_tokens: int = 0
+    messages: List[Message]
 
 
 class ConversationSummary(BaseModel):
@@ -37,192 +93,833 @@ class ConversationSummary(BaseModel):
     message_count: int
     created_at: str
     updated_at: str
+    preview: Optional[str] = None
+    size_bytes: int = 0
+    snippet: Optional[str] = None
 
 
 def init_conversations_db():
     """Initialize the conversations database."""
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    with _db().transaction() as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS conversations (
+                id TEXT PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                title TEXT,
+                mode TEXT,
+                messages TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS conversation_messages (
+                conversation_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT,
+                images TEXT,
+                timestamp TEXT,
+                PRIMARY KEY (conversation_id, seq)
+            ) WITHOUT ROWID
+        """)
+        
+        _add_missing_columns(cursor, [("version", "INTEGER NOT NULL DEFAULT 1")])
+        _init_summary_columns(cursor)
+        # Running summary of messages [0, context_summary_until) for the LLM context
+        _add_missing_columns(cursor, [
+            ("context_summary", "TEXT"),
+            ("context_summary_until", "INTEGER NOT NULL DEFAULT 0"),
+            ("context_summary_tokens", "INTEGER NOT NULL DEFAULT 0"),
+        ])
+        
+        if HAS_FTS5:
+            _init_search_index(cursor)
+        
+        _migrate_message_blobs(cursor)
+        _migrate_inline_images(cursor)
+        _init_image_owners(cursor)
+
+
+# Characters of the last message kept as the conversation preview
+PREVIEW_LENGTH = 120
+
+# Bytes of message content and images counted in conversations.size_bytes
+_MESSAGE_SIZE = "COALESCE(length(CAST({row}.content AS BLOB)), 0) + COALESCE(length({row}.images), 0)"
+
+_SUMMARY_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS conversation_summary_message_insert
+    AFTER INSERT ON conversation_messages BEGIN
+        UPDATE conversations SET
+            message_count = message_count + 1,
+            size_bytes = size_bytes + {_MESSAGE_SIZE.format(row="NEW")},
+            preview = CASE
+                WHEN NEW.seq >= (SELECT MAX(seq) FROM conversation_messages WHERE conversation_id = NEW.conversation_id)
+                THEN substr(NEW.content, 1, {PREVIEW_LENGTH})
+                ELSE preview
+            END
+        WHERE id = NEW.conversation_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS conversation_summary_message_update
+    AFTER UPDATE OF content, images ON conversation_messages BEGIN
+        UPDATE conversations SET
+            size_bytes = size_bytes - ({_MESSAGE_SIZE.format(row="OLD")}) + {_MESSAGE_SIZE.format(row="NEW")},
+            preview = CASE
+                WHEN NEW.seq >= (SELECT MAX(seq) FROM conversation_messages WHERE conversation_id = NEW.conversation_id)
+                THEN substr(NEW.content, 1, {PREVIEW_LENGTH})
+                ELSE preview
+            END
+        WHERE id = NEW.conversation_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS conversation_summary_message_delete
+    AFTER DELETE ON conversation_messages BEGIN
+        UPDATE conversations SET
+            message_count = message_count - 1,
+            size_bytes = size_bytes - ({_MESSAGE_SIZE.format(row="OLD")}),
+            preview = (
+                SELECT substr(content, 1, {PREVIEW_LENGTH}) FROM conversation_messages
+                WHERE conversation_id = OLD.conversation_id
+                ORDER BY seq DESC LIMIT 1
+            )
+        WHERE id = OLD.conversation_id;
+    END
+    """,
+]
+
+# Summary columns selected by listings, in ConversationSummary order
+_SUMMARY_COLUMNS = "c.id, c.title, c.mode, c.message_count, c.created_at, c.updated_at, c.preview, c.size_bytes"
+
+
+def _add_missing_columns(cursor, columns: List[tuple]) -> bool:
+    """Add (name, definition) columns missing from conversations. Returns True if any was added."""
+    cursor.execute("PRAGMA table_info(conversations)")
+    existing = {row[1] for row in cursor.fetchall()}
+    missing = [(name, definition) for name, definition in columns if name not in existing]
+    for name, definition in missing:
+        cursor.execute(f"ALTER TABLE conversations ADD COLUMN {name} {definition}")
+    return bool(missing)
+
+
+def _init_summary_columns(cursor):
+    """Add the denormalized summary columns, their triggers and the covering listing index."""
+    added = _add_missing_columns(cursor, [
+        ("message_count", "INTEGER NOT NULL DEFAULT 0"),
+        ("preview", "TEXT"),
+        ("size_bytes", "INTEGER NOT NULL DEFAULT 0"),
+    ])
+    
+    for trigger in _SUMMARY_TRIGGERS:
+        cursor.execute(trigger)
     
+    # Serves the sidebar listing from the index alone (user_id filter, updated_at order)
     cursor.execute("""
-        CREATE TABLE IF NOT EXISTS conversations (
-            id TEXT PRIMARY KEY,
-            user_id INTEGER NOT NULL,
-            title TEXT,
-            mode TEXT,
-            messages TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        CREATE INDEX IF NOT EXISTS idx_conv_user_updated ON conversations(
+            user_id, updated_at, id, title, mode, message_count, created_at, preview, size_bytes
         )
     """)
+    cursor.execute("DROP INDEX IF EXISTS idx_conv_user")
+    cursor.execute("DROP INDEX IF EXISTS idx_conv_updated")
     
-    # Create indexes
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_conv_user ON conversations(user_id)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_conv_updated ON conversations(updated_at)")
-    
-    conn.commit()
-    conn.close()
+    if not added:
+        return
+    cursor.execute(f"""
+        UPDATE conversations SET
+            message_count = (SELECT COUNT(*) FROM conversation_messages m WHERE m.conversation_id = conversations.id),
+            size_bytes = (
+                SELECT COALESCE(SUM({_MESSAGE_SIZE.format(row="m")}), 0)
+                FROM conversation_messages m WHERE m.conversation_id = conversations.id
+            ),
+            preview = (
+                SELECT substr(m.content, 1, {PREVIEW_LENGTH}) FROM conversation_messages m
+                WHERE m.conversation_id = conversations.id
+                ORDER BY m.seq DESC LIMIT 1
+            )
+    """)
 
 
-def create_conversation(user_id: int, conversation_id: str, mode: str, title: str = "Nouvelle discussion") -> Conversation:
-    """Create a new conversation."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+# Number of most recent matching documents ranked by a search; bounds the
+# cost of very common terms while rare terms are always ranked exhaustively
+SEARCH_RANK_WINDOW = 2000
+
+# Title documents use seq = -1 in conversation_search_docs
+_SEARCH_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS conversation_search_title_insert
+    AFTER INSERT ON conversations BEGIN
+        INSERT INTO conversation_search (title, owner, conversation_id)
+        VALUES (NEW.title, 'u' || NEW.user_id, NEW.id);
+        INSERT INTO conversation_search_docs (conversation_id, seq, doc_id)
+        VALUES (NEW.id, -1, last_insert_rowid());
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS conversation_search_title_update
+    AFTER UPDATE OF title ON conversations WHEN NEW.title IS NOT OLD.title BEGIN
+        UPDATE conversation_search SET title = NEW.title
+        WHERE rowid = (SELECT doc_id FROM conversation_search_docs WHERE conversation_id = NEW.id AND seq = -1);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS conversation_search_title_delete
+    AFTER DELETE ON conversations BEGIN
+        DELETE FROM conversation_search
+        WHERE rowid = (SELECT doc_id FROM conversation_search_docs WHERE conversation_id = OLD.id AND seq = -1);
+        DELETE FROM conversation_search_docs WHERE conversation_id = OLD.id AND seq = -1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS conversation_search_message_insert
+    AFTER INSERT ON conversation_messages BEGIN
+        INSERT INTO conversation_search (content, owner, conversation_id)
+        VALUES (
+            NEW.content,
+            'u' || (SELECT user_id FROM conversations WHERE id = NEW.conversation_id),
+            NEW.conversation_id
+        );
+        INSERT INTO conversation_search_docs (conversation_id, seq, doc_id)
+        VALUES (NEW.conversation_id, NEW.seq, last_insert_rowid());
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS conversation_search_message_update
+    AFTER UPDATE OF content ON conversation_messages BEGIN
+        UPDATE conversation_search SET content = NEW.content
+        WHERE rowid = (SELECT doc_id FROM conversation_search_docs WHERE conversation_id = NEW.conversation_id AND seq = NEW.seq);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS conversation_search_message_delete
+    AFTER DELETE ON conversation_messages BEGIN
+        DELETE FROM conversation_search
+        WHERE rowid = (SELECT doc_id FROM conversation_search_docs WHERE conversation_id = OLD.conversation_id AND seq = OLD.seq);
+        DELETE FROM conversation_search_docs WHERE conversation_id = OLD.conversation_id AND seq = OLD.seq;
+    END
+    """,
+]
+
+
+def _init_search_index(cursor):
+    """Create the full-text index and its triggers, indexing existing rows on first creation."""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'conversation_search'")
+    exists = cursor.fetchone() is not None
     
-    now = datetime.utcnow().isoformat()
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS conversation_search USING fts5(
+            title,
+            content,
+            owner,
+            conversation_id UNINDEXED,
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS conversation_search_docs (
+            conversation_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            doc_id INTEGER NOT NULL,
+            PRIMARY KEY (conversation_id, seq)
+        ) WITHOUT ROWID
+    """)
+    for trigger in _SEARCH_TRIGGERS:
+        cursor.execute(trigger)
     
+    if exists:
+        return
+    cursor.execute("""
+        INSERT INTO conversation_search_docs (conversation_id, seq, doc_id)
+        SELECT conversation_id, seq, ROW_NUMBER() OVER (ORDER BY conversation_id, seq)
+        FROM (
+            SELECT id AS conversation_id, -1 AS seq FROM conversations
+            UNION ALL
+            SELECT conversation_id, seq FROM conversation_messages
+        )
+    """)
     cursor.execute("""
-        INSERT INTO conversations (id, user_id, title, mode, messages, created_at, updated_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (conversation_id, user_id, title, mode, json.dumps([]), now, now))
-    
-    conn.commit()
-    conn.close()
-    
-    return Conversation(
-        id=conversation_id,
-        user_id=user_id,
-        title=title,
-        mode=mode,
-        messages=[],
-        created_at=now,
-        updated_at=now
+        INSERT INTO conversation_search (rowid, title, content, owner, conversation_id)
+        SELECT d.doc_id,
+               CASE WHEN d.seq = -1 THEN c.title END,
+               m.content,
+               'u' || c.user_id,
+               d.conversation_id
+        FROM conversation_search_docs d
+        JOIN conversations c ON c.id = d.conversation_id
+        LEFT JOIN conversation_messages m ON m.conversation_id = d.conversation_id AND m.seq = d.seq
+    """)
+
+
+def _migrate_message_blobs(cursor):
+    """Move messages still stored in the legacy JSON column into conversation_messages."""
+    cursor.execute("""
+        SELECT id, messages FROM conversations
+        WHERE messages IS NOT NULL AND messages != '[]'
+    """)
+    for conversation_id, messages_json in cursor.fetchall():
+        try:
+            messages = json.loads(messages_json)
+        except ValueError:
+            messages = []
+        cursor.execute("DELETE FROM conversation_messages WHERE conversation_id = ?", (conversation_id,))
+        _insert_messages(cursor, conversation_id, 0, messages)
+        cursor.execute("UPDATE conversations SET messages = NULL WHERE id = ?", (conversation_id,))
+
+
+def _init_image_owners(cursor):
+    """Create image_owners, filled the first time from the images of existing conversations."""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'image_owners'")
+    if cursor.fetchone() is not None:
+        return
+    cursor.execute("""
+        CREATE TABLE image_owners (
+            digest TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            PRIMARY KEY (digest, user_id)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        INSERT OR IGNORE INTO image_owners (digest, user_id)
+        SELECT j.value, c.user_id
+        FROM conversation_messages m
+        JOIN conversations c ON c.id = m.conversation_id, json_each(m.images) j
+        WHERE m.images IS NOT NULL AND length(j.value) = 64
+    """)
+
+
+def _add_image_owners(cursor, user_id: int, digests: set):
+    cursor.executemany(
+        "INSERT OR IGNORE INTO image_owners (digest, user_id) VALUES (?, ?)",
+        [(digest, user_id) for digest in digests]
     )
 
 
+def add_image_owner(digest: str, user_id: int):
+    """Let a user read an image (its uploader)."""
+    with _db().transaction() as conn:
+        _add_image_owners(conn.cursor(), user_id, {digest})
+
+
+def can_read_image(digest: str, user_id: int) -> bool:
+    """Whether the user uploaded the image or has a conversation referencing it."""
+    cursor = _db().connection().cursor()
+    cursor.execute("SELECT 1 FROM image_owners WHERE digest = ? AND user_id = ?", (digest, user_id))
+    return cursor.fetchone() is not None
+
+
+def unreadable_images(images: List[str], user_id: Optional[int]) -> List[str]:
+    """
+    Digests among images that the user may not read: uploaded by someone
+    else, or unknown (all of them without a user). Inline images are not
+    checked.
+    """
+    digests = {image for image in images if is_image_ref(image)}
+    if not digests:
+        return []
+    if user_id is None:
+        return sorted(digests)
+    cursor = _db().connection().cursor()
+    cursor.execute(
+        f"SELECT digest FROM image_owners WHERE user_id = ? AND digest IN ({', '.join('?' * len(digests))})",
+        (user_id, *digests)
+    )
+    return sorted(digests - {row[0] for row in cursor.fetchall()})
+
+
+# PRAGMA user_version once the inline images have been moved to the image store
+_INLINE_IMAGES_MIGRATED = 1
+
+
+def _migrate_inline_images(cursor):
+    """
+    Move base64 images still stored inline in messages into the image store.
+    Runs once: messages are saved with digests since, so later startups
+    skip the scan of every image row.
+    """
+    cursor.execute("PRAGMA user_version")
+    if cursor.fetchone()[0] >= _INLINE_IMAGES_MIGRATED:
+        return
+    cursor.execute("SELECT conversation_id, seq, images FROM conversation_messages WHERE images IS NOT NULL")
+    updates = []
+    for conversation_id, seq, images_json in cursor.fetchall():
+        images = json.loads(images_json)
+        if all(is_image_ref(image) for image in images):
+            continue
+        updates.append((json.dumps(image_store.intern(images)), conversation_id, seq))
+    cursor.executemany("UPDATE conversation_messages SET images = ? WHERE conversation_id = ? AND seq = ?", updates)
+    cursor.execute(f"PRAGMA user_version = {_INLINE_IMAGES_MIGRATED}")
+
+
+def _message_row(conversation_id: str, seq: int, message: dict, inline_digests: Optional[set] = None) -> tuple:
+    """Row of a message; digests of the inline images it stored are added to inline_digests."""
+    images = image_store.intern(message.get("images"))
+    if inline_digests is not None and images:
+        inline_digests.update(new for old, new in zip(message["images"], images) if new != old)
+    return (
+        conversation_id,
+        seq,
+        message.get("role"),
+        message.get("content"),
+        json.dumps(images) if images else None,
+        message.get("timestamp")
+    )
+
+
+def _insert_rows(cursor, rows: List[tuple]):
+    cursor.executemany("""
+        INSERT INTO conversation_messages (conversation_id, seq, role, content, images, timestamp)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, rows)
+
+
+def _insert_messages(cursor, conversation_id: str, first_seq: int, messages: List[dict], inline_digests: Optional[set] = None):
+    _insert_rows(cursor, [_message_row(conversation_id, first_seq + i, m, inline_digests) for i, m in enumerate(messages)])
+
+
+def _row_to_message(row) -> Message:
+    """Build a Message from (role, content, images, timestamp) columns."""
+    return Message(
+        role=row[0],
+        content=row[1] or "",
+        images=json.loads(row[2]) if row[2] else None,
+        timestamp=row[3]
+    )
+
+
+def _load_messages(cursor, conversation_id: str) -> List[Message]:
+    cursor.execute("""
+        SELECT role, content, images, timestamp
+        FROM conversation_messages
+        WHERE conversation_id = ?
+        ORDER BY seq
+    """, (conversation_id,))
+    return [_row_to_message(row) for row in cursor.fetchall()]
+
+
+def create_conversation(user_id: int, conversation_id: str, mode: str, title: str = "Nouvelle discussion") -> Conversation:
+    """Create a new conversation."""
+    with _db().transaction() as conn:
+        cursor = conn.cursor()
+        
+        now = datetime.utcnow().isoformat()
+        
+        cursor.execute("""
+            INSERT INTO conversations (id, user_id, title, mode, messages, created_at, updated_at)
+            VALUES (?, ?, ?, ?, NULL, ?, ?)
+        """, (conversation_id, user_id, title, mode, now, now))
+        
+        return Conversation(
+            id=conversation_id,
+            user_id=user_id,
+            title=title,
+            mode=mode,
+            messages=[],
+            created_at=now,
+            updated_at=now
+        )
+
+
 def get_conversation(conversation_id: str, user_id: int) -> Optional[Conversation]:
     """Get a conversation by ID, ensuring it belongs to the user."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    cursor = _db().connection().cursor()
     
     cursor.execute("""
-        SELECT id, user_id, title, mode, messages, created_at, updated_at
+        SELECT id, user_id, title, mode, created_at, updated_at, version
         FROM conversations
         WHERE id = ? AND user_id = ?
     """, (conversation_id, user_id))
     
     row = cursor.fetchone()
-    conn.close()
+    messages = _load_messages(cursor, conversation_id) if row else []
     
     if row:
-        messages_raw = json.loads(row[4])
-        messages = [Message(**m) for m in messages_raw]
         return Conversation(
             id=row[0],
             user_id=row[1],
             title=row[2],
             mode=row[3],
             messages=messages,
-            created_at=row[5],
-            updated_at=row[6]
+            created_at=row[4],
+            updated_at=row[5],
+            version=row[6]
         )
     return None
 
 
-def get_user_conversations(user_id: int, limit: int = 50) -> List[ConversationSummary]:
-    """Get all conversations for a user."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+def get_chat_history(conversation_id: str, user_id: int, last: int) -> Optional[ChatHistory]:
+    """
+    Get what the LLM history window can use, without loading the rest: the
+    running summary and the `last` most recent messages after it, or the
+    first message and the `last` most recent ones when there is no summary.
+    Returns None if the conversation does not exist.
+    """
+    cursor = _db().connection().cursor()
+    cursor.execute("""
+        SELECT message_count, context_summary, context_summary_until, context_summary_tokens
+        FROM conversations WHERE id = ? AND user_id = ?
+    """, (conversation_id, user_id))
+    row = cursor.fetchone()
+    if row is None:
+        return None
     
+    message_count, summary, summary_until, summarized_tokens = row
+    if summary:
+        cursor.execute("""
+            SELECT role, content, images, timestamp FROM conversation_messages
+            WHERE conversation_id = ? AND seq >= ?
+            ORDER BY seq
+        """, (conversation_id, max(summary_until, message_count - last)))
+    else:
+        cursor.execute("""
+            SELECT role, content, images, timestamp FROM conversation_messages
+            WHERE conversation_id = ? AND (seq = 0 OR seq >= ?)
+            ORDER BY seq
+        """, (conversation_id, message_count - last))
+    return ChatHistory(
+        summary=summary,
+        summarized_tokens=summarized_tokens if summary else 0,
+        messages=[_row_to_message(r) for r in cursor.fetchall()]
+    )
+
+
+def get_compaction_source(conversation_id: str) -> Optional[CompactionSource]:
+    """Get the running summary of a conversation and the messages it does not cover yet."""
+    cursor = _db().connection().cursor()
     cursor.execute("""
-        SELECT id, title, mode, messages, created_at, updated_at
-        FROM conversations
-        WHERE user_id = ?
-        ORDER BY updated_at DESC
-        LIMIT ?
-    """, (user_id, limit))
+        SELECT context_summary, context_summary_until, context_summary_tokens
+        FROM conversations WHERE id = ?
+    """, (conversation_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
     
-    rows = cursor.fetchall()
-    conn.close()
+    cursor.execute("""
+        SELECT role, content, images, timestamp FROM conversation_messages
+        WHERE conversation_id = ? AND seq >= ?
+        ORDER BY seq
+    """, (conversation_id, row[1]))
+    return CompactionSource(
+        summary=row[0],
+        summary_until=row[1],
+        summarized_tokens=row[2],
+        messages=[_row_to_message(r) for r in cursor.fetchall()]
+    )
+
+
+def save_context_summary(
+    conversation_id: str,
+    summary: str,
+    summary_until: int,
+    summarized_tokens: int,
+    expected_until: int,
+    folded: List[Message]
+) -> bool:
+    """
+    Store a new running summary covering the messages before summary_until.
+    Not saved (returns False) if the summary or the folded messages changed
+    while it was being generated.
+    """
+    with _db().transaction() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT role, content FROM conversation_messages
+            WHERE conversation_id = ? AND seq >= ? AND seq < ?
+            ORDER BY seq
+        """, (conversation_id, expected_until, summary_until))
+        if cursor.fetchall() != [(m.role, m.content) for m in folded]:
+            return False
+        
+        cursor.execute("""
+            UPDATE conversations
+            SET context_summary = ?, context_summary_until = ?, context_summary_tokens = ?
+            WHERE id = ? AND context_summary_until = ?
+        """, (summary, summary_until, summarized_tokens, conversation_id, expected_until))
+        return cursor.rowcount == 1
+
+
+def get_conversation_version(conversation_id: str, user_id: int) -> Optional[int]:
+    """Get the current version of a conversation without loading its messages."""
+    cursor = _db().connection().cursor()
+    cursor.execute("SELECT version FROM conversations WHERE id = ? AND user_id = ?", (conversation_id, user_id))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def get_user_conversations(user_id: int, limit: int = 50, before: Optional[tuple] = None) -> List[ConversationSummary]:
+    """
+    Get a user's conversations, most recently updated first.
+    `before` is the (updated_at, id) of the last conversation of the previous page.
+    """
+    cursor = _db().connection().cursor()
     
-    summaries = []
-    for row in rows:
-        messages = json.loads(row[3])
-        summaries.append(ConversationSummary(
-            id=row[0],
-            title=row[1],
-            mode=row[2],
-            message_count=len(messages),
-            created_at=row[4],
-            updated_at=row[5]
-        ))
+    query = f"SELECT {_SUMMARY_COLUMNS} FROM conversations c WHERE c.user_id = ?"
+    params = [user_id]
+    
+    if before:
+        query += " AND (c.updated_at, c.id) < (?, ?)"
+        params.extend(before)
     
-    return summaries
+    query += " ORDER BY c.updated_at DESC, c.id DESC LIMIT ?"
+    params.append(limit)
+    
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+    
+    return [_row_to_summary(row) for row in rows]
 
 
-def update_conversation(conversation_id: str, user_id: int, messages: List[dict], title: Optional[str] = None) -> bool:
-    """Update a conversation's messages and optionally its title."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
+def count_user_conversations(user_id: int) -> int:
+    """Count a user's conversations (read from the listing index)."""
+    cursor = _db().connection().cursor()
+    cursor.execute("SELECT COUNT(*) FROM conversations WHERE user_id = ?", (user_id,))
+    return cursor.fetchone()[0]
+
+
+def _row_to_summary(row) -> ConversationSummary:
+    return ConversationSummary(
+        id=row[0],
+        title=row[1],
+        mode=row[2],
+        message_count=row[3],
+        created_at=row[4],
+        updated_at=row[5],
+        preview=row[6],
+        size_bytes=row[7],
+        snippet=row[8] if len(row) > 8 else None
+    )
+
+
+def _touch_conversation(
+    cursor,
+    conversation_id: str,
+    user_id: int,
+    title: Optional[str],
+    expected_versions: Optional[List[int]] = None
+) -> Optional[tuple]:
+    """
+    Bump updated_at and version (and the title if given) in a single
+    conditional UPDATE ... RETURNING. Returns (title, mode, created_at,
+    updated_at, version), or None if the conversation is not the user's.
+    Raises ConversationVersionConflict if the version is not one of
+    expected_versions.
+    """
     now = datetime.utcnow().isoformat()
+    query = """
+        UPDATE conversations
+        SET title = COALESCE(?, title), updated_at = ?, version = version + 1
+        WHERE id = ? AND user_id = ?
+    """
+    params = [title or None, now, conversation_id, user_id]
+    if expected_versions is not None:
+        query += f" AND version IN ({', '.join('?' * len(expected_versions))})"
+        params.extend(expected_versions)
+    cursor.execute(query + " RETURNING title, mode, created_at, updated_at, version", params)
+    row = cursor.fetchone()
     
-    if title:
+    if row is None and expected_versions is not None:
+        cursor.execute("SELECT version FROM conversations WHERE id = ? AND user_id = ?", (conversation_id, user_id))
+        current = cursor.fetchone()
+        if current:
+            raise ConversationVersionConflict(current[0])
+    return row
+
+
+def append_messages(
+    conversation_id: str,
+    user_id: int,
+    messages: List[dict],
+    title: Optional[str] = None,
+    expected_versions: Optional[List[int]] = None
+) -> Optional[Tuple[int, int]]:
+    """
+    Append new messages to a conversation without touching existing ones.
+    Returns (message_count, version), or None if the conversation does not exist.
+    """
+    with _db().transaction() as conn:
+        cursor = conn.cursor()
+        
+        touched = _touch_conversation(cursor, conversation_id, user_id, title, expected_versions)
+        if touched is None:
+            return None
+        
         cursor.execute("""
-            UPDATE conversations
-            SET messages = ?, title = ?, updated_at = ?
-            WHERE id = ? AND user_id = ?
-        """, (json.dumps(messages), title, now, conversation_id, user_id))
-    else:
+            SELECT COALESCE(MAX(seq) + 1, 0) FROM conversation_messages WHERE conversation_id = ?
+        """, (conversation_id,))
+        next_seq = cursor.fetchone()[0]
+        inline_digests = set()
+        _insert_messages(cursor, conversation_id, next_seq, messages, inline_digests)
+        _add_image_owners(cursor, user_id, inline_digests)
+        
+        return next_seq + len(messages), touched[4]
+
+
+def update_conversation(
+    conversation_id: str,
+    user_id: int,
+    messages: List[dict],
+    title: Optional[str] = None,
+    expected_versions: Optional[List[int]] = None
+) -> Optional[Conversation]:
+    """
+    Replace a conversation's messages and optionally its title.
+    Only rows after the first differing message are rewritten, so the usual
+    "full history + one new turn" save inserts just the new turn.
+    Returns the saved conversation (built from the given messages, without
+    reading them back), or None if it does not exist.
+    """
+    with _db().transaction() as conn:
+        cursor = conn.cursor()
+        
+        touched = _touch_conversation(cursor, conversation_id, user_id, title, expected_versions)
+        if touched is None:
+            return None
+        
         cursor.execute("""
-            UPDATE conversations
-            SET messages = ?, updated_at = ?
-            WHERE id = ? AND user_id = ?
-        """, (json.dumps(messages), now, conversation_id, user_id))
-    
-    updated = cursor.rowcount > 0
-    conn.commit()
-    conn.close()
-    
-    return updated
+            SELECT seq, role, content, images, timestamp
+            FROM conversation_messages
+            WHERE conversation_id = ?
+            ORDER BY seq
+        """, (conversation_id,))
+        stored = [row[1:] for row in cursor.fetchall()]
+        inline_digests = set()
+        rows = [_message_row(conversation_id, i, m, inline_digests) for i, m in enumerate(messages)]
+        _add_image_owners(cursor, user_id, inline_digests)
+        
+        common = 0
+        for old, new in zip(stored, rows):
+            if old != new[2:]:
+                break
+            common += 1
+        
+        if common < len(stored):
+            cursor.execute("""
+                DELETE FROM conversation_messages WHERE conversation_id = ? AND seq >= ?
+            """, (conversation_id, common))
+            # The running summary no longer matches rewritten messages
+            cursor.execute("""
+                UPDATE conversations
+                SET context_summary = NULL, context_summary_until = 0, context_summary_tokens = 0
+                WHERE id = ? AND context_summary_until > ?
+            """, (conversation_id, common))
+        _insert_rows(cursor, rows[common:])
+        
+        return Conversation(
+            id=conversation_id,
+            user_id=user_id,
+            title=touched[0],
+            mode=touched[1],
+            messages=[_row_to_message(row[2:]) for row in rows],
+            created_at=touched[2],
+            updated_at=touched[3],
+            version=touched[4]
+        )
 
 
 def delete_conversation(conversation_id: str, user_id: int) -> bool:
     """Delete a conversation."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    with _db().transaction() as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            DELETE FROM conversations
+            WHERE id = ? AND user_id = ?
+        """, (conversation_id, user_id))
+        
+        deleted = cursor.rowcount > 0
+        if deleted:
+            cursor.execute("DELETE FROM conversation_messages WHERE conversation_id = ?", (conversation_id,))
+        
+        return deleted
+
+
+def _match_expression(user_id: int, query: str) -> Optional[str]:
+    """
+    Build an FTS5 query from free text: every word must match (the last one
+    as a prefix) in a title or message of the user's conversations.
+    """
+    terms = re.findall(r"\w+", query)
+    if not terms:
+        return None
+    phrases = [f'"{term}"' for term in terms]
+    phrases[-1] += "*"
+    return f'owner:u{int(user_id)} AND {{title content}}: ({" ".join(phrases)})'
+
+
+def search_conversations(user_id: int, query: str, limit: int = 20) -> List[ConversationSummary]:
+    """
+    Search conversations by title or content, best matches first (bm25, a
+    title hit weighing twice a message hit, over the SEARCH_RANK_WINDOW most
+    recent matching documents). Each result carries a snippet of its best
+    matching document with the terms wrapped in <mark></mark>.
+    """
+    if not HAS_FTS5:
+        return _search_conversations_like(user_id, query, limit)
     
-    cursor.execute("""
-        DELETE FROM conversations
-        WHERE id = ? AND user_id = ?
-    """, (conversation_id, user_id))
+    match = _match_expression(user_id, query)
+    if match is None:
+        return []
+    
+    cursor = _db().connection().cursor()
+    
+    # Rank the most recent matching documents (rowids grow with inserts, and
+    # FTS5 can walk them newest first and stop early), then keep the best
+    # document and its snippet per conversation
+    cursor.execute(f"""
+        WITH hits AS MATERIALIZED (
+            SELECT conversation_id,
+                   bm25(conversation_search, 2.0, 1.0) AS score,
+                   CASE WHEN content IS NULL
+                        THEN snippet(conversation_search, 0, '<mark>', '</mark>', '…', 12)
+                        ELSE snippet(conversation_search, 1, '<mark>', '</mark>', '…', 12)
+                   END AS snippet
+            FROM conversation_search
+            WHERE conversation_search MATCH ?
+            ORDER BY rowid DESC
+            LIMIT ?
+        ),
+        best AS (
+            SELECT conversation_id, MIN(score) AS score, snippet
+            FROM hits
+            GROUP BY conversation_id
+        )
+        SELECT {_SUMMARY_COLUMNS}, best.snippet
+        FROM best
+        JOIN conversations c ON c.id = best.conversation_id
+        WHERE c.user_id = ?
+        ORDER BY best.score
+        LIMIT ?
+    """, (match, SEARCH_RANK_WINDOW, user_id, limit))
     
-    deleted = cursor.rowcount > 0
-    conn.commit()
-    conn.close()
+    rows = cursor.fetchall()
     
-    return deleted
+    return [_row_to_summary(row) for row in rows]
 
 
-def search_conversations(user_id: int, query: str, limit: int = 20) -> List[ConversationSummary]:
-    """Search conversations by title or content."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+def _search_conversations_like(user_id: int, query: str, limit: int) -> List[ConversationSummary]:
+    """Substring search used when SQLite is built without FTS5."""
+    cursor = _db().connection().cursor()
     
-    # Search in title and messages content
-    cursor.execute("""
-        SELECT id, title, mode, messages, created_at, updated_at
-        FROM conversations
-        WHERE user_id = ? AND (title LIKE ? OR messages LIKE ?)
-        ORDER BY updated_at DESC
+    # Search in title and message contents
+    cursor.execute(f"""
+        SELECT {_SUMMARY_COLUMNS}
+        FROM conversations c
+        WHERE c.user_id = ? AND (
+            c.title LIKE ? OR EXISTS (
+                SELECT 1 FROM conversation_messages m
+                WHERE m.conversation_id = c.id AND m.content LIKE ?
+            )
+        )
+        ORDER BY c.updated_at DESC
         LIMIT ?
     """, (user_id, f"%{query}%", f"%{query}%", limit))
     
     rows = cursor.fetchall()
-    conn.close()
-    
-    summaries = []
-    for row in rows:
-        messages = json.loads(row[3])
-        summaries.append(ConversationSummary(
-            id=row[0],
-            title=row[1],
-            mode=row[2],
-            message_count=len(messages),
-            created_at=row[4],
-            updated_at=row[5]
-        ))
     
-    return summaries
+    return [_row_to_summary(row) for row in rows]
 
@@ -0,0 +1,124 @@
+"""
+Content-addressed store for chat images.
+
+Images are uploaded once and saved under their SHA-256 digest
+(<root>/<2 first hex chars>/<digest>), so identical images are stored once
+and messages only carry the 64-character digest. The bytes are read back
+only when a request to the LLM is built.
+
+Message image lists may still contain inline base64 from older clients:
+intern() moves those into the store, resolve() turns digests back into the
+base64 the LLM expects.
+"""
+import base64
+import binascii
+import hashlib
+import logging
+import os
+import re
+import uuid
+from typing import List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger("image_store")
+
+_DIGEST = re.compile(r"^[0-9a-f]{64}$")
+
+# Leading bytes of the accepted image formats
+_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+]
+
+
+def is_image_ref(value: str) -> bool:
+    """True if the value is a store digest rather than inline image data."""
+    return bool(_DIGEST.match(value))
+
+
+def sniff_media_type(data: bytes) -> Optional[str]:
+    """Media type of image bytes, None if the format is not supported."""
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, media_type in _SIGNATURES:
+        if data.startswith(signature):
+            return media_type
+    return None
+
+
+class ImageTooLarge(ValueError):
+    """Raised when an image exceeds the store's size cap."""
+
+
+class ImageStore:
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def path(self, digest: str) -> Optional[str]:
+        """Path of a stored image, None if the digest is invalid or unknown."""
+        if not is_image_ref(digest):
+            return None
+        path = os.path.join(self.root, digest[:2], digest)
+        return path if os.path.exists(path) else None
+
+    def put(self, data: bytes) -> str:
+        """Store image bytes (once per content) and return their digest."""
+        if len(data) > self.max_bytes:
+            raise ImageTooLarge(f"Image de {len(data)} octets, maximum {self.max_bytes}")
+
+        digest = hashlib.sha256(data).hexdigest()
+        if self.path(digest):
+            return digest
+
+        directory = os.path.join(self.root, digest[:2])
+        os.makedirs(directory, exist_ok=True)
+        # Write then rename so concurrent readers never see a partial file
+        tmp_path = os.path.join(directory, f".{digest}.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, os.path.join(directory, digest))
+        return digest
+
+    def read(self, digest: str) -> Optional[bytes]:
+        path = self.path(digest)
+        if path is None:
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    def intern(self, images: Optional[List[str]]) -> Optional[List[str]]:
+        """Replace inline base64 images by their digest, storing them."""
+        if not images:
+            return images
+        interned = []
+        for image in images:
+            if not is_image_ref(image):
+                try:
+                    image = self.put(base64.b64decode(image, validate=True))
+                except (binascii.Error, ValueError) as e:
+                    logger.warning(f"Keeping inline image that could not be stored: {e}")
+            interned.append(image)
+        return interned
+
+    def resolve(self, images: Optional[List[str]]) -> List[str]:
+        """Turn digests back into base64 (inline images pass through, unknown digests are dropped)."""
+        resolved = []
+        for image in images or []:
+            if not is_image_ref(image):
+                resolved.append(image)
+                continue
+            data = self.read(image)
+            if data is None:
+                logger.warning(f"Image {image} not found in the store")
+                continue
+            resolved.append(base64.b64encode(data).decode("ascii"))
+        return resolved
+
+
+# Global instance
+image_store = ImageStore(settings.IMAGE_STORE_DIR, settings.IMAGE_MAX_BYTES)
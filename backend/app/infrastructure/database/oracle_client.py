@@ -5,17 +5,119 @@ except ImportError:
     HAS_ORACLE = False
     oracledb = None
 
+import asyncio
 import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 from app.core.config import settings
+from app.core.metrics import record_pool_acquire, record_pool_stats
 
 logger = logging.getLogger("database")
 
+# Tag of the pooled sessions set up by _init_session: the pool runs the
+# callback only for sessions that do not carry it yet
+SESSION_TAG = "PSTRAL_SESSION=1"
+
+if HAS_ORACLE:
+    # Converted to VARCHAR2 by the database (no session format involved)
+    _STRING_FETCH_TYPES = {
+        oracledb.DB_TYPE_INTERVAL_DS,
+        oracledb.DB_TYPE_INTERVAL_YM,
+        oracledb.DB_TYPE_RAW,
+        oracledb.DB_TYPE_ROWID,
+        oracledb.DB_TYPE_UROWID,
+    }
+    # Fetched as datetime, then formatted like str(datetime)
+    _DATETIME_FETCH_TYPES = {
+        oracledb.DB_TYPE_DATE: "seconds",
+        oracledb.DB_TYPE_TIMESTAMP: "microseconds",
+        oracledb.DB_TYPE_TIMESTAMP_TZ: "microseconds",
+        oracledb.DB_TYPE_TIMESTAMP_LTZ: "microseconds",
+    }
+    # Fetched as str/int/float/bool once output_type_handler is installed
+    _JSON_READY_TYPES = _STRING_FETCH_TYPES | set(_DATETIME_FETCH_TYPES) | {
+        oracledb.DB_TYPE_VARCHAR,
+        oracledb.DB_TYPE_NVARCHAR,
+        oracledb.DB_TYPE_CHAR,
+        oracledb.DB_TYPE_NCHAR,
+        oracledb.DB_TYPE_LONG,
+        oracledb.DB_TYPE_LONG_NVARCHAR,
+        oracledb.DB_TYPE_CLOB,
+        oracledb.DB_TYPE_NCLOB,
+        oracledb.DB_TYPE_BLOB,
+        oracledb.DB_TYPE_NUMBER,
+        oracledb.DB_TYPE_BINARY_INTEGER,
+        oracledb.DB_TYPE_BINARY_FLOAT,
+        oracledb.DB_TYPE_BINARY_DOUBLE,
+        oracledb.DB_TYPE_BOOLEAN,
+    }
+else:
+    _STRING_FETCH_TYPES = set()
+    _DATETIME_FETCH_TYPES = {}
+    _JSON_READY_TYPES = set()
+
+
+def _datetime_formatter(timespec: str) -> Callable[[Any], str]:
+    return lambda value: value.isoformat(" ", timespec)
+
+
+def output_type_handler(cursor, metadata):
+    """
+    Fetch non-JSON types in a JSON-ready form directly from the driver.
+    NUMBER is left alone: the driver already returns int/float. Dates are
+    formatted here rather than by NLS session settings, which would change
+    the meaning of the user's own TO_CHAR/TO_DATE calls.
+    """
+    type_code = metadata.type_code
+    if type_code in _DATETIME_FETCH_TYPES:
+        return cursor.var(
+            type_code,
+            arraysize=cursor.arraysize,
+            outconverter=_datetime_formatter(_DATETIME_FETCH_TYPES[type_code])
+        )
+    if type_code in _STRING_FETCH_TYPES:
+        return cursor.var(oracledb.DB_TYPE_VARCHAR, arraysize=cursor.arraysize)
+    if type_code is oracledb.DB_TYPE_CLOB:
+        return cursor.var(oracledb.DB_TYPE_LONG, arraysize=cursor.arraysize)
+    if type_code is oracledb.DB_TYPE_NCLOB:
+        return cursor.var(oracledb.DB_TYPE_LONG_NVARCHAR, arraysize=cursor.arraysize)
+    if type_code is oracledb.DB_TYPE_BLOB:
+        return cursor.var(oracledb.DB_TYPE_LONG_RAW, arraysize=cursor.arraysize, outconverter=bytes.hex)
+    return None
+
+
+def json_ready_columns(description) -> List[bool]:
+    """
+    Whether each column of cursor.description is fetched JSON-ready; the
+    other columns (LONG RAW, objects, vectors...) are converted with str().
+    """
+    return [column[1] in _JSON_READY_TYPES for column in description or []]
+
+
+def _init_session(connection, requested_tag):
+    """
+    Pool session callback: runs once per new database session. It leaves the
+    session settings (NLS formats included) at the database defaults.
+    """
+    connection.stmtcachesize = settings.ORACLE_STMT_CACHE_SIZE
+    connection.tag = SESSION_TAG
+
+
 class OracleClient:
     def __init__(self):
         self.user = settings.ORACLE_USER
         self.password = settings.ORACLE_PASSWORD
         self.dsn = settings.ORACLE_DSN
         self.pool = None
+        # Adaptive pool sizing state
+        self.base_max = max(settings.ORACLE_POOL_MAX, settings.ORACLE_POOL_MIN)
+        self.ceiling = max(settings.ORACLE_POOL_CEILING, self.base_max)
+        self.max_size = self.base_max
+        self._waiting = 0
+        self._last_pressure = time.monotonic()
+        self._lock = threading.Lock()
 
     async def connect(self):
         if not HAS_ORACLE:
@@ -27,10 +129,15 @@ class OracleClient:
                 user=self.user,
                 password=self.password,
                 dsn=self.dsn,
-                min=1,
-                max=5,
-                increment=1
+                min=settings.ORACLE_POOL_MIN,
+                max=self.base_max,
+                increment=settings.ORACLE_POOL_INCREMENT,
+                timeout=settings.ORACLE_POOL_IDLE_TIMEOUT,
+                stmtcachesize=settings.ORACLE_STMT_CACHE_SIZE,
+                session_callback=_init_session
             )
+            self.max_size = self.base_max
+            self._publish_stats()
             logger.info("Oracle Database connection pool established.")
         except Exception as e:
             logger.error(f"Failed to connect to Oracle Database: {e}")
@@ -40,20 +147,165 @@ class OracleClient:
             self.pool.close()
             logger.info("Oracle Database connection pool closed.")
 
+    # --- Pool observability and adaptive sizing ---
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Snapshot of the pool state, used by /health."""
+        if not self.pool:
+            return {"open": 0, "busy": 0, "waiting": 0, "max": 0, "ceiling": self.ceiling, "saturation": 0.0}
+        busy = self.pool.busy
+        return {
+            "open": self.pool.opened,
+            "busy": busy,
+            "waiting": self._waiting,
+            "max": self.max_size,
+            "ceiling": self.ceiling,
+            "saturation": round(busy / self.max_size, 2) if self.max_size else 0.0
+        }
+
+    def _publish_stats(self):
+        if self.pool:
+            record_pool_stats("oracle", self.pool.opened, self.pool.busy, self._waiting, self.max_size)
+
+    def _resize(self, new_max: int):
+        try:
+            self.pool.reconfigure(max=new_max)
+            logger.info(f"Oracle pool max resized from {self.max_size} to {new_max}")
+            self.max_size = new_max
+        except Exception as e:
+            logger.warning(f"Failed to resize Oracle pool: {e}")
+
+    def _grow_if_starved(self, wait_seconds: float):
+        """Grow towards the ceiling when acquisitions wait too long."""
+        if wait_seconds * 1000 < settings.ORACLE_POOL_GROW_WAIT_MS:
+            return
+        with self._lock:
+            self._last_pressure = time.monotonic()
+            if self.max_size < self.ceiling:
+                self._resize(min(self.ceiling, self.max_size + settings.ORACLE_POOL_INCREMENT))
+
+    def shrink_if_idle(self):
+        """Step back towards the configured max once the pool has been quiet."""
+        if not self.pool:
+            return
+        with self._lock:
+            if self._waiting or self.pool.busy >= self.max_size:
+                self._last_pressure = time.monotonic()
+                return
+            idle_for = time.monotonic() - self._last_pressure
+            if self.max_size > self.base_max and idle_for >= settings.ORACLE_POOL_IDLE_SHRINK_SECONDS:
+                self._resize(max(self.base_max, self.max_size - settings.ORACLE_POOL_INCREMENT))
+                self._last_pressure = time.monotonic()
+
+    async def run_pool_monitor(self, interval_seconds: float = 5.0):
+        """Refresh pool gauges and apply the idle shrink policy periodically."""
+        while True:
+            try:
+                self.shrink_if_idle()
+                self._publish_stats()
+            except Exception as e:
+                logger.error(f"Oracle pool monitor failed: {e}")
+            await asyncio.sleep(interval_seconds)
+
+    @contextmanager
+    def acquire(self):
+        """Acquire a pooled connection, measuring the wait."""
+        with self._lock:
+            self._waiting += 1
+        start = time.perf_counter()
+        try:
+            connection = self.pool.acquire(tag=SESSION_TAG)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+        wait_seconds = time.perf_counter() - start
+        record_pool_acquire("oracle", wait_seconds)
+        self._grow_if_starved(wait_seconds)
+        self._publish_stats()
+        try:
+            yield connection
+        finally:
+            self.pool.release(connection)
+            self._publish_stats()
+
+    def _prepare_cursor(self, cursor, max_rows: Optional[int] = None):
+        cursor.outputtypehandler = output_type_handler
+        if max_rows:
+            # Fetch the requested rows in a single round-trip
+            cursor.arraysize = max(1, min(max_rows, settings.ORACLE_FETCH_ARRAYSIZE))
+            cursor.prefetchrows = cursor.arraysize + 1
+
+    def fetch(
+        self,
+        sql: str,
+        max_rows: int = 100,
+        binds: Optional[Dict[str, Any]] = None
+    ) -> Tuple[List[str], List[tuple], List[bool]]:
+        """
+        Execute a query and return (column names, rows as tuples, whether
+        each column is JSON-ready). Most values are already JSON-ready
+        thanks to the output type handler.
+        Blocking: call from a worker thread in async code.
+        """
+        if not self.pool:
+            raise Exception("Database not connected")
+
+        with self.acquire() as connection:
+            with connection.cursor() as cursor:
+                self._prepare_cursor(cursor, max_rows)
+                cursor.execute(sql, binds or {})
+                columns = [col[0] for col in cursor.description] if cursor.description else []
+                rows = cursor.fetchmany(max_rows)
+                return columns, rows, json_ready_columns(cursor.description)
+
+    def stream(
+        self,
+        sql: str,
+        max_rows: int,
+        binds: Optional[Dict[str, Any]] = None,
+        on_connection: Optional[Callable[[Any], None]] = None
+    ) -> Iterator[Any]:
+        """
+        Execute a query and yield the column names, then batches of rows.
+        on_connection receives the acquired connection so that a caller in
+        another thread can interrupt the query with connection.cancel().
+        Blocking: iterate from a worker thread.
+        """
+        if not self.pool:
+            raise Exception("Database not connected")
+
+        with self.acquire() as connection:
+            if on_connection:
+                on_connection(connection)
+            with connection.cursor() as cursor:
+                self._prepare_cursor(cursor, max_rows)
+                cursor.execute(sql, binds or {})
+                yield [col[0] for col in cursor.description] if cursor.description else []
+
+                remaining = max_rows
+                while remaining > 0:
+                    batch = cursor.fetchmany(min(cursor.arraysize, remaining))
+                    if not batch:
+                        break
+                    remaining -= len(batch)
+                    yield batch
+
     def run_query(self, sql: str):
         if not HAS_ORACLE:
             return [{"mock_column": "Database Driver Missing - Mock Data"}]
 
         if not self.pool:
             raise Exception("Database not connected")
-        
-        with self.pool.acquire() as connection:
+
+        with self.acquire() as connection:
             with connection.cursor() as cursor:
+                self._prepare_cursor(cursor)
                 cursor.execute(sql)
                 columns = [col[0] for col in cursor.description]
-                rows = cursor.fetchall()
-                # Convert to list of dicts
-                return [dict(zip(columns, row)) for row in rows]
+                # Rows are built as dicts by the driver
+                cursor.rowfactory = lambda *values: dict(zip(columns, values))
+                return cursor.fetchall()
 
 # Global instance
 db_client = OracleClient()
@@ -0,0 +1,175 @@
+"""
+Result set encoding for the SQL execution endpoint.
+Converts driver rows to JSON-ready values once per column and serializes
+them as records, per-column arrays, row arrays or Arrow IPC.
+"""
+try:
+    import pyarrow as pa
+    HAS_ARROW = True
+except ImportError:
+    HAS_ARROW = False
+    pa = None
+
+import gzip
+import json
+import zlib
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Sequence
+
+# Supported encodings for the "format" field of SQL execution requests
+FORMAT_ROWS = "rows"        # [{"COL": value, ...}, ...] (legacy)
+FORMAT_COLUMNS = "columns"  # [[col1 values...], [col2 values...]]
+FORMAT_ARRAYS = "arrays"    # [[row1 values...], [row2 values...]]
+FORMATS = (FORMAT_ROWS, FORMAT_COLUMNS, FORMAT_ARRAYS)
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+# Responses smaller than this are not worth compressing
+GZIP_MIN_SIZE = 1024
+
+def _to_str(value: Any) -> Any:
+    return None if value is None else str(value)
+
+
+def column_converters(json_ready: Optional[Sequence[bool]], column_count: int) -> List[Optional[Callable[[Any], Any]]]:
+    """
+    One converter per column, from the column types reported by the driver
+    (see oracle_client.json_ready_columns) rather than from the values, so a
+    column is converted the same way whatever its first rows hold.
+    Returns None for columns that are already JSON-serializable; without
+    type information (json_ready None) every column is taken as is.
+    """
+    if json_ready is None:
+        return [None] * column_count
+    return [None if ready else _to_str for ready in json_ready]
+
+
+def to_columns(
+    rows: Sequence[Sequence[Any]],
+    column_count: int,
+    json_ready: Optional[Sequence[bool]] = None
+) -> List[List[Any]]:
+    """Transpose rows into per-column lists of JSON-ready values."""
+    converters = column_converters(json_ready, column_count)
+    if rows:
+        data = [list(values) for values in zip(*rows)]
+    else:
+        data = [[] for _ in range(column_count)]
+
+    for i, convert in enumerate(converters):
+        if convert is not None:
+            data[i] = [convert(v) for v in data[i]]
+    return data
+
+
+def to_arrays(
+    rows: Sequence[Sequence[Any]],
+    column_count: int,
+    json_ready: Optional[Sequence[bool]] = None
+) -> List[List[Any]]:
+    """Return rows as lists of JSON-ready values."""
+    converters = column_converters(json_ready, column_count)
+    if not any(converters):
+        return [list(row) for row in rows]
+    return [list(values) for values in zip(*to_columns(rows, column_count, json_ready))]
+
+
+def to_records(
+    columns: List[str],
+    rows: Sequence[Sequence[Any]],
+    json_ready: Optional[Sequence[bool]] = None
+) -> List[dict]:
+    """Return rows as dicts keyed by column name (legacy format)."""
+    return [dict(zip(columns, values)) for values in to_arrays(rows, len(columns), json_ready)]
+
+
+def encode_json(
+    columns: List[str],
+    rows: Sequence[Sequence[Any]],
+    fmt: str,
+    warning: Optional[str] = None,
+    json_ready: Optional[Sequence[bool]] = None,
+) -> bytes:
+    """Serialize a result set in one of the compact JSON formats."""
+    if fmt == FORMAT_COLUMNS:
+        data = to_columns(rows, len(columns), json_ready)
+    else:
+        data = to_arrays(rows, len(columns), json_ready)
+
+    payload = {
+        "success": True,
+        "format": fmt,
+        "columns": columns,
+        "rows": [],
+        "data": data,
+        "row_count": len(rows),
+        "error": None,
+        "warning": warning,
+    }
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def encode_arrow(
+    columns: List[str],
+    rows: Sequence[Sequence[Any]],
+    json_ready: Optional[Sequence[bool]] = None
+) -> bytes:
+    """Serialize a result set as an Arrow IPC stream (requires pyarrow)."""
+    if not HAS_ARROW:
+        raise RuntimeError("pyarrow is not installed")
+
+    arrays = []
+    for values in to_columns(rows, len(columns), json_ready):
+        try:
+            arrays.append(pa.array(values))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            arrays.append(pa.array([_to_str(v) for v in values], type=pa.string()))
+
+    table = pa.Table.from_arrays(arrays, names=columns)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def accepts_arrow(accept: Optional[str]) -> bool:
+    """Whether the client asked for an Arrow IPC stream."""
+    return bool(accept) and ARROW_MEDIA_TYPE in accept.lower()
+
+
+def accepts_json(accept: Optional[str]) -> bool:
+    """Whether the client also accepts a JSON response."""
+    if not accept:
+        return True
+    for part in accept.lower().split(","):
+        media_type, _, params = part.strip().partition(";")
+        if media_type.strip() in ("application/json", "application/*", "*/*") and params.replace(" ", "") != "q=0":
+            return True
+    return False
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """Whether the client accepts gzip-compressed responses."""
+    if not accept_encoding:
+        return False
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding.strip() in ("gzip", "*") and params.replace(" ", "") != "q=0":
+            return True
+    return False
+
+
+def maybe_gzip(body: bytes, accept_encoding: Optional[str]) -> tuple[bytes, Optional[str]]:
+    """Compress the body when the client accepts it and it is large enough."""
+    if len(body) >= GZIP_MIN_SIZE and accepts_gzip(accept_encoding):
+        return gzip.compress(body, compresslevel=5), "gzip"
+    return body, None
+
+
+def gzip_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Compress a stream of chunks into one gzip stream, chunk by chunk."""
+    compressor = zlib.compressobj(5, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,226 @@
+"""
+SQL jobs database for Pstral.
+Persists the state of long-running SQL queries executed in the background.
+"""
+import os
+import json
+from datetime import datetime
+from typing import Optional, List
+from pydantic import BaseModel
+
+from .sqlite_storage import SQLiteStorage, get_storage
+
+# Database path
+DB_PATH = os.path.join(os.path.dirname(__file__), "sql_jobs.db")
+
+
+def _db() -> SQLiteStorage:
+    return get_storage(DB_PATH)
+
+
+# Job statuses
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+FINISHED_STATUSES = (JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED)
+
+
+class SQLJob(BaseModel):
+    id: str
+    user_id: int
+    username: str
+    query: str
+    max_rows: int
+    status: str
+    columns: Optional[List[str]] = None
+    row_count: int = 0
+    result_path: Optional[str] = None
+    error: Optional[str] = None
+    created_at: str
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+
+
+_COLUMNS = """id, user_id, username, query, max_rows, status, columns, row_count,
+              result_path, error, created_at, started_at, finished_at"""
+
+
+def _row_to_job(row) -> SQLJob:
+    return SQLJob(
+        id=row[0],
+        user_id=row[1],
+        username=row[2],
+        query=row[3],
+        max_rows=row[4],
+        status=row[5],
+        columns=json.loads(row[6]) if row[6] else None,
+        row_count=row[7] or 0,
+        result_path=row[8],
+        error=row[9],
+        created_at=row[10],
+        started_at=row[11],
+        finished_at=row[12]
+    )
+
+
+def init_sql_jobs_db():
+    """Initialize the SQL jobs database."""
+    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+    with _db().transaction() as conn:
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS sql_jobs (
+                id TEXT PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                username TEXT,
+                query TEXT NOT NULL,
+                max_rows INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                columns TEXT,
+                row_count INTEGER DEFAULT 0,
+                result_path TEXT,
+                error TEXT,
+                created_at TIMESTAMP,
+                started_at TIMESTAMP,
+                finished_at TIMESTAMP
+            )
+        """)
+
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_sql_jobs_user ON sql_jobs(user_id, created_at)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_sql_jobs_status ON sql_jobs(status)")
+
+
+def create_job(job_id: str, user_id: int, username: str, query: str, max_rows: int) -> SQLJob:
+    """Register a new pending job."""
+    with _db().transaction() as conn:
+        cursor = conn.cursor()
+
+        now = datetime.utcnow().isoformat()
+        cursor.execute("""
+            INSERT INTO sql_jobs (id, user_id, username, query, max_rows, status, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (job_id, user_id, username, query, max_rows, JOB_PENDING, now))
+
+        return SQLJob(
+            id=job_id,
+            user_id=user_id,
+            username=username,
+            query=query,
+            max_rows=max_rows,
+            status=JOB_PENDING,
+            created_at=now
+        )
+
+
+def get_job(job_id: str, user_id: Optional[int] = None) -> Optional[SQLJob]:
+    """Get a job by ID, optionally ensuring it belongs to the user."""
+    cursor = _db().connection().cursor()
+
+    if user_id is None:
+        cursor.execute(f"SELECT {_COLUMNS} FROM sql_jobs WHERE id = ?", (job_id,))
+    else:
+        cursor.execute(f"SELECT {_COLUMNS} FROM sql_jobs WHERE id = ? AND user_id = ?", (job_id, user_id))
+
+    row = cursor.fetchone()
+
+    return _row_to_job(row) if row else None
+
+
+def get_user_jobs(user_id: int, limit: int = 50) -> List[SQLJob]:
+    """Get the most recent jobs of a user."""
+    cursor = _db().connection().cursor()
+
+    cursor.execute(f"""
+        SELECT {_COLUMNS} FROM sql_jobs
+        WHERE user_id = ?
+        ORDER BY created_at DESC
+        LIMIT ?
+    """, (user_id, limit))
+
+    rows = cursor.fetchall()
+
+    return [_row_to_job(row) for row in rows]
+
+
+def get_jobs_by_status(statuses: tuple) -> List[SQLJob]:
+    """Get all jobs in one of the given statuses (oldest first)."""
+    cursor = _db().connection().cursor()
+
+    placeholders = ", ".join("?" for _ in statuses)
+    cursor.execute(f"""
+        SELECT {_COLUMNS} FROM sql_jobs
+        WHERE status IN ({placeholders})
+        ORDER BY created_at
+    """, statuses)
+
+    rows = cursor.fetchall()
+
+    return [_row_to_job(row) for row in rows]
+
+
+def mark_job_running(job_id: str) -> bool:
+    """Move a pending job to running. Returns False if it is no longer pending."""
+    with _db().transaction() as conn:
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            UPDATE sql_jobs SET status = ?, started_at = ?
+            WHERE id = ? AND status = ?
+        """, (JOB_RUNNING, datetime.utcnow().isoformat(), job_id, JOB_PENDING))
+
+        updated = cursor.rowcount > 0
+
+        return updated
+
+
+def finish_job(
+    job_id: str,
+    status: str,
+    columns: Optional[List[str]] = None,
+    row_count: int = 0,
+    result_path: Optional[str] = None,
+    error: Optional[str] = None
+) -> bool:
+    """Record the final state of a job that has not already finished."""
+    with _db().transaction() as conn:
+        cursor = conn.cursor()
+
+        placeholders = ", ".join("?" for _ in FINISHED_STATUSES)
+        cursor.execute(f"""
+            UPDATE sql_jobs
+            SET status = ?, columns = ?, row_count = ?, result_path = ?, error = ?, finished_at = ?
+            WHERE id = ? AND status NOT IN ({placeholders})
+        """, (
+            status,
+            json.dumps(columns) if columns is not None else None,
+            row_count,
+            result_path,
+            error,
+            datetime.utcnow().isoformat(),
+            job_id,
+            *FINISHED_STATUSES
+        ))
+
+        updated = cursor.rowcount > 0
+
+        return updated
+
+
+def delete_jobs_finished_before(cutoff: str) -> List[SQLJob]:
+    """Delete finished jobs older than the cutoff and return them."""
+    with _db().transaction() as conn:
+        cursor = conn.cursor()
+
+        placeholders = ", ".join("?" for _ in FINISHED_STATUSES)
+        cursor.execute(f"""
+            SELECT {_COLUMNS} FROM sql_jobs
+            WHERE status IN ({placeholders}) AND finished_at < ?
+        """, (*FINISHED_STATUSES, cutoff))
+        expired = [_row_to_job(row) for row in cursor.fetchall()]
+
+        cursor.executemany("DELETE FROM sql_jobs WHERE id = ?", [(job.id,) for job in expired])
+
+        return expired
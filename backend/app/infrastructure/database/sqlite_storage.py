@@ -0,0 +1,134 @@
+"""
+Shared SQLite storage layer for Pstral.
+
+Keeps one open connection per thread and per database file instead of
+connecting and closing on every call, and configures each connection once:
+WAL journal (readers no longer block the writer), synchronous=NORMAL (no
+fsync per commit in WAL mode), a sized page cache, memory-mapped reads and
+a busy timeout. Statements are compiled once per connection and reused
+from the sqlite3 statement cache.
+
+Usage:
+    storage = get_storage(DB_PATH)
+    rows = storage.connection().execute("SELECT ...").fetchall()
+    with storage.transaction() as conn:
+        conn.execute("INSERT ...")
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+from app.core.config import settings
+
+# Compiled statements kept per connection (sqlite3 LRU statement cache)
+STATEMENT_CACHE_SIZE = 256
+
+
+def _has_fts5() -> bool:
+    conn = sqlite3.connect(":memory:")
+    try:
+        conn.execute("CREATE VIRTUAL TABLE fts5_probe USING fts5(content)")
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.close()
+
+
+# Full-text search is compiled into almost every SQLite build, but not all
+HAS_FTS5 = _has_fts5()
+
+
+class SQLiteStorage:
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: List[sqlite3.Connection] = []
+
+    def _open(self) -> sqlite3.Connection:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = sqlite3.connect(
+            self.path,
+            timeout=settings.SQLITE_BUSY_TIMEOUT_MS / 1000,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            check_same_thread=False
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{int(settings.SQLITE_CACHE_SIZE_KIB)}")
+        conn.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+        conn.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run writes in one transaction: commit on success, rollback on error."""
+        conn = self.connection()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    def close(self):
+        """Close every connection opened for this database (shutdown/tests)."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+
+_storages: Dict[str, SQLiteStorage] = {}
+_storages_lock = threading.Lock()
+
+
+def get_storage(path: str) -> SQLiteStorage:
+    """Return the shared storage for a database file (one per path)."""
+    key = os.path.abspath(path)
+    storage = _storages.get(key)
+    if storage is None:
+        with _storages_lock:
+            storage = _storages.get(key)
+            if storage is None:
+                storage = SQLiteStorage(key)
+                _storages[key] = storage
+    return storage
+
+
+def close_storage(path: str):
+    """Close a database's shared connections and forget it (before its file is moved or removed)."""
+    with _storages_lock:
+        storage = _storages.pop(os.path.abspath(path), None)
+    if storage:
+        storage.close()
+
+
+def close_all_storages():
+    """Close all shared SQLite connections."""
+    with _storages_lock:
+        storages = list(_storages.values())
+    for storage in storages:
+        storage.close()
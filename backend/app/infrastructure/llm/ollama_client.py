@@ -1,8 +1,15 @@
+import asyncio
 import json
 import httpx
 from typing import AsyncGenerator, List
 from app.core.config import settings
 from app.domain.models.chat_models import Message
+from app.infrastructure.database.image_store import image_store
+
+
+class LLMStreamError(Exception):
+    """The reply stream failed; the message is meant for the user."""
+
 
 class OllamaClient:
     def __init__(self, base_url: str = settings.OLLAMA_BASE_URL):
@@ -18,12 +25,17 @@ class OllamaClient:
         if len(messages) <= max_messages:
             return messages
         
-        # Keep first message (initial context) + last (max_messages - 1) messages
-        return [messages[0]] + messages[-(max_messages - 1):]
+        # Keep first message (initial context) + last (max_messages - 1) messages.
+        # The first message is kept for its text only: its images are older
+        # than the window and are not sent again.
+        first = messages[0].model_copy(update={"images": None})
+        return [first] + messages[-(max_messages - 1):]
     
-    async def chat_stream(self, messages: list[Message], system_context: str) -> AsyncGenerator[str, None]:
+    def build_messages(self, messages: list[Message], system_context: str) -> list[dict]:
         """
-        Streams response from Ollama.
+        Build the Ollama message list: system prompt + limited history, with
+        image digests resolved to base64 from the image store (the endpoints
+        only let through digests the user may read).
         """
         # Limit history to prevent token overflow
         limited_messages = self._limit_history(messages)
@@ -34,9 +46,19 @@ class OllamaClient:
         for m in limited_messages:
             msg_dict = {"role": m.role, "content": m.content}
             if m.images:
-                msg_dict["images"] = m.images
+                msg_dict["images"] = image_store.resolve(m.images)
             full_messages.append(msg_dict)
         
+        return full_messages
+    
+    async def chat_stream(self, messages: list[Message], system_context: str) -> AsyncGenerator[str, None]:
+        """
+        Streams response from Ollama. Raises LLMStreamError if the reply
+        could not be generated to the end.
+        """
+        # Reading images from disk happens off the event loop
+        full_messages = await asyncio.to_thread(self.build_messages, messages, system_context)
+        
         # Real implementation
         async with httpx.AsyncClient(timeout=60.0) as client:
             try:
@@ -62,9 +84,27 @@ class OllamaClient:
                                     yield data["message"]["content"]
                             except:
                                 pass
-            except httpx.ConnectError:
-                yield "⚠️ **System Error**: Cannot connect to local AI engine (Ollama). Please ensure it is running (`ollama serve`)."
-            except httpx.ReadTimeout:
-                yield "⚠️ **Timeout**: The AI model is taking too long to respond."
+            except httpx.ConnectError as e:
+                raise LLMStreamError("⚠️ **System Error**: Cannot connect to local AI engine (Ollama). Please ensure it is running (`ollama serve`).") from e
+            except httpx.ReadTimeout as e:
+                raise LLMStreamError("⚠️ **Timeout**: The AI model is taking too long to respond.") from e
             except Exception as e:
-                yield f"⚠️ **Error**: {str(e)}"
+                raise LLMStreamError(f"⚠️ **Error**: {str(e)}") from e
+    
+    async def complete(self, messages: list[dict], num_predict: int, timeout: float = 60.0) -> dict:
+        """
+        Non-streamed completion for background work. Returns Ollama's
+        response (message, prompt_eval_count, eval_count); raises on errors.
+        """
+        async with httpx.AsyncClient(timeout=timeout) as client:
+            response = await client.post(
+                f"{self.base_url}/api/chat",
+                json={
+                    "model": settings.OLLAMA_MODEL,
+                    "messages": messages,
+                    "stream": False,
+                    "options": {"temperature": 0.1, "num_predict": num_predict}
+                },
+            )
+            response.raise_for_status()
+            return response.json()
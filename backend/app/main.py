@@ -1,17 +1,24 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+import asyncio
 import httpx
 import logging
-import time
 from app.core.config import settings
-from app.api.v1.endpoints import chat, feedback, auth, audit, sql_execute, conversations
+from app.api.v1.endpoints import chat, feedback, auth, audit, sql_execute, sql_jobs, conversations, images
 from app.infrastructure.database.oracle_client import db_client
 from app.infrastructure.database.feedback_db import init_db
-from app.infrastructure.database.audit_db import init_audit_db, log_action
+from app.infrastructure.database.audit_db import init_audit_db, run_audit_maintenance_loop
+from app.infrastructure.database.audit_writer import audit_writer
 from app.infrastructure.database.conversations_db import init_conversations_db
-from app.core.auth import init_users_db, decode_token
-from app.core.metrics import get_metrics, record_request
+from app.infrastructure.database.sql_jobs_db import init_sql_jobs_db
+from app.infrastructure.database.sqlite_storage import close_all_storages
+from app.infrastructure.database.async_storage import async_storage
+from app.domain.services.sql_job_service import sql_job_service
+from app.domain.services.compaction_service import conversation_compactor
+from app.core.auth import init_users_db
+from app.core.audit_middleware import AuditMiddleware
+from app.core.metrics import get_metrics
 
 # Logging
 logging.basicConfig(level=logging.INFO)
@@ -24,6 +31,7 @@ async def lifespan(app: FastAPI):
     
     # 1. Connect Database
     await db_client.connect()
+    pool_monitor_task = asyncio.create_task(db_client.run_pool_monitor())
     init_db()
     
     # 2. Initialize Users Database
@@ -32,13 +40,22 @@ async def lifespan(app: FastAPI):
     
     # 3. Initialize Audit Database
     init_audit_db()
+    audit_writer.replay_spool()
+    audit_maintenance_task = asyncio.create_task(run_audit_maintenance_loop())
     logger.info("Audit database initialized.")
     
     # 4. Initialize Conversations Database
     init_conversations_db()
+    conversation_compactor.start()
     logger.info("Conversations database initialized.")
     
-    # 5. Check Ollama
+    # 5. Start background SQL jobs (resumes jobs pending before a restart)
+    init_sql_jobs_db()
+    sql_job_service.start()
+    retention_task = asyncio.create_task(sql_job_service.run_retention_loop())
+    logger.info("SQL jobs worker pool started.")
+    
+    # 6. Check Ollama
     try:
         async with httpx.AsyncClient(timeout=2.0) as client:
             resp = await client.get(f"{settings.OLLAMA_BASE_URL}/api/tags")
@@ -57,7 +74,15 @@ async def lifespan(app: FastAPI):
     
     # --- SHUTDOWN ---
     logger.info("Shutting down...")
+    retention_task.cancel()
+    audit_maintenance_task.cancel()
+    pool_monitor_task.cancel()
+    sql_job_service.shutdown()
+    conversation_compactor.shutdown()
     await db_client.close()
+    await asyncio.to_thread(audit_writer.drain)
+    async_storage.shutdown()
+    close_all_storages()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -74,58 +99,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Audit Middleware
-@app.middleware("http")
-async def audit_middleware(request: Request, call_next):
-    start_time = time.time()
-    
-    # Get user info from token if available
-    user_id = None
-    username = "anonymous"
-    
-    auth_header = request.headers.get("authorization")
-    if auth_header and auth_header.startswith("Bearer "):
-        token = auth_header.split(" ")[1]
-        token_data = decode_token(token)
-        if token_data:
-            username = token_data.username
-    
-    # Process request
-    response = await call_next(request)
-    
-    # Calculate response time
-    response_time_ms = int((time.time() - start_time) * 1000)
-    
-    # Log important actions (skip health checks and static files)
-    path = request.url.path
-    if not path.startswith("/health") and not path.startswith("/static"):
-        # Determine action from path and method
-        method = request.method
-        action = f"{method} {path}"
-        
-        # Get client info
-        ip_address = request.client.host if request.client else None
-        user_agent = request.headers.get("user-agent")
-        
-        # Status
-        status = "success" if response.status_code < 400 else "error"
-        
-        # Log to audit database (async-safe logging)
-        try:
-            log_action(
-                user_id=user_id,
-                username=username,
-                action=action,
-                resource=path,
-                ip_address=ip_address,
-                user_agent=user_agent,
-                status=status,
-                response_time_ms=response_time_ms
-            )
-        except Exception as e:
-            logger.error(f"Failed to log audit: {e}")
-    
-    return response
+# Audit Middleware (outermost, so the response time covers the CORS handling)
+app.add_middleware(AuditMiddleware)
 
 # Router
 app.include_router(auth.router, prefix=f"{settings.API_V1_STR}/auth", tags=["auth"])
@@ -133,13 +108,23 @@ app.include_router(chat.router, prefix=settings.API_V1_STR, tags=["chat"])
 app.include_router(feedback.router, prefix=f"{settings.API_V1_STR}/feedback", tags=["feedback"])
 app.include_router(audit.router, prefix=f"{settings.API_V1_STR}/audit", tags=["audit"])
 app.include_router(sql_execute.router, prefix=f"{settings.API_V1_STR}/sql", tags=["sql"])
+app.include_router(sql_jobs.router, prefix=f"{settings.API_V1_STR}/sql/jobs", tags=["sql"])
 app.include_router(conversations.router, prefix=f"{settings.API_V1_STR}/conversations", tags=["conversations"])
+app.include_router(images.router, prefix=f"{settings.API_V1_STR}/images", tags=["images"])
 
 @app.get("/health")
 def health_check():
+    pool = db_client.pool_stats()
+    if not db_client.pool:
+        database = "disconnected"
+    elif pool["waiting"] > 0 and pool["max"] >= pool["ceiling"]:
+        database = "saturated"
+    else:
+        database = "connected"
     return {
         "status": "ok",
-        "database": "connected" if db_client.pool else "disconnected"
+        "database": database,
+        "pool": pool
     }
 
 
@@ -0,0 +1,94 @@
+"""
+Benchmark: memory and throughput of the audit export.
+
+"previous" is the former export_audit_logs: get_audit_logs(limit=10000),
+one AuditLog per row, then the whole JSON or CSV document built in memory
+(so it never exported more than 10,000 logs). "streamed" consumes
+iter_audit_export over every log (ROWS logs spread over a year of monthly
+partitions). Peak Python memory is measured with tracemalloc, in a second
+run (tracing slows allocations down too much to time the same run).
+
+Usage (from backend/):
+    python -m benchmarks.bench_audit_export [rows]
+"""
+import csv
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.infrastructure.database import audit_db  # noqa: E402
+from app.infrastructure.database.sqlite_storage import close_all_storages  # noqa: E402
+
+ROWS = 1_000_000
+BATCH = 50_000
+
+
+def fill(rows: int):
+    template = audit_db.audit_row(
+        1, "admin", "GET /api/v1/conversations", "/api/v1/conversations",
+        ip_address="10.0.0.1", user_agent="Mozilla/5.0 (X11; Linux x86_64)"
+    )
+    for start in range(0, rows, BATCH):
+        audit_db.insert_audit_rows([
+            # One year, in order
+            (f"2024-{1 + i * 12 // rows:02d}-{1 + i % 28:02d} {i % 24:02d}:{i % 60:02d}:00",) + template[1:]
+            for i in range(start, min(rows, start + BATCH))
+        ])
+
+
+def previous_export(format: str) -> str:
+    logs = audit_db.get_audit_logs(limit=10000)
+    if format == "json":
+        return json.dumps([log.dict() for log in logs], indent=2, ensure_ascii=False)
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(["ID", "Timestamp", "User ID", "Username", "Action", "Resource", "Details", "IP Address", "Status"])
+    for log in logs:
+        writer.writerow([
+            log.id, log.timestamp, log.user_id, log.username,
+            log.action, log.resource, log.details, log.ip_address, log.status
+        ])
+    return output.getvalue()
+
+
+def streamed_export(format: str) -> int:
+    return sum(len(chunk) for chunk in audit_db.iter_audit_export(format))
+
+
+def measure(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    fn(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else ROWS
+    with tempfile.TemporaryDirectory() as tmp:
+        audit_db.DB_PATH = os.path.join(tmp, "audit.db")
+        audit_db.init_audit_db()
+        fill(rows)
+
+        print(f"{rows:,} audit logs in {len(audit_db._list_partitions())} partitions")
+        for format in ("json", "csv"):
+            elapsed, peak, content = measure(previous_export, format)
+            print(f"  previous {format:6s}: 10,000 rows, {len(content) / 1e6:7.1f} MB in {elapsed:6.2f} s, peak {peak / 1e6:6.1f} MB")
+        for format in ("json", "ndjson", "csv"):
+            elapsed, peak, size = measure(streamed_export, format)
+            print(f"  streamed {format:6s}: {rows:,} rows, {size / 1e6:7.1f} MB in {elapsed:6.2f} s "
+                  f"({rows / elapsed:,.0f} rows/s), peak {peak / 1e6:6.1f} MB")
+        close_all_storages()
+
+
+if __name__ == "__main__":
+    main()
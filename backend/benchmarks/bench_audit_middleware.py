@@ -0,0 +1,160 @@
+"""
+Benchmark: audit middleware throughput, BaseHTTPMiddleware vs plain ASGI.
+
+"previous" is the former @app.middleware("http") audit_middleware (a
+BaseHTTPMiddleware dispatch function), "asgi" is AuditMiddleware. Both wrap
+the same small FastAPI app and queue their events to the audit writer (on
+a temporary database). Requests are sent as ASGI calls in one event loop,
+without a server: a JSON endpoint, then a text/event-stream response of
+CHUNKS chunks like the /chat stream. The reported time of a stream is
+also compared (the former middleware stopped the clock at the headers).
+
+Usage (from backend/):
+    python -m benchmarks.bench_audit_middleware [requests]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI, Request  # noqa: E402
+from fastapi.responses import StreamingResponse  # noqa: E402
+from starlette.middleware.base import BaseHTTPMiddleware  # noqa: E402
+
+from app.core.audit_middleware import AuditMiddleware  # noqa: E402
+from app.core.auth import create_access_token, resolve_principal  # noqa: E402
+from app.infrastructure.database import audit_db  # noqa: E402
+from app.infrastructure.database.audit_writer import audit_writer  # noqa: E402
+from app.infrastructure.database.sqlite_storage import close_all_storages  # noqa: E402
+
+REQUESTS = 5_000
+CHUNKS = 50
+STREAM_DELAY = 0.02  # Seconds before the last chunk, for the timing check
+
+
+async def previous_middleware(request: Request, call_next):
+    """The former audit_middleware."""
+    start_time = time.time()
+    user_id = None
+    username = "anonymous"
+    auth_header = request.headers.get("authorization")
+    if auth_header and auth_header.startswith("Bearer "):
+        token = auth_header.split(" ")[1]
+        token_data = resolve_principal(request, token)
+        if token_data:
+            username = token_data.username
+    response = await call_next(request)
+    response_time_ms = int((time.time() - start_time) * 1000)
+    path = request.url.path
+    if not path.startswith("/health") and not path.startswith("/static"):
+        method = request.method
+        route = request.scope.get("route")
+        audit_writer.log(
+            user_id=user_id,
+            username=username,
+            action=f"{method} {path}",
+            resource=path,
+            ip_address=request.client.host if request.client else None,
+            user_agent=request.headers.get("user-agent"),
+            status="success" if response.status_code < 400 else "error",
+            response_time_ms=response_time_ms,
+            route=f"{method} {route.path}" if route else None
+        )
+    return response
+
+
+def demo_app() -> FastAPI:
+    demo = FastAPI()
+
+    @demo.get("/items/{item_id}")
+    async def item(item_id: int):
+        return {"id": item_id, "name": f"item {item_id}"}
+
+    @demo.get("/stream")
+    async def stream(delay: float = 0):
+        async def events():
+            for i in range(CHUNKS):
+                yield f"data: {{\"token\": \"tok{i}\"}}\n\n"
+            await asyncio.sleep(delay)
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return demo
+
+
+async def call(asgi, path: str, query: bytes, headers):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "method": "GET", "path": path, "raw_path": path.encode(),
+        "root_path": "", "query_string": query, "headers": headers, "client": ("10.0.0.1", 50000),
+        "server": ("bench", 80), "scheme": "http", "http_version": "1.1",
+    }
+    request = [{"type": "http.request", "body": b"", "more_body": False}]
+
+    async def receive():
+        if request:
+            return request.pop()
+        # Client still connected
+        await asyncio.Event().wait()
+
+    async def send(message):
+        pass
+
+    await asgi(scope, receive, send)
+
+
+async def throughput(asgi, path: str, n: int, headers) -> float:
+    start = time.perf_counter()
+    for i in range(n):
+        await call(asgi, path.format(i=i), b"", headers)
+    return n / (time.perf_counter() - start)
+
+
+async def reported_time(asgi, headers) -> int:
+    events = []
+    log = audit_writer.log
+    audit_writer.log = lambda **fields: events.append(fields)
+    try:
+        await call(asgi, "/stream", f"delay={STREAM_DELAY}".encode(), headers)
+    finally:
+        audit_writer.log = log
+    return events[0]["response_time_ms"]
+
+
+async def run(n: int):
+    headers = [
+        (b"authorization", f"Bearer {create_access_token({'sub': 'admin'})}".encode()),
+        (b"user-agent", b"Mozilla/5.0 (X11; Linux x86_64)"),
+    ]
+    implementations = {
+        "previous": BaseHTTPMiddleware(demo_app(), dispatch=previous_middleware),
+        "asgi": AuditMiddleware(demo_app()),
+    }
+    print(f"{n:,} requests per endpoint (streams of {CHUNKS + 1} chunks)")
+    results = {}
+    for label, asgi in implementations.items():
+        await throughput(asgi, "/items/{i}", 200, headers)  # Warm up
+        results[label] = (
+            await throughput(asgi, "/items/{i}", n, headers),
+            await throughput(asgi, "/stream", n, headers),
+            await reported_time(asgi, headers),
+        )
+    for label, (json_rate, stream_rate, stream_ms) in results.items():
+        print(f"  {label:8s}: JSON {json_rate:8,.0f} req/s   stream {stream_rate:8,.0f} req/s   "
+              f"stream with a {STREAM_DELAY * 1000:.0f} ms pause timed at {stream_ms} ms")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else REQUESTS
+    with tempfile.TemporaryDirectory() as tmp:
+        audit_db.DB_PATH = os.path.join(tmp, "audit.db")
+        audit_db.init_audit_db()
+        asyncio.run(run(n))
+        audit_writer.drain()
+        close_all_storages()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark: cost of one audit page at increasing depth.
+
+"offset" is the previous LIMIT/OFFSET paging; "keyset" passes the
+(timestamp, id) of the previous page's last row as `before`, which is what
+the next_cursor of /audit/logs carries. Both go through
+audit_db.get_audit_logs on ROWS seeded rows.
+
+Usage (from backend/):
+    python -m benchmarks.bench_audit_pagination
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.infrastructure.database import audit_db  # noqa: E402
+from app.infrastructure.database.sqlite_storage import close_all_storages  # noqa: E402
+
+ROWS = 1_000_000
+PAGE = 50
+DEPTHS = (0, 10_000, 100_000, 900_000)
+REPEAT = 5
+
+
+def seed():
+    start = datetime(2024, 1, 1)
+    with audit_db._db().transaction() as conn:
+        conn.executemany(
+            "INSERT INTO audit_logs (timestamp, user_id, username, action, resource, status) VALUES (?, ?, ?, ?, ?, 'success')",
+            (((start + timedelta(seconds=i // 4)).strftime("%Y-%m-%d %H:%M:%S"), i % 40, f"user{i % 40}", "API_CALL", "/api/v1/chat")
+             for i in range(ROWS))
+        )
+
+
+def timed(fn) -> float:
+    fn()
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        fn()
+    return (time.perf_counter() - start) / REPEAT
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        audit_db.DB_PATH = os.path.join(tmp, "audit.db")
+        audit_db.init_audit_db()
+        seed()
+
+        print(f"Page of {PAGE} audit logs out of {ROWS}")
+        for depth in DEPTHS:
+            # Sort key of the row just before the requested page
+            previous = audit_db.get_audit_logs(limit=1, offset=depth - 1)[0] if depth else None
+            before = (previous.timestamp, previous.id) if previous else None
+
+            offset_time = timed(lambda: audit_db.get_audit_logs(limit=PAGE, offset=depth))
+            keyset_time = timed(lambda: audit_db.get_audit_logs(limit=PAGE, before=before))
+            assert audit_db.get_audit_logs(limit=PAGE, offset=depth) == audit_db.get_audit_logs(limit=PAGE, before=before)
+            print(f"  depth {depth:7d}  offset {offset_time * 1000:8.2f} ms  keyset {keyset_time * 1000:6.2f} ms")
+
+        count_start = time.perf_counter()
+        audit_db.count_audit_logs()
+        first_count = time.perf_counter() - count_start
+        cached_time = timed(audit_db.count_audit_logs)
+        print(f"  total count {first_count * 1000:.1f} ms, cached {cached_time * 1e6:.1f} µs")
+        close_all_storages()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Benchmark: bytes per audit log, text columns vs dictionary encoding.
+
+Writes the same synthetic month of request events (ROWS logs: a few dozen
+routes, some with conversation ids, USERS users behind USER_AGENTS browser
+user agents and IPS addresses) with the former schema (one text column per
+value, three indexes) and with the dictionary-encoded partition schema,
+then reports the file size per row after VACUUM, split by table and index
+(dbstat), and the insert time (insert_audit_rows also updates the stats
+rollups, which the plain inserts of the former schema do not).
+
+Usage (from backend/):
+    python -m benchmarks.bench_audit_schema [rows]
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.infrastructure.database import audit_db  # noqa: E402
+from app.infrastructure.database.sqlite_storage import close_all_storages  # noqa: E402
+
+ROWS = 200_000
+USERS = 80
+USER_AGENTS = 25
+IPS = 300
+CONVERSATIONS = 2000
+BATCH = 500
+
+ROUTES = [
+    "GET /api/v1/conversations",
+    "POST /api/v1/conversations",
+    "GET /api/v1/conversations/{id}",
+    "PUT /api/v1/conversations/{id}",
+    "DELETE /api/v1/conversations/{id}",
+    "POST /api/v1/chat",
+    "POST /api/v1/sql/execute",
+    "GET /api/v1/sql/jobs",
+    "GET /api/v1/auth/me",
+    "POST /api/v1/auth/login",
+    "GET /api/v1/images/{id}",
+    "GET /api/v1/audit/logs",
+    "GET /api/v1/audit/stats",
+    "POST /api/v1/feedback",
+]
+
+LEGACY_SCHEMA = [
+    """
+    CREATE TABLE audit_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        user_id INTEGER,
+        username TEXT,
+        action TEXT NOT NULL,
+        resource TEXT,
+        details TEXT,
+        ip_address TEXT,
+        user_agent TEXT,
+        status TEXT DEFAULT 'success',
+        response_time_ms INTEGER
+    )
+    """,
+    "CREATE INDEX idx_audit_timestamp ON audit_logs(timestamp)",
+    "CREATE INDEX idx_audit_user_timestamp ON audit_logs(user_id, timestamp)",
+    "CREATE INDEX idx_audit_action_timestamp ON audit_logs(action, timestamp)",
+]
+
+
+def user_agent(i: int) -> str:
+    return (
+        f"Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+        f"Chrome/{110 + i}.0.{5400 + i * 17}.{i * 3} Safari/537.36 Edg/{110 + i}.0.{1700 + i}.{i}"
+    )
+
+
+def events(rows: int):
+    rng = random.Random(42)
+    conversations = [f"{rng.getrandbits(128):032x}" for _ in range(CONVERSATIONS)]
+    for i in range(rows):
+        route = rng.choice(ROUTES)
+        path = route.split(" ", 1)[1].replace("{id}", rng.choice(conversations))
+        method = route.split(" ", 1)[0]
+        user = rng.randrange(USERS)
+        row = audit_db.audit_row(
+            None,
+            "anonymous" if rng.random() < 0.05 else f"user{user}",
+            f"{method} {path}",
+            path,
+            details={"rows": rng.randrange(1000)} if method == "POST" and rng.random() < 0.2 else None,
+            ip_address=f"10.{user % 4}.{user // 4}.{rng.randrange(IPS) % 250}",
+            user_agent=user_agent(user % USER_AGENTS),
+            status="error" if rng.random() < 0.03 else "success",
+            response_time_ms=int(rng.expovariate(1 / 80))
+        )
+        second = i * (30 * 86400) // rows
+        yield (f"2024-06-{1 + second // 86400:02d} {second // 3600 % 24:02d}:{second // 60 % 60:02d}:{second % 60:02d}",) + row[1:]
+
+
+def report(label: str, path: str, rows: int, elapsed: float):
+    conn = sqlite3.connect(path)
+    conn.execute("VACUUM")
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    total = conn.execute("PRAGMA page_count").fetchone()[0] * page_size
+    print(f"  {label:10s}: {total / rows:6.1f} bytes/row ({total / 1e6:6.1f} MB), inserts {elapsed:5.1f} s")
+    for name, size in conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name ORDER BY 2 DESC").fetchall():
+        if size / rows >= 0.5:
+            print(f"      {name:38s} {size / rows:6.1f} bytes/row")
+    conn.close()
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else ROWS
+    data = list(events(rows))
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = os.path.join(tmp, "legacy.db")
+        conn = sqlite3.connect(legacy)
+        for statement in LEGACY_SCHEMA:
+            conn.execute(statement)
+        start = time.perf_counter()
+        for i in range(0, rows, BATCH):
+            conn.executemany("""
+                INSERT INTO audit_logs
+                (timestamp, user_id, username, action, resource, details, ip_address, user_agent, status, response_time_ms)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, data[i:i + BATCH])
+            conn.commit()
+        legacy_time = time.perf_counter() - start
+        conn.close()
+
+        audit_db.DB_PATH = os.path.join(tmp, "audit.db")
+        audit_db.init_audit_db()
+        start = time.perf_counter()
+        for i in range(0, rows, BATCH):
+            audit_db.insert_audit_rows(data[i:i + BATCH])
+        encoded_time = time.perf_counter() - start
+        partition = audit_db._list_partitions()[0].path
+        close_all_storages()
+
+        print(f"{rows:,} audit logs, one month")
+        report("text", legacy, rows, legacy_time)
+        report("encoded", partition, rows, encoded_time)
+
+
+if __name__ == "__main__":
+    main()
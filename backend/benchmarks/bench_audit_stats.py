@@ -0,0 +1,119 @@
+"""
+Benchmark: /audit/stats on a large audit table.
+
+Fills an audit database with ROWS logs (one year, ACTIONS actions, USERS
+users), then compares the previous get_audit_stats queries (COUNT(*) over
+the table, DATE(timestamp) = today, COUNT(DISTINCT user_id), GROUP BY
+action) with the rollup-based version, for all logs and for a 30-day range.
+The one-time migration of the existing logs (to monthly partitions, then
+rolled up) is timed as well; the previous queries run on a copy of the
+single-table database.
+
+Usage (from backend/):
+    python -m benchmarks.bench_audit_stats [rows]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.infrastructure.database import audit_db  # noqa: E402
+from app.infrastructure.database.sqlite_storage import close_all_storages, get_storage  # noqa: E402
+
+ROWS = 10_000_000
+ACTIONS = 50
+USERS = 200
+DAYS = 365
+RANGE = ("2024-06-01", "2024-06-30")
+RUNS = 3
+
+
+def fill(path: str, rows: int):
+    """Create a database with the former single audit_logs table."""
+    with get_storage(path).transaction() as conn:
+        conn.execute("""
+            CREATE TABLE audit_logs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                user_id INTEGER,
+                username TEXT,
+                action TEXT NOT NULL,
+                resource TEXT,
+                details TEXT,
+                ip_address TEXT,
+                user_agent TEXT,
+                status TEXT DEFAULT 'success',
+                response_time_ms INTEGER
+            )
+        """)
+        conn.execute(f"""
+            WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i < {rows - 1})
+            INSERT INTO audit_logs (timestamp, user_id, username, action, resource, ip_address, user_agent, status, response_time_ms)
+            SELECT
+                datetime('2024-01-01', '+' || (i * {DAYS * 86400} / {rows}) || ' seconds'),
+                i % {USERS}, 'user' || (i % {USERS}),
+                'GET /api/v1/action/' || (i % {ACTIONS}), '/api/v1/action/' || (i % {ACTIONS}),
+                '10.0.0.1', 'Mozilla/5.0', CASE WHEN i % 20 = 0 THEN 'error' ELSE 'success' END, 12
+            FROM n
+        """)
+
+
+def legacy_stats(path, start_date=None, end_date=None):
+    """Previous get_audit_stats, with the range as a timestamp filter."""
+    cursor = get_storage(path).connection().cursor()
+    where, params = "", []
+    if start_date:
+        where = " WHERE timestamp >= ? AND timestamp <= ?"
+        params = [start_date, end_date + " 23:59:59"]
+    cursor.execute("SELECT COUNT(*) FROM audit_logs" + where, params)
+    total = cursor.fetchone()[0]
+    cursor.execute("SELECT COUNT(*) FROM audit_logs WHERE DATE(timestamp) = ?", ("2024-06-15",))
+    cursor.fetchone()
+    cursor.execute("SELECT COUNT(DISTINCT user_id) FROM audit_logs" + (where or " WHERE 1=1") + " AND user_id IS NOT NULL", params)
+    cursor.fetchone()
+    cursor.execute(f"SELECT action, COUNT(*) AS count FROM audit_logs{where} GROUP BY action ORDER BY count DESC LIMIT 10", params)
+    cursor.fetchall()
+    return total
+
+
+def timed(fn, *args):
+    best = None
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else ROWS
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = os.path.join(tmp, "legacy.db")
+        start = time.perf_counter()
+        fill(legacy, rows)
+        get_storage(legacy).connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        fill_time = time.perf_counter() - start
+
+        audit_db.DB_PATH = os.path.join(tmp, "audit.db")
+        shutil.copyfile(legacy, audit_db.DB_PATH)
+        start = time.perf_counter()
+        audit_db.init_audit_db()
+        backfill_time = time.perf_counter() - start
+
+        print(f"{rows:,} audit logs over {DAYS} days, {ACTIONS} actions, {USERS} users "
+              f"(generated in {fill_time:.0f} s, migration + rollup backfill {backfill_time:.0f} s)")
+        for label, bounds in (("all logs", ()), (f"{RANGE[0]}..{RANGE[1]}", RANGE)):
+            before, legacy_total = timed(legacy_stats, legacy, *bounds)
+            rollup, stats = timed(audit_db.get_audit_stats, *bounds)
+            assert stats.total_requests == legacy_total
+            print(f"  {label:24s} legacy {before * 1000:9.1f} ms   rollups {rollup * 1000:7.1f} ms   "
+                  f"(unique users {stats.unique_users}, exact {USERS})")
+        close_all_storages()
+
+
+if __name__ == "__main__":
+    main()
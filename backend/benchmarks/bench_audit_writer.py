@@ -0,0 +1,75 @@
+"""
+Benchmark: cost of audit logging per request.
+
+"per-event" is the previous middleware behaviour: one log_action call (one
+transaction and commit) per request. "batched" queues the event in the
+AuditWriter and returns; the writer thread inserts batches with executemany.
+For the batched writer, the time spent by the caller (the event loop) and
+the time until every event is in the database are both reported.
+
+Usage (from backend/):
+    python -m benchmarks.bench_audit_writer [events]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings  # noqa: E402
+from app.infrastructure.database import audit_db  # noqa: E402
+from app.infrastructure.database.audit_writer import AuditWriter  # noqa: E402
+from app.infrastructure.database.sqlite_storage import close_all_storages  # noqa: E402
+
+EVENTS = 5000
+
+
+def event(i: int) -> dict:
+    return dict(
+        user_id=None,
+        username="admin",
+        action=f"GET /api/v1/conversations/{i % 50}",
+        resource=f"/api/v1/conversations/{i % 50}",
+        ip_address="10.0.0.1",
+        user_agent="Mozilla/5.0",
+        status="success",
+        response_time_ms=12
+    )
+
+
+def main():
+    events = int(sys.argv[1]) if len(sys.argv) > 1 else EVENTS
+    with tempfile.TemporaryDirectory() as tmp:
+        audit_db.DB_PATH = os.path.join(tmp, "per_event.db")
+        audit_db.init_audit_db()
+        start = time.perf_counter()
+        for i in range(events):
+            audit_db.log_action(**event(i))
+        per_event = time.perf_counter() - start
+
+        audit_db.DB_PATH = os.path.join(tmp, "batched.db")
+        audit_db.init_audit_db()
+        writer = AuditWriter(
+            settings.AUDIT_QUEUE_SIZE,
+            settings.AUDIT_BATCH_SIZE,
+            settings.AUDIT_FLUSH_INTERVAL_SECONDS,
+            os.path.join(tmp, "spool.ndjson")
+        )
+        start = time.perf_counter()
+        for i in range(events):
+            writer.log(**event(i))
+        enqueued = time.perf_counter() - start
+        writer.drain()
+        batched = time.perf_counter() - start
+        spooled = os.path.exists(writer.spool_path)
+        close_all_storages()
+
+    print(f"{events} audit events (queue {settings.AUDIT_QUEUE_SIZE}, batch {settings.AUDIT_BATCH_SIZE})")
+    print(f"  per-event : {per_event * 1000:8.0f} ms on the caller  ({per_event / events * 1e6:6.1f} us/event)")
+    print(f"  batched   : {enqueued * 1000:8.0f} ms on the caller  ({enqueued / events * 1e6:6.1f} us/event), "
+          f"{batched * 1000:.0f} ms until all written{' (overflow spooled)' if spooled else ''}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark: JWT authentication overhead per request.
+
+"previous" is what each authenticated request used to do: decode and verify
+the same token twice (decode_token in the audit middleware, then again in
+get_current_user). "per request" resolves the principal once and reuses it
+from request.state, with the verified-token cache disabled; "cached" is the
+same with the cache, where a token seen before is not verified again.
+get_current_user is then timed with the user cache disabled (one users
+table lookup per request, on the storage thread pool) and enabled. The
+end-to-end timings are GET /api/v1/auth/me through the whole app, both
+caches disabled then enabled.
+
+Usage (from backend/):
+    python -m benchmarks.bench_auth [requests]
+"""
+import asyncio
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from starlette.requests import Request  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.core import auth  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.main import app  # noqa: E402
+
+REQUESTS = 20_000
+HTTP_REQUESTS = 2_000
+
+
+def previous(token: str):
+    auth._verify_token(token)
+    auth._verify_token(token)
+
+
+def resolved(token: str):
+    request = Request({"type": "http", "headers": []})
+    auth.resolve_principal(request, token)  # Middleware
+    auth.resolve_principal(request, token)  # Dependency
+
+
+def timed(fn, token: str, n: int) -> float:
+    start = time.perf_counter()
+    for _ in range(n):
+        fn(token)
+    return (time.perf_counter() - start) / n
+
+
+async def current_user(token: str, n: int) -> float:
+    request = Request({"type": "http", "headers": []})
+    await auth.get_current_user(request, token)
+    start = time.perf_counter()
+    for _ in range(n):
+        await auth.get_current_user(request, token)
+    return (time.perf_counter() - start) / n
+
+
+def http(client: TestClient, token: str, n: int) -> float:
+    headers = {"Authorization": f"Bearer {token}"}
+    client.get("/api/v1/auth/me", headers=headers)
+    start = time.perf_counter()
+    for _ in range(n):
+        assert client.get("/api/v1/auth/me", headers=headers).status_code == 200
+    return (time.perf_counter() - start) / n
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else REQUESTS
+    cache_size = settings.AUTH_TOKEN_CACHE_SIZE
+    user_cache_size = settings.USER_CACHE_SIZE
+    token = auth.create_access_token({"sub": "admin"})
+
+    print(f"Auth overhead per request ({n:,} requests, {settings.ALGORITHM})")
+    print(f"  previous   (2 verifications): {timed(previous, token, n) * 1e6:7.1f} us")
+    settings.AUTH_TOKEN_CACHE_SIZE = 0
+    print(f"  per request (1 verification): {timed(resolved, token, n) * 1e6:7.1f} us")
+    settings.AUTH_TOKEN_CACHE_SIZE = cache_size
+    auth.clear_token_cache()
+    print(f"  cached     (0 verifications): {timed(resolved, token, n) * 1e6:7.1f} us")
+
+    auth.init_users_db()
+    settings.USER_CACHE_SIZE = 0
+    uncached = asyncio.run(current_user(token, n))
+    settings.USER_CACHE_SIZE = user_cache_size
+    cached = asyncio.run(current_user(token, n))
+    print(f"get_current_user: user cache disabled {uncached * 1e6:7.1f} us   enabled {cached * 1e6:7.1f} us")
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    client = TestClient(app)
+    requests = max(1, min(n, HTTP_REQUESTS))
+    settings.AUTH_TOKEN_CACHE_SIZE = settings.USER_CACHE_SIZE = 0
+    auth.clear_token_cache()
+    auth.invalidate_user()
+    uncached = http(client, token, requests)
+    settings.AUTH_TOKEN_CACHE_SIZE = cache_size
+    settings.USER_CACHE_SIZE = user_cache_size
+    cached = http(client, token, requests)
+    print(f"GET /api/v1/auth/me ({requests:,} requests)")
+    print(f"  caches disabled: {uncached * 1000:6.2f} ms   caches enabled: {cached * 1000:6.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
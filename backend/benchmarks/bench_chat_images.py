@@ -0,0 +1,107 @@
+"""
+Benchmark: bytes moved and stored for an image-heavy chat.
+
+A TURNS-turn conversation where every other user message carries an
+IMAGE_KB image; the client sends the full history to /chat on every turn
+and the conversation is saved after each turn.
+
+"inline" is the previous behaviour: base64 images inside every message of
+every /chat request, inside every Ollama request (including the pinned first
+message) and inside the stored messages. "store" uploads each image once and
+references it by SHA-256 digest; digests are resolved to base64 only for the
+Ollama request, and only for messages inside the history window.
+
+Usage (from backend/):
+    python -m benchmarks.bench_chat_images
+"""
+import base64
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings  # noqa: E402
+from app.domain.models.chat_models import Message  # noqa: E402
+from app.infrastructure.database import conversations_db  # noqa: E402
+from app.infrastructure.database.image_store import image_store  # noqa: E402
+from app.infrastructure.database.sqlite_storage import close_all_storages  # noqa: E402
+from app.infrastructure.llm.ollama_client import OllamaClient  # noqa: E402
+
+TURNS = 20
+IMAGE_KB = 400
+USER_ID = 1
+
+
+def make_image(i: int) -> bytes:
+    return b"\x89PNG\r\n\x1a\n" + os.urandom(IMAGE_KB * 1024) + i.to_bytes(4, "big")
+
+
+def legacy_ollama_messages(messages: list) -> list:
+    # Previous OllamaClient: same window, images of every kept message sent inline
+    max_messages = settings.MAX_HISTORY_MESSAGES
+    if len(messages) > max_messages:
+        messages = [messages[0]] + messages[-(max_messages - 1):]
+    return [{"role": m.role, "content": m.content, **({"images": m.images} if m.images else {})} for m in messages]
+
+
+def run(use_store: bool, tmp: str) -> dict:
+    image_store.root = os.path.join(tmp, "images")
+    conversations_db.DB_PATH = os.path.join(tmp, f"conversations-{use_store}.db")
+    conversations_db.init_conversations_db()
+    conversation_id = f"bench-{use_store}"
+    conversations_db.create_conversation(USER_ID, conversation_id, "chat")
+
+    client = OllamaClient()
+    totals = {"upload": 0, "chat": 0, "ollama": 0}
+    history = []
+    for turn in range(TURNS):
+        images = None
+        if turn % 2 == 0:
+            data = make_image(turn)
+            if use_store:
+                totals["upload"] += len(data)
+                images = [image_store.put(data)]
+            else:
+                images = [base64.b64encode(data).decode("ascii")]
+        user = {"role": "user", "content": f"Que montre l'image {turn} ?", "images": images}
+        history.append(user)
+
+        totals["chat"] += len(json.dumps({"messages": history, "mode": "chat"}))
+        models = [Message(**m) for m in history]
+        ollama = client.build_messages(models, "") if use_store else legacy_ollama_messages(models)
+        totals["ollama"] += len(json.dumps({"messages": ollama}))
+
+        answer = {"role": "assistant", "content": f"Réponse {turn} " * 20}
+        history.append(answer)
+        conversations_db.append_messages(conversation_id, USER_ID, [user, answer])
+
+    close_all_storages()
+    db_size = os.path.getsize(conversations_db.DB_PATH)
+    wal = conversations_db.DB_PATH + "-wal"
+    db_size += os.path.getsize(wal) if os.path.exists(wal) else 0
+    totals["db"] = db_size
+    return totals
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        # The legacy run stores nothing in the image store: keep its rows inline
+        intern = image_store.intern
+        image_store.intern = lambda images: images
+        inline = run(False, tmp)
+        image_store.intern = intern
+        store = run(True, tmp)
+
+    mib = 1024 * 1024
+    print(f"{TURNS} turns, one {IMAGE_KB} KiB image every other turn, "
+          f"history window {settings.MAX_HISTORY_MESSAGES} messages")
+    print(f"  {'':8s} {'uploads':>10s} {'/chat bodies':>13s} {'Ollama bodies':>14s} {'conversation db':>16s}")
+    for name, t in (("inline", inline), ("store", store)):
+        print(f"  {name:8s} {t['upload'] / mib:8.1f} MiB {t['chat'] / mib:9.1f} MiB "
+              f"{t['ollama'] / mib:10.1f} MiB {t['db'] / mib:12.2f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark: sidebar listing latency (50 most recent conversations of a user).
+
+"blob" reproduces the original listing: select the messages JSON column of
+each conversation and json.loads it to count messages. "summary" is
+conversations_db.get_user_conversations, which reads the denormalized
+columns from the covering (user_id, updated_at) index.
+
+Each run lists from a user owning CONVERSATIONS conversations of the given
+message count; timings are averaged over REPEAT calls.
+
+Usage (from backend/):
+    python -m benchmarks.bench_conversation_list
+"""
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.infrastructure.database import conversations_db  # noqa: E402
+from app.infrastructure.database.sqlite_storage import close_all_storages  # noqa: E402
+
+CONVERSATIONS = 500
+MESSAGE_COUNTS = (10, 100, 500)
+USER_ID = 1
+LIMIT = 50
+REPEAT = 50
+
+
+def make_messages(count: int) -> list:
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant",
+         "content": f"Message {i}: SELECT * FROM contrats WHERE statut = 'ACTIF' " * 4}
+        for i in range(count)
+    ]
+
+
+def timestamps():
+    start = datetime(2024, 1, 1)
+    return [(start + timedelta(minutes=i)).isoformat() for i in range(CONVERSATIONS)]
+
+
+def build_blob(db_path: str, messages: list):
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+        CREATE TABLE conversations (
+            id TEXT PRIMARY KEY, user_id INTEGER NOT NULL, title TEXT, mode TEXT,
+            messages TEXT, created_at TIMESTAMP, updated_at TIMESTAMP
+        )
+    """)
+    conn.execute("CREATE INDEX idx_conv_user ON conversations(user_id)")
+    conn.execute("CREATE INDEX idx_conv_updated ON conversations(updated_at)")
+    payload = json.dumps(messages)
+    conn.executemany(
+        "INSERT INTO conversations VALUES (?, ?, 'bench', 'sql', ?, ?, ?)",
+        [(f"conv-{i}", USER_ID, payload, ts, ts) for i, ts in enumerate(timestamps())]
+    )
+    conn.commit()
+    conn.close()
+
+
+def list_blob(db_path: str) -> list:
+    # Original implementation
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("""
+        SELECT id, title, mode, messages, created_at, updated_at
+        FROM conversations
+        WHERE user_id = ?
+        ORDER BY updated_at DESC
+        LIMIT ?
+    """, (USER_ID, LIMIT)).fetchall()
+    conn.close()
+    return [(row[0], len(json.loads(row[3]))) for row in rows]
+
+
+def build_summary(db_path: str, messages: list):
+    conversations_db.DB_PATH = db_path
+    conversations_db.init_conversations_db()
+    with conversations_db._db().transaction() as conn:
+        for i, ts in enumerate(timestamps()):
+            conn.execute(
+                "INSERT INTO conversations (id, user_id, title, mode, created_at, updated_at) VALUES (?, ?, 'bench', 'sql', ?, ?)",
+                (f"conv-{i}", USER_ID, ts, ts)
+            )
+            conversations_db._insert_messages(conn.cursor(), f"conv-{i}", 0, messages)
+
+
+def timed(fn) -> float:
+    fn()
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        fn()
+    return (time.perf_counter() - start) / REPEAT
+
+
+def main():
+    print(f"List {LIMIT} of {CONVERSATIONS} conversations")
+    for count in MESSAGE_COUNTS:
+        messages = make_messages(count)
+        with tempfile.TemporaryDirectory() as tmp:
+            blob_path = os.path.join(tmp, "blob.db")
+            summary_path = os.path.join(tmp, "summary.db")
+            build_blob(blob_path, messages)
+            build_summary(summary_path, messages)
+
+            blob_time = timed(lambda: list_blob(blob_path))
+            summary_time = timed(lambda: conversations_db.get_user_conversations(USER_ID, LIMIT))
+            assert conversations_db.get_user_conversations(USER_ID, LIMIT)[0].message_count == count
+            close_all_storages()
+
+        print(f"  {count:4d} messages/conversation  blob {blob_time * 1000:8.2f} ms  "
+              f"summary {summary_time * 1000:6.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
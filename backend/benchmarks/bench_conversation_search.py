@@ -0,0 +1,152 @@
+"""
+Benchmark: conversation search latency at 100k conversations.
+
+"blob LIKE" reproduces the original search: title LIKE / messages LIKE over
+the JSON messages column, then json.loads of every hit to count messages.
+"rows LIKE" is the substring fallback over conversation_messages (used when
+SQLite has no FTS5). "fts5" is conversations_db.search_conversations, ranked
+with bm25 and returning snippets.
+
+The data set has USERS users sharing CONVERSATIONS conversations of
+MESSAGES messages each; queries run as one user and are averaged over
+REPEAT runs. Index build time (triggers included) is reported as well.
+Pass a user count to change how many conversations the searching user owns
+(the LIKE variants scan all of them, FTS5 only reads matching postings).
+
+Usage (from backend/):
+    python -m benchmarks.bench_conversation_search [users]
+"""
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.infrastructure.database import conversations_db  # noqa: E402
+from app.infrastructure.database.sqlite_storage import close_all_storages  # noqa: E402
+
+CONVERSATIONS = 100_000
+MESSAGES = 6
+USERS = 50
+REPEAT = 5
+SEARCH_USER = 1
+
+WORDS = (
+    "contrat client agence produit statut actif résilié montant prime sinistre date "
+    "effet échéance garantie adresse ville code postal courtier commission avenant "
+    "période total nombre liste requête table colonne jointure filtre année mois "
+    "semaine paiement retard relance dossier gestion souscription devis tarif"
+).split()
+
+QUERIES = [
+    ("rare word", "kerguelen"),
+    ("common word", "contrat"),
+    ("two words", "sinistre retard"),
+]
+
+
+def make_messages(rng: random.Random, index: int) -> list:
+    messages = []
+    for seq in range(MESSAGES):
+        words = rng.choices(WORDS, k=rng.randint(15, 40))
+        if index % 1000 == 0 and seq == 1:
+            words.append("kerguelen")
+        role = "user" if seq % 2 == 0 else "assistant"
+        messages.append({"role": role, "content": " ".join(words)})
+    return messages
+
+
+def dataset():
+    rng = random.Random(42)
+    start = datetime(2024, 1, 1)
+    for i in range(CONVERSATIONS):
+        updated = (start + timedelta(minutes=i)).isoformat()
+        title = " ".join(rng.choices(WORDS, k=4))
+        yield f"conv-{i:06d}", i % USERS + 1, title, updated, make_messages(rng, i)
+
+
+def build_blob(db_path: str) -> float:
+    start = time.perf_counter()
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+        CREATE TABLE conversations (
+            id TEXT PRIMARY KEY, user_id INTEGER NOT NULL, title TEXT, mode TEXT,
+            messages TEXT, created_at TIMESTAMP, updated_at TIMESTAMP
+        )
+    """)
+    conn.execute("CREATE INDEX idx_conv_user ON conversations(user_id)")
+    conn.executemany(
+        "INSERT INTO conversations VALUES (?, ?, ?, 'sql', ?, ?, ?)",
+        ((cid, uid, title, json.dumps(messages), updated, updated)
+         for cid, uid, title, updated, messages in dataset())
+    )
+    conn.commit()
+    conn.close()
+    return time.perf_counter() - start
+
+
+def search_blob(db_path: str, user_id: int, query: str, limit: int = 20) -> list:
+    # Original implementation
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("""
+        SELECT id, title, mode, messages, created_at, updated_at
+        FROM conversations
+        WHERE user_id = ? AND (title LIKE ? OR messages LIKE ?)
+        ORDER BY updated_at DESC
+        LIMIT ?
+    """, (user_id, f"%{query}%", f"%{query}%", limit)).fetchall()
+    conn.close()
+    return [(row[0], len(json.loads(row[3]))) for row in rows]
+
+
+def build_rows(db_path: str) -> float:
+    conversations_db.DB_PATH = db_path
+    start = time.perf_counter()
+    conversations_db.init_conversations_db()
+    with conversations_db._db().transaction() as conn:
+        for cid, uid, title, updated, messages in dataset():
+            conn.execute(
+                "INSERT INTO conversations (id, user_id, title, mode, created_at, updated_at) VALUES (?, ?, ?, 'sql', ?, ?)",
+                (cid, uid, title, updated, updated)
+            )
+            conversations_db._insert_messages(conn.cursor(), cid, 0, messages)
+    return time.perf_counter() - start
+
+
+def timed(fn) -> tuple:
+    result = fn()
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        fn()
+    return (time.perf_counter() - start) / REPEAT, result
+
+
+def main():
+    global USERS
+    if len(sys.argv) > 1:
+        USERS = int(sys.argv[1])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        blob_path = os.path.join(tmp, "blob.db")
+        rows_path = os.path.join(tmp, "rows.db")
+        build_times = {"blob": build_blob(blob_path), "fts5": build_rows(rows_path)}
+
+        print(f"{CONVERSATIONS} conversations x {MESSAGES} messages, {USERS} users")
+        print(f"  build: blob {build_times['blob']:.1f} s, rows + fts5 index {build_times['fts5']:.1f} s")
+        for label, query in QUERIES:
+            blob_time, blob_hits = timed(lambda: search_blob(blob_path, SEARCH_USER, query))
+            like_time, _ = timed(lambda: conversations_db._search_conversations_like(SEARCH_USER, query, 20))
+            fts_time, fts_hits = timed(lambda: conversations_db.search_conversations(SEARCH_USER, query))
+            print(f"  {label:12s} q={query!r:19s} blob LIKE {blob_time * 1000:8.1f} ms  "
+                  f"rows LIKE {like_time * 1000:8.1f} ms  fts5 {fts_time * 1000:7.1f} ms  "
+                  f"({len(blob_hits)} / {len(fts_hits)} hits)")
+        close_all_storages()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark: write amplification when saving a 200-turn conversation.
+
+"blob" reproduces the previous storage: every save rewrites the whole
+messages JSON column (the frontend PUTs the full history after each turn).
+"append" uses conversations_db.append_messages, which only inserts the new
+user/assistant pair.
+
+Bytes written are the message payload bytes sent to SQLite per save; the
+database file size and wall time are reported as well.
+
+Usage (from backend/):
+    python -m benchmarks.bench_conversation_writes
+"""
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.infrastructure.database import conversations_db  # noqa: E402
+
+TURNS = 200
+USER_ID = 1
+CONVERSATION_ID = "bench-conversation"
+
+
+def make_turn(i: int) -> list:
+    return [
+        {"role": "user", "content": f"Question {i}: " + "donne-moi les contrats actifs " * 5},
+        {"role": "assistant", "content": f"Réponse {i}: SELECT * FROM contrats WHERE statut = 'ACTIF' " * 10},
+    ]
+
+
+def bench_blob(db_path: str):
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+        CREATE TABLE conversations (
+            id TEXT PRIMARY KEY, user_id INTEGER NOT NULL, title TEXT, mode TEXT,
+            messages TEXT, created_at TIMESTAMP, updated_at TIMESTAMP
+        )
+    """)
+    now = datetime.utcnow().isoformat()
+    conn.execute(
+        "INSERT INTO conversations VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (CONVERSATION_ID, USER_ID, "bench", "chat", "[]", now, now)
+    )
+    conn.commit()
+    conn.close()
+
+    history = []
+    written = 0
+    start = time.perf_counter()
+    for i in range(TURNS):
+        history.extend(make_turn(i))
+        payload = json.dumps(history)
+        written += len(payload.encode("utf-8"))
+        conn = sqlite3.connect(db_path)
+        conn.execute(
+            "UPDATE conversations SET messages = ?, updated_at = ? WHERE id = ? AND user_id = ?",
+            (payload, datetime.utcnow().isoformat(), CONVERSATION_ID, USER_ID)
+        )
+        conn.commit()
+        conn.close()
+    return written, time.perf_counter() - start
+
+
+def bench_append(db_path: str):
+    conversations_db.DB_PATH = db_path
+    conversations_db.init_conversations_db()
+    conversations_db.create_conversation(USER_ID, CONVERSATION_ID, "chat", "bench")
+
+    written = 0
+    start = time.perf_counter()
+    for i in range(TURNS):
+        turn = make_turn(i)
+        written += len(json.dumps(turn).encode("utf-8"))
+        conversations_db.append_messages(CONVERSATION_ID, USER_ID, turn)
+    elapsed = time.perf_counter() - start
+
+    assert len(conversations_db.get_conversation(CONVERSATION_ID, USER_ID).messages) == TURNS * 2
+    return written, elapsed
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        results = []
+        for name, fn in (("blob rewrite", bench_blob), ("append-only", bench_append)):
+            path = os.path.join(tmp, f"{name.split()[0]}.db")
+            written, elapsed = fn(path)
+            results.append((name, written, elapsed, os.path.getsize(path)))
+
+    print(f"{TURNS}-turn conversation ({TURNS * 2} messages)")
+    for name, written, elapsed, size in results:
+        print(f"  {name:14s} payload written {written / 1024:9.1f} KiB  "
+              f"db size {size / 1024:7.1f} KiB  {elapsed * 1000:7.1f} ms")
+    print(f"  write amplification reduced x{results[0][1] / results[1][1]:.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark: per-row Python overhead of turning Oracle rows into JSON-ready data.
+
+Compares the legacy path (isinstance/str() per cell + dict per row) with the
+driver-converted path (output type handlers deliver DATE/TIMESTAMP/LOB values
+as strings, so Python only transposes or zips).
+
+The fake cursor replays 100k pre-built rows as the driver returns them:
+NUMBER as int/float, DATE/TIMESTAMP as datetime. For the driver paths it
+applies the DATE/TIMESTAMP outconverters of oracle_client (a Python call per
+date cell, as the driver does), so their cost is part of the timings.
+
+On a single-core container all three paths land around 3.2-3.5 us/row:
+formatting the two date columns costs about as much as the legacy
+isinstance/str() loop, so on date-heavy results the handlers mainly move
+the conversion out of the endpoint rather than making it cheaper.
+
+Usage (from backend/):
+    python -m benchmarks.bench_oracle_fetch
+"""
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.infrastructure.database import result_format  # noqa: E402
+from app.infrastructure.database.oracle_client import _datetime_formatter  # noqa: E402
+
+ROW_COUNT = 100_000
+COLUMNS = ["ID", "CLIENT", "CREATED_AT", "UPDATED_AT", "AMOUNT", "STATUS", "NOTES", "QTY"]
+# Outconverters installed by output_type_handler: CREATED_AT is a DATE, UPDATED_AT a TIMESTAMP
+OUTCONVERTERS = {2: _datetime_formatter("seconds"), 3: _datetime_formatter("microseconds")}
+
+
+class FakeCursor:
+    """Minimal cursor replaying pre-built rows through fetchmany(), with optional outconverters."""
+
+    def __init__(self, rows, outconverters=None):
+        self._rows = rows
+        self._outconverters = outconverters or {}
+        self.rowfactory = None
+        self.description = [(name,) for name in COLUMNS]
+
+    def fetchmany(self, size):
+        rows = self._rows[:size]
+        if self._outconverters and rows:
+            # The driver's loop is in C; only the outconverter calls run Python code
+            columns = list(zip(*rows))
+            for index, convert in self._outconverters.items():
+                columns[index] = map(convert, columns[index])
+            rows = list(zip(*columns))
+        if self.rowfactory:
+            return [self.rowfactory(*row) for row in rows]
+        return rows
+
+
+def build_rows():
+    base = datetime(2024, 1, 1)
+    rows = []
+    for i in range(ROW_COUNT):
+        created = base + timedelta(minutes=i)
+        updated = created + timedelta(seconds=30, microseconds=i)
+        rows.append((i, f"CLIENT_{i % 500}", created, updated, i / 100, "ACTIVE", None, i % 7))
+    return rows
+
+
+def legacy(cursor):
+    columns = [desc[0] for desc in cursor.description]
+    rows = []
+    for row in cursor.fetchmany(ROW_COUNT):
+        row_dict = {}
+        for i, col in enumerate(columns):
+            value = row[i]
+            if value is not None and not isinstance(value, (str, int, float, bool)):
+                value = str(value)
+            row_dict[col] = value
+        rows.append(row_dict)
+    return rows
+
+
+def driver_records(cursor):
+    columns = [desc[0] for desc in cursor.description]
+    cursor.rowfactory = lambda *values: dict(zip(columns, values))
+    return cursor.fetchmany(ROW_COUNT)
+
+
+def driver_columns(cursor):
+    rows = cursor.fetchmany(ROW_COUNT)
+    return result_format.to_columns(rows, len(cursor.description))
+
+
+def timed(fn, rows, outconverters=None, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        cursor = FakeCursor(rows, outconverters)
+        start = time.perf_counter()
+        fn(cursor)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    rows = build_rows()
+
+    results = [
+        ("legacy per-cell loop", timed(legacy, rows)),
+        ("driver + row factory (dicts)", timed(driver_records, rows, OUTCONVERTERS)),
+        ("driver + columnar", timed(driver_columns, rows, OUTCONVERTERS)),
+    ]
+
+    baseline = results[0][1]
+    print(f"{ROW_COUNT} rows x {len(COLUMNS)} columns")
+    for name, seconds in results:
+        per_row_us = seconds / ROW_COUNT * 1e6
+        print(f"  {name:32s} {seconds * 1000:8.1f} ms  {per_row_us:6.2f} us/row  x{baseline / seconds:.1f}")
+
+
+if __name__ == "__main__":
+    main()
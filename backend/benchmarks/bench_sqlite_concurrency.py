@@ -0,0 +1,149 @@
+"""
+Benchmark: concurrent audit writes and reads on SQLite.
+
+"legacy" reproduces the previous access pattern: every call opens a new
+connection in the default rollback-journal mode (synchronous=FULL), runs one
+statement, commits and closes. "shared" runs the same statements on the
+per-thread connections of sqlite_storage (WAL, synchronous=NORMAL, page cache,
+mmap, statement cache), as audit_db now does.
+
+Both runs use the same mix for a fixed duration: WRITERS threads inserting
+audit rows and READERS threads fetching the latest 50 entries (the
+get_audit_logs query). Throughput and p50/p99 latency are reported per
+operation type.
+
+Usage (from backend/):
+    python -m benchmarks.bench_sqlite_concurrency
+"""
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.infrastructure.database import audit_db  # noqa: E402
+from app.infrastructure.database.sqlite_storage import close_all_storages, get_storage  # noqa: E402
+
+READERS = 8
+WRITERS = 2
+DURATION = 3.0
+SEED_ROWS = 5000
+
+INSERT_SQL = """
+    INSERT INTO audit_logs
+    (user_id, username, action, resource, details, ip_address, user_agent, status, response_time_ms)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+SELECT_SQL = """
+    SELECT id, timestamp, user_id, username, action, resource, details, ip_address, user_agent, status
+    FROM audit_logs ORDER BY timestamp DESC LIMIT 50 OFFSET 0
+"""
+
+
+def audit_row(i: int) -> tuple:
+    return (i % 20, f"user{i % 20}", "API_CALL", "/api/v1/sql/execute",
+            json.dumps({"method": "POST", "status_code": 200}), "127.0.0.1", "bench", "success", 12)
+
+
+def legacy_write(db_path: str, i: int):
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute(INSERT_SQL, audit_row(i))
+    conn.commit()
+    conn.close()
+
+
+def legacy_read(db_path: str):
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute(SELECT_SQL).fetchall()
+    conn.close()
+
+
+def shared_write(db_path: str, i: int):
+    with get_storage(db_path).transaction() as conn:
+        conn.execute(INSERT_SQL, audit_row(i))
+
+
+def shared_read(db_path: str):
+    get_storage(db_path).connection().execute(SELECT_SQL).fetchall()
+
+
+def run(db_path: str, write, read) -> dict:
+    latencies = {"write": [], "read": []}
+    errors = []
+    stop = time.perf_counter() + DURATION
+
+    def worker(kind: str, index: int):
+        samples = []
+        i = index
+        try:
+            while time.perf_counter() < stop:
+                start = time.perf_counter()
+                if kind == "write":
+                    write(db_path, i)
+                    i += WRITERS
+                else:
+                    read(db_path)
+                samples.append(time.perf_counter() - start)
+        except sqlite3.Error as e:
+            errors.append(str(e))
+        latencies[kind].extend(samples)
+
+    threads = [threading.Thread(target=worker, args=("write", n)) for n in range(WRITERS)]
+    threads += [threading.Thread(target=worker, args=("read", n)) for n in range(READERS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return {"latencies": latencies, "errors": errors}
+
+
+def seed(db_path: str):
+    audit_db.DB_PATH = db_path
+    audit_db.init_audit_db()
+    conn = sqlite3.connect(db_path)
+    conn.executemany(INSERT_SQL, [audit_row(i) for i in range(SEED_ROWS)])
+    conn.commit()
+    conn.close()
+
+
+def percentile(samples: list, p: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def main():
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, "legacy.db")
+        seed(legacy_path)
+        close_all_storages()
+        # init_audit_db ran through the shared storage: put the file back in rollback-journal mode
+        conn = sqlite3.connect(legacy_path)
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.close()
+        results.append(("legacy", run(legacy_path, legacy_write, legacy_read)))
+
+        shared_path = os.path.join(tmp, "shared.db")
+        seed(shared_path)
+        results.append(("shared", run(shared_path, shared_write, shared_read)))
+        close_all_storages()
+
+    print(f"{WRITERS} audit writers + {READERS} readers, {DURATION:.0f}s, {SEED_ROWS} seeded rows")
+    for name, result in results:
+        for kind in ("write", "read"):
+            samples = result["latencies"][kind]
+            print(f"  {name:7s} {kind:5s} {len(samples) / DURATION:9.0f} ops/s  "
+                  f"p50 {percentile(samples, 0.50) * 1000:7.2f} ms  "
+                  f"p99 {percentile(samples, 0.99) * 1000:7.2f} ms")
+        if result["errors"]:
+            print(f"  {name:7s} errors: {len(result['errors'])} (first: {result['errors'][0]})")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,7 @@ from app.core.auth import init_users_db
 from app.infrastructure.database.feedback_db import init_db as init_feedback_db
 from app.infrastructure.database.audit_db import init_audit_db
 from app.infrastructure.database.conversations_db import init_conversations_db
+from app.infrastructure.database.sql_jobs_db import init_sql_jobs_db
 
 
 @pytest.fixture(scope="session", autouse=True)
@@ -22,6 +23,7 @@ def setup_databases():
     init_feedback_db()
     init_audit_db()
     init_conversations_db()
+    init_sql_jobs_db()
     yield
 
 
@@ -0,0 +1,109 @@
+"""
+Tests for the async SQLite storage facade.
+"""
+from fastapi.testclient import TestClient
+from app.main import app
+import asyncio
+import httpx
+import pytest
+import threading
+import time
+
+from app.api.v1.endpoints.chat import get_chat_service
+from app.infrastructure.database.async_storage import AsyncStorage
+from app.infrastructure.database.sqlite_storage import SQLiteStorage
+
+client = TestClient(app)
+
+STORAGE_DELAY = 0.2
+TOKEN_INTERVAL = 0.01
+
+
+def get_auth_headers():
+    """Helper to get authentication headers."""
+    response = client.post(
+        "/api/v1/auth/login",
+        json={"username": "admin", "password": "admin123"}
+    )
+    token = response.json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+class FakeChatService:
+    """Streams tokens at a fixed pace and records when each one is produced."""
+
+    def __init__(self, tokens: int):
+        self.tokens = tokens
+        self.emitted = []
+
+    async def generate_response(self, request):
+        for i in range(self.tokens):
+            await asyncio.sleep(TOKEN_INTERVAL)
+            self.emitted.append(time.perf_counter())
+            yield f"token{i} "
+
+
+class TestAsyncStorage:
+    """Tests for the reader/writer lanes."""
+
+    def test_results_and_errors(self):
+        """Test that results and exceptions come back to the awaiting coroutine."""
+        storage = AsyncStorage(reader_threads=2, max_pending=1)
+
+        def fail():
+            raise ValueError("boom")
+
+        async def scenario():
+            threads = await asyncio.gather(*[storage.write(lambda: threading.current_thread().name) for _ in range(5)])
+            assert set(threads) == {"sqlite-writer-0"}
+            assert await storage.read(sum, [1, 2, 3]) == 6
+            with pytest.raises(ValueError):
+                await storage.write(fail)
+
+        try:
+            asyncio.run(scenario())
+        finally:
+            storage.shutdown()
+
+
+class TestEventLoopIsolation:
+    """The event loop keeps streaming while storage calls are slow."""
+
+    def test_streaming_unaffected_by_slow_storage(self, monkeypatch):
+        """Test that token gaps stay small while concurrent requests wait on a slow database."""
+        headers = get_auth_headers()
+        service = FakeChatService(tokens=40)
+        app.dependency_overrides[get_chat_service] = lambda: service
+
+        # Every storage call now takes STORAGE_DELAY (a slow disk or a locked database)
+        connection = SQLiteStorage.connection
+
+        def slow_connection(self):
+            time.sleep(STORAGE_DELAY)
+            return connection(self)
+
+        monkeypatch.setattr(SQLiteStorage, "connection", slow_connection)
+
+        async def scenario():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+                chat = asyncio.create_task(ac.post(
+                    "/api/v1/chat",
+                    json={"messages": [{"role": "user", "content": "Bonjour"}], "mode": "chat"}
+                ))
+                await asyncio.sleep(TOKEN_INTERVAL * 3)
+                load = [ac.get("/api/v1/conversations/", headers=headers) for _ in range(6)]
+                return await asyncio.gather(chat, *load)
+
+        try:
+            chat_response, *responses = asyncio.run(scenario())
+        finally:
+            app.dependency_overrides.pop(get_chat_service, None)
+
+        assert chat_response.status_code == 200
+        assert "[DONE]" in chat_response.text
+        assert all(r.status_code == 200 for r in responses)
+
+        # Blocking the loop on a single storage call would leave a STORAGE_DELAY gap
+        gaps = [b - a for a, b in zip(service.emitted, service.emitted[1:])]
+        assert max(gaps) < STORAGE_DELAY / 2
@@ -0,0 +1,791 @@
+"""
+Tests for audit database and endpoints.
+"""
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from app.main import app
+from datetime import datetime
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+import pytest
+import re
+import sqlite3
+import threading
+import uuid
+
+from app.core import audit_middleware, auth, metrics
+from app.core.audit_middleware import AuditMiddleware
+from app.core.config import settings
+from app.infrastructure.database import audit_db, audit_writer as audit_writer_module
+from app.infrastructure.database.audit_writer import AuditWriter, audit_writer
+from prometheus_client import REGISTRY
+
+client = TestClient(app)
+
+
+def get_auth_headers():
+    """Helper to get authentication headers."""
+    response = client.post(
+        "/api/v1/auth/login",
+        json={"username": "admin", "password": "admin123"}
+    )
+    token = response.json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+class TestAuditLogsEndpoint:
+    """Tests for /api/v1/audit/logs."""
+
+    def test_logs_require_admin(self):
+        """Test that audit logs require authentication."""
+        response = client.get("/api/v1/audit/logs")
+        assert response.status_code == 401
+
+    def test_keyset_pagination(self):
+        """Test paging through logs with next_cursor, including rows sharing a timestamp."""
+        action = f"TEST_{uuid.uuid4().hex[:8]}"
+        for i in range(5):
+            audit_db.log_action(1, "admin", action, f"/resource/{i}")
+
+        headers = get_auth_headers()
+        seen = []
+        cursor = None
+        while True:
+            params = {"action": action, "limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            response = client.get("/api/v1/audit/logs", params=params, headers=headers)
+            assert response.status_code == 200
+            body = response.json()
+            assert body["total"] == 5
+            seen.extend(log["resource"] for log in body["logs"])
+            cursor = body["next_cursor"]
+            if cursor is None:
+                break
+
+        assert seen == [f"/resource/{i}" for i in reversed(range(5))]
+
+    def test_page_still_accepted(self):
+        """Test that the deprecated page parameter still pages by offset without a cursor."""
+        action = f"TEST_{uuid.uuid4().hex[:8]}"
+        for i in range(5):
+            audit_db.log_action(1, "admin", action, f"/resource/{i}")
+
+        response = client.get("/api/v1/audit/logs", params={"action": action, "limit": 2, "page": 2}, headers=get_auth_headers())
+        assert response.status_code == 200
+        body = response.json()
+        assert body["page"] == 2
+        assert [log["resource"] for log in body["logs"]] == ["/resource/2", "/resource/1"]
+        assert body["next_cursor"] is not None
+
+    def test_invalid_cursor(self):
+        """Test that a malformed cursor is rejected."""
+        response = client.get("/api/v1/audit/logs", params={"cursor": "pas-un-curseur"}, headers=get_auth_headers())
+        assert response.status_code == 400
+
+
+class TestAuditWriter:
+    """Tests for the batched audit writer."""
+
+    def test_middleware_events_written_in_batches(self):
+        """Test that request events reach the database once the writer is drained."""
+        paths = [f"/api/v1/conversations/{uuid.uuid4()}" for _ in range(3)]
+        headers = get_auth_headers()
+        for path in paths:
+            client.get(path, headers=headers)
+
+        audit_writer.drain()
+        for path in paths:
+            logs = audit_db.get_audit_logs(action=f"GET {path}")
+            assert len(logs) == 1
+            assert logs[0].username == "admin"
+            assert logs[0].status == "error"
+
+    def test_overflow_spooled_and_replayed(self, tmp_path, monkeypatch):
+        """Test that events beyond the queue or failing to write go to the spool, then are replayed."""
+        action = f"TEST_{uuid.uuid4().hex[:8]}"
+        writer = AuditWriter(queue_size=1, batch_size=10, flush_interval=0.05, spool_path=str(tmp_path / "spool.ndjson"))
+        # No writer thread: the queue stays full
+        monkeypatch.setattr(writer, "_start", lambda: None)
+        for i in range(3):
+            writer.log(user_id=1, username="admin", action=action, resource=f"/resource/{i}")
+        assert len((tmp_path / "spool.ndjson").read_text().splitlines()) == 2
+
+        def failing_insert(rows):
+            raise RuntimeError("database is locked")
+
+        with monkeypatch.context() as m:
+            m.setattr(audit_writer_module, "insert_audit_rows", failing_insert)
+            writer.drain()
+        assert len((tmp_path / "spool.ndjson").read_text().splitlines()) == 3
+        assert audit_db.get_audit_logs(action=action) == []
+
+        assert writer.replay_spool() == 3
+        assert not (tmp_path / "spool.ndjson").exists()
+        resources = sorted(log.resource for log in audit_db.get_audit_logs(action=action))
+        assert resources == [f"/resource/{i}" for i in range(3)]
+
+    def test_partial_batch_spools_uncommitted_partitions(self, tmp_path, monkeypatch):
+        """Test that only the events of the partition that failed are spooled, so the replay adds no duplicate."""
+        monkeypatch.setattr(audit_db, "DB_PATH", str(tmp_path / "audit.db"))
+        audit_db.init_audit_db()
+        writer = AuditWriter(queue_size=10, batch_size=10, flush_interval=0.05, spool_path=str(tmp_path / "spool.ndjson"))
+        row = audit_db.audit_row(1, "admin", "GET /", "/")
+        rows = [(f"2024-0{month}-10 10:00:00",) + row[1:] for month in (1, 1, 2)]
+
+        insert = audit_db._insert_partition
+        def failing_second_partition(partition, partition_rows, last_ids):
+            if partition.start == "2024-02":
+                raise sqlite3.OperationalError("disk I/O error")
+            insert(partition, partition_rows, last_ids)
+
+        with monkeypatch.context() as m:
+            m.setattr(audit_db, "_insert_partition", failing_second_partition)
+            writer._write(rows, "shutdown")
+        assert len((tmp_path / "spool.ndjson").read_text().splitlines()) == 1
+        assert len(audit_db.get_audit_logs()) == 2
+        assert audit_db.get_audit_stats().total_requests == 2
+
+        assert writer.replay_spool() == 1
+        assert len(audit_db.get_audit_logs()) == 3
+        assert audit_db.get_audit_stats().total_requests == 3
+        spooled = REGISTRY.get_sample_value("pstral_audit_events_spooled_total", {"reason": "shutdown"})
+        assert spooled and spooled >= 1
+
+
+@pytest.fixture
+def isolated_audit_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(audit_db, "DB_PATH", str(tmp_path / "audit.db"))
+    audit_db.init_audit_db()
+    rows = []
+    for i in range(300):
+        # Spread over three days, at every hour, with a few users
+        row = audit_db.audit_row(i % 5, f"user{i % 7}", f"GET /action/{i % 4}", "/", status="error" if i % 10 == 0 else "success")
+        rows.append((f"2024-03-{1 + i % 3:02d} {i % 24:02d}:{i % 60:02d}:00",) + row[1:])
+    rows.append(("2024-03-02 12:00:00",) + audit_db.audit_row(None, "anonymous", "GET /health", "/")[1:])
+    audit_db.insert_audit_rows(rows[:100])
+    audit_db.insert_audit_rows(rows[100:])
+    return rows
+
+
+class TestAuditStats:
+    """Tests for statistics answered from the rollups."""
+
+    RANGES = [
+        (None, None),
+        ("2024-03-02", "2024-03-02"),
+        ("2024-03-01", "2024-03-03"),
+        ("2024-03-01T10:00", "2024-03-02T05:59"),
+        ("2024-03-02 03:00", "2024-03-02 17:00"),
+        ("2024-03-01 18:00", None),
+        (None, "2024-03-01 06:00"),
+    ]
+
+    @staticmethod
+    def expected(rows, start, end):
+        lo = audit_db._hour_bound(start, "00") or ""
+        hi = audit_db._hour_bound(end, "23") or "9999"
+        selected = [r for r in rows if lo <= r[0][:13] <= hi]
+        actions = {}
+        for r in selected:
+            actions[r[3]] = actions.get(r[3], 0) + 1
+        users = {r[2] for r in selected if r[2] != "anonymous"}
+        return len(selected), actions, users
+
+    def test_stats_match_logs(self, isolated_audit_db):
+        """Test that rollup totals equal counts over the raw logs, for any range."""
+        for start, end in self.RANGES:
+            total, actions, _ = self.expected(isolated_audit_db, start, end)
+            stats = audit_db.get_audit_stats(start, end)
+            assert stats.total_requests == total, (start, end)
+            assert {a["action"]: a["count"] for a in stats.top_actions} == actions
+
+        # Day-level sketches: the number of users seen on the days of the range
+        assert audit_db.get_audit_stats().unique_users == 7
+        assert audit_db.get_audit_stats("2024-03-02", "2024-03-02").unique_users == len(
+            self.expected(isolated_audit_db, "2024-03-02", "2024-03-02")[2]
+        )
+
+    def test_rollups_backfilled(self, isolated_audit_db):
+        """Test that logs written before the rollups existed are rolled up on init."""
+        before = audit_db.get_audit_stats("2024-03-01T10:00", "2024-03-02T05:59")
+        with audit_db._db().transaction() as conn:
+            for table in ("audit_rollup_hourly", "audit_rollup_daily", "audit_users_daily"):
+                conn.execute(f"DROP TABLE {table}")
+        audit_db.init_audit_db()
+        assert audit_db.get_audit_stats("2024-03-01T10:00", "2024-03-02T05:59") == before
+
+    def test_missed_rollups_caught_up(self, isolated_audit_db, monkeypatch):
+        """Test that logs stored without their rollup update are rolled up once, on the next startup."""
+        rows = [("2024-03-04 09:00:00",) + audit_db.audit_row(1, "late", "GET /late", "/")[1:] for _ in range(3)]
+
+        def failing_rollups(conn, rows):
+            raise sqlite3.OperationalError("disk I/O error")
+
+        with monkeypatch.context() as m:
+            m.setattr(audit_db, "_update_rollups", failing_rollups)
+            audit_db.insert_audit_rows(rows)
+        assert audit_db.count_audit_logs(action="GET /late") == 3
+        assert audit_db.get_audit_stats("2024-03-04", "2024-03-04").total_requests == 0
+
+        audit_db.init_audit_db()
+        assert audit_db.catch_up_rollups() == 0
+        stats = audit_db.get_audit_stats("2024-03-04", "2024-03-04")
+        assert stats.total_requests == 3
+        assert stats.unique_users == 1
+        total, _, _ = self.expected(isolated_audit_db, None, None)
+        assert audit_db.get_audit_stats().total_requests == total + 3
+
+    def test_stats_endpoint(self):
+        """Test the admin statistics endpoint with a date range."""
+        assert client.get("/api/v1/audit/stats").status_code == 401
+        response = client.get(
+            "/api/v1/audit/stats",
+            params={"start_date": "2024-01-01", "end_date": "2024-01-31"},
+            headers=get_auth_headers()
+        )
+        assert response.status_code == 200
+        assert set(response.json()) == {"total_requests", "requests_today", "unique_users", "top_actions"}
+
+
+# Table of the former schema, one text column per value
+LEGACY_AUDIT_TABLE = """
+    CREATE TABLE audit_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        user_id INTEGER,
+        username TEXT,
+        action TEXT NOT NULL,
+        resource TEXT,
+        details TEXT,
+        ip_address TEXT,
+        user_agent TEXT,
+        status TEXT DEFAULT 'success',
+        response_time_ms INTEGER
+    )
+"""
+
+
+@pytest.fixture
+def partitioned_audit_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(audit_db, "DB_PATH", str(tmp_path / "audit.db"))
+    audit_db.init_audit_db()
+    rows = []
+    for i in range(40):
+        # Ten logs in each month from January to April
+        row = audit_db.audit_row(1, "admin", f"GET /action/{i % 2}", f"/resource/{i}")
+        rows.append((f"2024-{1 + i // 10:02d}-{1 + i % 10 * 3:02d} 12:00:00",) + row[1:])
+    audit_db.insert_audit_rows(rows)
+    return rows
+
+
+class TestAuditPartitions:
+    """Tests for the monthly partitions, retention and compaction."""
+
+    def test_one_file_per_month(self, partitioned_audit_db):
+        """Test that logs are stored in the partition of their month, with distinct ids."""
+        names = sorted(os.path.basename(p.path) for p in audit_db._list_partitions())
+        assert names == ["2024-01_2024-02.db", "2024-02_2024-03.db", "2024-03_2024-04.db", "2024-04_2024-05.db"]
+        logs = audit_db.get_audit_logs(limit=100)
+        assert len({log.id for log in logs}) == 40
+        assert [log.resource for log in logs] == [f"/resource/{i}" for i in reversed(range(40))]
+
+    def test_queries_read_overlapping_partitions_only(self, partitioned_audit_db, monkeypatch):
+        """Test that a date range only opens the partitions it overlaps."""
+        opened = []
+        get_storage = audit_db.get_storage
+        monkeypatch.setattr(audit_db, "get_storage", lambda path: opened.append(os.path.basename(path)) or get_storage(path))
+
+        logs = audit_db.get_audit_logs(start_date="2024-02-20", end_date="2024-03-05")
+        assert [log.timestamp for log in logs] == [
+            "2024-03-04 12:00:00", "2024-03-01 12:00:00", "2024-02-28 12:00:00", "2024-02-25 12:00:00", "2024-02-22 12:00:00"
+        ]
+        assert audit_db.count_audit_logs(start_date="2024-02-20", end_date="2024-03-05", action="GET /action/0") == 2
+        assert set(opened) == {"2024-02_2024-03.db", "2024-03_2024-04.db"}
+
+    def test_pages_across_partitions(self, partitioned_audit_db):
+        """Test keyset and offset pages spanning several partitions."""
+        expected = [f"/resource/{i}" for i in reversed(range(40))]
+        seen = []
+        before = None
+        while True:
+            page = audit_db.get_audit_logs(limit=7, before=before)
+            if not page:
+                break
+            seen.extend(log.resource for log in page)
+            before = (page[-1].timestamp, page[-1].id)
+        assert seen == expected
+        assert [log.resource for log in audit_db.get_audit_logs(limit=5, offset=8)] == expected[8:13]
+
+    def test_count_cache_bounded(self, partitioned_audit_db, monkeypatch):
+        """Test that the count cache keeps the most recently used filters only."""
+        monkeypatch.setattr(settings, "AUDIT_COUNT_CACHE_SIZE", 2)
+        monkeypatch.setattr(audit_db, "_count_cache", audit_db.OrderedDict())
+        for action in ("GET /action/0", "GET /action/1", "GET /action/0", "GET /other"):
+            audit_db.count_audit_logs(action=action)
+        assert [key[2] for key in audit_db._count_cache] == ["GET /action/0", "GET /other"]
+
+    def test_legacy_table_migrated(self, tmp_path, monkeypatch):
+        """Test that logs of the former single table are moved to partitions on init."""
+        monkeypatch.setattr(audit_db, "DB_PATH", str(tmp_path / "audit.db"))
+        conn = audit_db._db().connection()
+        conn.execute(LEGACY_AUDIT_TABLE)
+        conn.executemany(
+            "INSERT INTO audit_logs (timestamp, username, action, resource) VALUES (?, 'admin', 'GET /', '/')",
+            [("2024-05-31 23:59:59",), ("2024-06-01 00:00:00",), ("2024-06-15 08:30:00",)]
+        )
+        conn.commit()
+
+        audit_db.init_audit_db()
+        assert not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'audit_logs'").fetchone()
+        logs = audit_db.get_audit_logs()
+        assert [(log.id, log.timestamp) for log in logs] == [
+            (3, "2024-06-15 08:30:00"), (2, "2024-06-01 00:00:00"), (1, "2024-05-31 23:59:59")
+        ]
+        assert audit_db.get_audit_stats().total_requests == 3
+
+        # New logs of a migrated month get ids above the migrated ones
+        audit_db.insert_audit_rows([("2024-06-20 10:00:00",) + audit_db.audit_row(1, "admin", "GET /", "/")[1:]])
+        assert audit_db.get_audit_logs(limit=1)[0].id > 3
+
+    def test_text_partitions_converted(self, tmp_path, monkeypatch):
+        """Test that partitions written with text columns are dictionary-encoded on init, with the same output."""
+        monkeypatch.setattr(audit_db, "DB_PATH", str(tmp_path / "audit.db"))
+        path = tmp_path / "audit_partitions" / "2024-06_2024-07.db"
+        path.parent.mkdir()
+        conn = sqlite3.connect(path)
+        conn.execute(LEGACY_AUDIT_TABLE)
+        conn.executemany(
+            "INSERT INTO audit_logs VALUES (?, ?, 1, 'admin', ?, '/', ?, '10.0.0.1', 'Mozilla/5.0', ?, 12)",
+            [(i, f"2024-06-0{1 + i % 3} 10:00:00", f"GET /action/{i % 2}", '{"a": 1}' if i == 4 else None, "error" if i == 3 else "success") for i in range(1, 7)]
+        )
+        conn.commit()
+        conn.close()
+
+        audit_db.init_audit_db()
+        logs = audit_db.get_audit_logs()
+        assert [(log.id, log.timestamp, log.action, log.status, log.details) for log in logs][:3] == [
+            (5, "2024-06-03 10:00:00", "GET /action/1", "success", None),
+            (2, "2024-06-03 10:00:00", "GET /action/0", "success", None),
+            (4, "2024-06-02 10:00:00", "GET /action/0", "success", '{"a": 1}'),
+        ]
+        assert audit_db.count_audit_logs(action="GET /action/1") == 3
+        with audit_db._read_partition(audit_db._list_partitions()[0]) as conn:
+            assert conn.execute("SELECT type FROM sqlite_master WHERE name = 'audit_logs'").fetchone() == ("view",)
+            assert conn.execute("SELECT COUNT(*) FROM audit_user_agents").fetchone()[0] == 1
+
+    def test_repeated_values_stored_once(self, partitioned_audit_db):
+        """Test that strings repeated across logs are stored once per partition."""
+        with audit_db._read_partition(audit_db._list_partitions()[0]) as conn:
+            assert conn.execute("SELECT COUNT(*) FROM audit_events").fetchone()[0] == 10
+            assert conn.execute("SELECT COUNT(*) FROM audit_actions").fetchone()[0] == 2
+            assert conn.execute("SELECT COUNT(*) FROM audit_usernames").fetchone()[0] == 1
+
+    def test_invalid_date_rejected(self):
+        """Test that invalid date filters are rejected before querying."""
+        headers = get_auth_headers()
+        for url in ("/api/v1/audit/logs", "/api/v1/audit/export"):
+            response = client.get(url, params={"start_date": "hier"}, headers=headers)
+            assert response.status_code == 400
+            assert "Date invalide" in response.json()["detail"]
+
+    def test_retention_archives_expired_partitions(self, partitioned_audit_db, monkeypatch):
+        """Test that partitions past the retention are archived as gzip files and no longer queried."""
+        monkeypatch.setattr(settings, "AUDIT_RETENTION_MONTHS", 2)
+        assert audit_db.apply_audit_retention(datetime(2024, 6, 15)) == [
+            "2024-01_2024-02.db", "2024-02_2024-03.db", "2024-03_2024-04.db"
+        ]
+        assert [p.start for p in audit_db._list_partitions()] == ["2024-04"]
+        assert audit_db.count_audit_logs() == 10
+        # Statistics keep the expired periods
+        assert audit_db.get_audit_stats().total_requests == 40
+
+        archive = os.path.join(audit_db._partition_dir(), "archive", "2024-01_2024-02.db.gz")
+        restored = archive[:-3]
+        with gzip.open(archive, "rb") as src, open(restored, "wb") as dst:
+            dst.write(src.read())
+        conn = sqlite3.connect(restored)
+        assert conn.execute("SELECT COUNT(*) FROM audit_logs").fetchone()[0] == 10
+        conn.close()
+
+    def test_retention_compresses_outside_lock(self, partitioned_audit_db, monkeypatch):
+        """Test that archives are gzipped once the partition lock is released, leftovers included."""
+        monkeypatch.setattr(settings, "AUDIT_RETENTION_MONTHS", 3)
+        archive_dir = os.path.join(audit_db._partition_dir(), "archive")
+        os.makedirs(archive_dir)
+        # Uncompressed file left by an interrupted run
+        with open(os.path.join(archive_dir, "2023-12_2024-01.db"), "wb") as leftover:
+            leftover.write(b"leftover")
+        locked = []
+        copy = audit_db.shutil.copyfileobj
+        def checked_copy(src, dst):
+            locked.append(audit_db._partition_lock.locked())
+            copy(src, dst)
+        monkeypatch.setattr(audit_db.shutil, "copyfileobj", checked_copy)
+
+        assert audit_db.apply_audit_retention(datetime(2024, 5, 1)) == ["2024-01_2024-02.db"]
+        assert locked == [False, False]
+        assert sorted(os.listdir(archive_dir)) == ["2023-12_2024-01.db.gz", "2024-01_2024-02.db.gz"]
+
+    def test_retention_without_archive(self, partitioned_audit_db, monkeypatch):
+        """Test that expired partitions are deleted when archiving is disabled."""
+        monkeypatch.setattr(settings, "AUDIT_RETENTION_MONTHS", 3)
+        monkeypatch.setattr(settings, "AUDIT_ARCHIVE_EXPIRED", False)
+        assert audit_db.apply_audit_retention(datetime(2024, 5, 1)) == ["2024-01_2024-02.db"]
+        assert not os.path.exists(os.path.join(audit_db._partition_dir(), "archive"))
+        assert audit_db.count_audit_logs() == 30
+
+    def test_retention_disabled_by_default(self, partitioned_audit_db):
+        """Test that no partition is removed unless a retention is configured."""
+        assert settings.AUDIT_RETENTION_MONTHS == 0
+        assert audit_db.apply_audit_retention(datetime(2030, 1, 1)) == []
+        assert audit_db.count_audit_logs() == 40
+
+    def test_retention_waits_for_readers(self, partitioned_audit_db, monkeypatch):
+        """Test that an expired partition is closed only once the queries reading it are done."""
+        monkeypatch.setattr(settings, "AUDIT_RETENTION_MONTHS", 3)
+        partition = audit_db._list_partitions()[0]
+        reading = threading.Event()
+        release = threading.Event()
+        results = []
+
+        def reader():
+            with audit_db._read_partition(partition) as conn:
+                reading.set()
+                release.wait(5)
+                results.append(conn.execute("SELECT COUNT(*) FROM audit_events").fetchone()[0])
+
+        thread = threading.Thread(target=reader)
+        thread.start()
+        reading.wait(5)
+        retention = threading.Thread(target=lambda: results.append(audit_db.apply_audit_retention(datetime(2024, 5, 1))))
+        retention.start()
+        retention.join(0.2)
+        assert retention.is_alive()
+        # No new readers on a partition being removed
+        with audit_db._read_partition(partition) as conn:
+            assert conn is None
+
+        release.set()
+        thread.join(5)
+        retention.join(5)
+        assert results == [10, ["2024-01_2024-02.db"]]
+        assert not os.path.exists(partition.path)
+
+    def test_retention_postponed_while_read(self, partitioned_audit_db, monkeypatch):
+        """Test that a partition still read after the wait is kept until the next run."""
+        monkeypatch.setattr(settings, "AUDIT_RETENTION_MONTHS", 3)
+        monkeypatch.setattr(audit_db, "_RETENTION_WAIT_SECONDS", 0.05)
+        partition = audit_db._list_partitions()[0]
+        with audit_db._read_partition(partition) as conn:
+            assert audit_db.apply_audit_retention(datetime(2024, 5, 1)) == []
+            assert conn.execute("SELECT COUNT(*) FROM audit_events").fetchone()[0] == 10
+        assert audit_db.apply_audit_retention(datetime(2024, 5, 1)) == ["2024-01_2024-02.db"]
+
+    def test_cold_partitions_compacted_once(self, partitioned_audit_db):
+        """Test that past months are vacuumed and analyzed once, and the current one is left alone."""
+        assert audit_db.compact_cold_partitions(datetime(2024, 4, 10)) == [
+            "2024-01_2024-02.db", "2024-02_2024-03.db", "2024-03_2024-04.db"
+        ]
+        assert audit_db.compact_cold_partitions(datetime(2024, 4, 10)) == []
+        with audit_db._read_partition(audit_db._list_partitions()[0]) as conn:
+            assert conn.execute("SELECT COUNT(*) FROM sqlite_stat1").fetchone()[0] > 0
+        assert audit_db.get_audit_logs(end_date="2024-01-31")[0].resource == "/resource/9"
+
+
+class TestAuditExport:
+    """Tests for the streamed audit export."""
+
+    def test_export_has_no_row_cap(self, tmp_path, monkeypatch):
+        """Test that every log is exported, beyond the former 10,000 rows, in each format."""
+        monkeypatch.setattr(audit_db, "DB_PATH", str(tmp_path / "audit.db"))
+        audit_db.init_audit_db()
+        row = audit_db.audit_row(1, "admin", "GET /", "/", details={"note": "é, \"quoted\"\nline"})
+        audit_db.insert_audit_rows([(f"2024-{1 + i % 2:02d}-10 {i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}",) + row[1:] for i in range(10050)])
+        headers = get_auth_headers()
+        # Leaves out the request events logged meanwhile
+        year = {"start_date": "2024-01-01", "end_date": "2024-12-31"}
+
+        response = client.get("/api/v1/audit/export", params={"format": "ndjson", **year}, headers=headers)
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        lines = response.text.splitlines()
+        assert len(lines) == 10050
+        assert json.loads(lines[0])["details"] == row[5]
+        assert json.loads(lines[0])["timestamp"] > json.loads(lines[-1])["timestamp"]
+
+        response = client.get("/api/v1/audit/export", params={"format": "csv", **year}, headers=headers)
+        records = list(csv.reader(io.StringIO(response.text)))
+        assert records[0][:2] == ["ID", "Timestamp"]
+        assert len(records) == 10051
+        assert records[1][6] == row[5]
+
+        assert len(client.get("/api/v1/audit/export", params=year, headers=headers).json()) == 10050
+
+    def test_export_date_range_and_gzip(self, partitioned_audit_db):
+        """Test the date filters and the gzip-compressed stream."""
+        response = client.get(
+            "/api/v1/audit/export",
+            params={"format": "ndjson", "start_date": "2024-02-20", "end_date": "2024-03-05"},
+            headers={**get_auth_headers(), "Accept-Encoding": "gzip"}
+        )
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        assert [json.loads(line)["timestamp"][:10] for line in response.text.splitlines()] == [
+            "2024-03-04", "2024-03-01", "2024-02-28", "2024-02-25", "2024-02-22"
+        ]
+
+    def test_empty_export(self, tmp_path, monkeypatch):
+        """Test that exports without logs are still valid documents."""
+        monkeypatch.setattr(audit_db, "DB_PATH", str(tmp_path / "audit.db"))
+        audit_db.init_audit_db()
+        assert b"".join(audit_db.iter_audit_export("json")) == b"[]\n"
+        assert b"".join(audit_db.iter_audit_export("csv")).startswith(b"ID,Timestamp")
+        assert b"".join(audit_db.iter_audit_export("ndjson")) == b""
+
+
+class TestRouteLatency:
+    """Tests for the latency percentiles per route template."""
+
+    @staticmethod
+    def insert(rows_spec):
+        rows = []
+        for timestamp, route, response_time_ms, status in rows_spec:
+            row = audit_db.audit_row(
+                1, "admin", route.replace("{id}", uuid.uuid4().hex), "/",
+                status=status, response_time_ms=response_time_ms, route=route
+            )
+            rows.append((timestamp,) + row[1:])
+        audit_db.insert_audit_rows(rows)
+
+    def test_percentiles_match_response_times(self, tmp_path, monkeypatch):
+        """Test percentiles within 1% of the exact values, error rates and windows."""
+        monkeypatch.setattr(audit_db, "DB_PATH", str(tmp_path / "audit.db"))
+        audit_db.init_audit_db()
+        slow = [(f"2024-03-0{1 + i % 2} {i % 24:02d}:00:00", "GET /slow/{id}", 10 + i * 5, "error" if i % 4 == 0 else "success") for i in range(400)]
+        fast = [(f"2024-03-01 {i % 24:02d}:30:00", "GET /fast", i % 20, "success") for i in range(200)]
+        self.insert(slow[:150] + fast)
+        self.insert(slow[150:])
+
+        latency = audit_db.get_route_latency()
+        assert [r.route for r in latency] == ["GET /slow/{id}", "GET /fast"]
+        times = sorted(t for _, _, t, _ in slow)
+        for field, q in (("p50_ms", 0.5), ("p90_ms", 0.9), ("p99_ms", 0.99)):
+            exact = times[int(q * (len(times) - 1))]
+            assert abs(getattr(latency[0], field) - exact) <= exact * 0.01 + 0.1
+        assert latency[0].count == 400
+        assert latency[0].error_rate == 0.25
+        assert latency[1].error_rate == 0
+
+        # Hour-level window: only the slow requests of the morning of March 2nd
+        window = audit_db.get_route_latency("2024-03-02 00:00", "2024-03-02 11:59")
+        expected = [t for ts, _, t, _ in slow if "2024-03-02 00" <= ts[:13] <= "2024-03-02 11"]
+        assert [(r.route, r.count) for r in window] == [("GET /slow/{id}", len(expected))]
+        assert audit_db.get_route_latency(order_by="count")[0].route == "GET /slow/{id}"
+        assert audit_db.get_route_latency("2024-04-01", "2024-04-30") == []
+
+    def test_middleware_records_route_template(self):
+        """Test that request events are grouped by route template, not raw path."""
+        headers = get_auth_headers()
+        for _ in range(3):
+            client.get(f"/api/v1/conversations/{uuid.uuid4()}", headers=headers)
+        audit_writer.drain()
+
+        response = client.get("/api/v1/audit/latency", params={"order_by": "count", "limit": 200}, headers=headers)
+        assert response.status_code == 200
+        routes = {r["route"]: r for r in response.json()}
+        assert routes["GET /api/v1/conversations/{conversation_id}"]["count"] >= 3
+        assert routes["GET /api/v1/conversations/{conversation_id}"]["error_rate"] > 0
+        assert not any(re.search(r"[0-9a-f]{8}-[0-9a-f]{4}-", route) for route in routes)
+
+    def test_latency_requires_admin(self):
+        """Test that the latency endpoint requires authentication and a valid order."""
+        assert client.get("/api/v1/audit/latency").status_code == 401
+        assert client.get("/api/v1/audit/latency", params={"order_by": "id"}, headers=get_auth_headers()).status_code == 422
+
+
+def streaming_app():
+    """Small app with a slow SSE stream, a stream failing midway and a failing endpoint."""
+    demo = FastAPI()
+
+    @demo.get("/stream/{name}")
+    async def stream(name: str):
+        async def events():
+            for i in range(3):
+                await asyncio.sleep(0.05)
+                yield f"data: {name} {i}\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @demo.get("/broken")
+    async def broken():
+        async def events():
+            yield "data: first\n\n"
+            raise RuntimeError("stream failed")
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @demo.get("/boom")
+    async def boom():
+        raise RuntimeError("boom")
+
+    return demo
+
+
+@pytest.fixture
+def audit_events(monkeypatch):
+    """Audit events queued by the middleware, instead of the writer."""
+    events = []
+    monkeypatch.setattr(audit_middleware.audit_writer, "log", lambda **fields: events.append(fields))
+    return events
+
+
+class TestAuditMiddleware:
+    """Tests for the ASGI audit middleware."""
+
+    def test_stream_timed_to_last_byte(self, audit_events):
+        """Test that a streamed response is timed until its last chunk."""
+        demo = streaming_app()
+        demo.add_middleware(AuditMiddleware)
+        response = TestClient(demo).get("/stream/abc", headers={"user-agent": "pytest"})
+        assert response.text == "".join(f"data: abc {i}\n\n" for i in range(3))
+
+        [event] = audit_events
+        assert event["action"] == "GET /stream/abc"
+        assert event["route"] == "GET /stream/{name}"
+        assert event["status"] == "success"
+        assert event["user_agent"] == "pytest"
+        assert event["username"] == "anonymous"
+        assert event["response_time_ms"] >= 150
+
+    def test_messages_passed_unchanged(self, audit_events):
+        """Test that the middleware forwards the ASGI messages of a stream as they are."""
+        demo = streaming_app()
+
+        async def run(asgi):
+            scope = {
+                "type": "http", "method": "GET", "path": "/stream/x", "root_path": "", "raw_path": b"/stream/x",
+                "query_string": b"", "headers": [], "client": ("127.0.0.1", 1234), "server": ("test", 80),
+                "scheme": "http", "http_version": "1.1",
+            }
+            received = [{"type": "http.request", "body": b"", "more_body": False}]
+            sent = []
+
+            async def receive():
+                if received:
+                    return received.pop()
+                await asyncio.Event().wait()
+
+            async def send(message):
+                sent.append(message)
+
+            await asgi(scope, receive, send)
+            return sent
+
+        direct = asyncio.run(run(demo))
+        wrapped = asyncio.run(run(AuditMiddleware(demo)))
+        assert wrapped == direct
+        assert len([m for m in wrapped if m["type"] == "http.response.body"]) == 4
+        assert audit_events[0]["status"] == "success"
+
+    def test_unhandled_exception_logged_as_error(self, audit_events):
+        """Test that a request failing without a response is still audited, as an error."""
+        demo = streaming_app()
+        demo.add_middleware(AuditMiddleware)
+        response = TestClient(demo, raise_server_exceptions=False).get("/boom")
+        assert response.status_code == 500
+        [event] = audit_events
+        assert event["action"] == "GET /boom"
+        assert event["status"] == "error"
+
+    def test_interrupted_stream_keeps_sent_status(self, audit_events):
+        """Test that a stream failing after its 200 start is recorded with 200 and tagged as interrupted."""
+        demo = streaming_app()
+        demo.add_middleware(AuditMiddleware)
+        labels = {"method": "GET", "endpoint": "/broken"}
+        ok = sample("pstral_requests_total", status="200", **labels)
+        errors = sample("pstral_requests_total", status="500", **labels)
+        interrupted = sample("pstral_requests_interrupted_total", **labels)
+        # Raised by the stream, wrapped in an exception group by the test client
+        with pytest.raises(Exception):
+            TestClient(demo).get("/broken")
+
+        [event] = audit_events
+        assert event["status"] == "success"
+        assert event["details"] == {"interrupted": True}
+        assert sample("pstral_requests_total", status="200", **labels) == ok + 1
+        assert sample("pstral_requests_total", status="500", **labels) == errors
+        assert sample("pstral_requests_interrupted_total", **labels) == interrupted + 1
+
+    def test_health_not_audited(self, audit_events):
+        """Test that health checks are not audited."""
+        client.get("/health")
+        assert audit_events == []
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class TestRequestMetrics:
+    """Tests for the request metrics recorded by the middleware."""
+
+    def test_labelled_by_route_template(self, audit_events):
+        """Test that requests and streams are counted by route template, with their size."""
+        demo = streaming_app()
+        demo.add_middleware(AuditMiddleware)
+        demo_client = TestClient(demo)
+        labels = {"method": "GET", "endpoint": "/stream/{name}"}
+        count = sample("pstral_requests_total", status="200", **labels)
+        size = sample("pstral_response_size_bytes_sum", **labels)
+        streams = sample("pstral_stream_duration_seconds_count", endpoint="/stream/{name}")
+        streamed = sample("pstral_stream_duration_seconds_sum", endpoint="/stream/{name}")
+
+        bodies = [demo_client.get(f"/stream/{name}").content for name in ("abc", "defgh")]
+        assert sample("pstral_requests_total", status="200", **labels) == count + 2
+        assert sample("pstral_response_size_bytes_sum", **labels) == size + sum(len(b) for b in bodies)
+        assert sample("pstral_stream_duration_seconds_count", endpoint="/stream/{name}") == streams + 2
+        # Timed to the last byte (three 50 ms pauses each)
+        assert sample("pstral_stream_duration_seconds_sum", endpoint="/stream/{name}") >= streamed + 0.3
+        assert sample("pstral_streams_in_progress", endpoint="/stream/{name}") == 0
+        assert sample("pstral_requests_in_progress", method="GET") == 0
+        assert not any(
+            "abc" in s.labels.get("endpoint", "")
+            for family in REGISTRY.collect() for s in family.samples
+        )
+
+    def test_unknown_paths_and_methods_grouped(self, audit_events):
+        """Test that unmatched paths and unknown methods share a label."""
+        demo = streaming_app()
+        demo.add_middleware(AuditMiddleware)
+        demo_client = TestClient(demo)
+        before = sample("pstral_requests_total", method="GET", endpoint="unmatched", status="404")
+        for _ in range(3):
+            assert demo_client.get(f"/missing/{uuid.uuid4()}").status_code == 404
+        assert sample("pstral_requests_total", method="GET", endpoint="unmatched", status="404") == before + 3
+        assert metrics.method_label("PROPFIND") == "OTHER"
+
+    def test_endpoint_cardinality_guard(self, monkeypatch):
+        """Test that endpoints beyond METRICS_MAX_ENDPOINTS are labelled "other"."""
+        monkeypatch.setattr(metrics, "_endpoints", set())
+        monkeypatch.setattr(settings, "METRICS_MAX_ENDPOINTS", 2)
+        assert [metrics.endpoint_label(r) for r in ("/a", "/b", "/c", "/a")] == ["/a", "/b", "other", "/a"]
+        assert metrics.endpoint_label(None) == "unmatched"
+
+    def test_sessions_and_users(self):
+        """Test the active sessions and registered users gauges."""
+        username = f"metrics_{uuid.uuid4().hex[:8]}"
+        sessions = sample("pstral_active_sessions")
+        response = client.post("/api/v1/auth/register", json={
+            "username": username, "email": f"{username}@test.com", "password": "testpass123", "full_name": "Metrics"
+        })
+        assert response.status_code == 200
+        users = sqlite3.connect(auth.DB_PATH).execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        assert sample("pstral_users_total") == users
+
+        token = auth.create_access_token({"sub": username})
+        client.get("/api/v1/auth/me", headers={"Authorization": f"Bearer {token}"})
+        assert sample("pstral_active_sessions") == sessions + 1
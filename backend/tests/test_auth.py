@@ -1,9 +1,13 @@
 """
 Tests for authentication endpoints.
 """
+from datetime import timedelta
 from fastapi.testclient import TestClient
 from app.main import app
+from app.core import auth, metrics
 import pytest
+import threading
+import time
 import uuid
 
 client = TestClient(app)
@@ -132,3 +136,190 @@ class TestAuthEndpoints:
         )
         assert response.status_code == 401
 
+    def test_password_checked_off_storage_lanes(self, monkeypatch):
+        """Test that bcrypt does not run on the SQLite reader threads."""
+        from app.api.v1.endpoints import auth as auth_endpoints
+        threads = []
+        verify = auth_endpoints.verify_password
+
+        def recording(plain, hashed):
+            threads.append(threading.current_thread().name)
+            return verify(plain, hashed)
+
+        monkeypatch.setattr(auth_endpoints, "verify_password", recording)
+        response = client.post("/api/v1/auth/login", json={"username": "admin", "password": "admin123"})
+        assert response.status_code == 200
+        assert len(threads) == 1 and not threads[0].startswith("sqlite-")
+
+
+@pytest.fixture
+def counted_decode(monkeypatch):
+    """Count the JWT signature verifications, starting from an empty token cache."""
+    calls = []
+    decode = auth.jwt.decode
+
+    def counting(*args, **kwargs):
+        calls.append(args[0])
+        return decode(*args, **kwargs)
+
+    auth.clear_token_cache()
+    monkeypatch.setattr(auth.jwt, "decode", counting)
+    yield calls
+    auth.clear_token_cache()
+
+
+class TestTokenCache:
+    """Tests for the verified-token cache and the request principal."""
+
+    def test_token_verified_once(self, counted_decode):
+        """The middleware and the dependency share one verification, later requests none."""
+        token = auth.create_access_token({"sub": "admin"})
+        for _ in range(3):
+            response = client.get("/api/v1/auth/me", headers={"Authorization": f"Bearer {token}"})
+            assert response.status_code == 200
+            assert response.json()["username"] == "admin"
+        assert counted_decode == [token]
+
+    def test_invalid_token_not_cached(self, counted_decode):
+        """Invalid tokens are rejected on every request."""
+        for _ in range(2):
+            response = client.get("/api/v1/auth/me", headers={"Authorization": "Bearer invalidtoken123"})
+            assert response.status_code == 401
+        assert len(counted_decode) == 2
+
+    def test_expired_token_rejected(self, counted_decode):
+        """An expired token is not cached and still gets a 401."""
+        token = auth.create_access_token({"sub": "admin"}, expires_delta=timedelta(seconds=-1))
+        response = client.get("/api/v1/auth/me", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 401
+        assert auth.decode_token(token) is None
+
+    def test_cache_honors_exp(self, counted_decode, monkeypatch):
+        """A cached token is verified again once its exp has passed."""
+        token = auth.create_access_token({"sub": "admin"}, expires_delta=timedelta(minutes=5))
+        assert auth.decode_token(token).username == "admin"
+        assert auth.decode_token(token).username == "admin"
+        assert len(counted_decode) == 1
+
+        later = time.time() + 600
+        monkeypatch.setattr(auth.time, "time", lambda: later)
+        auth.decode_token(token)
+        assert len(counted_decode) == 2
+
+    def test_cache_bounded(self, counted_decode, monkeypatch):
+        """The least recently used tokens are evicted beyond AUTH_TOKEN_CACHE_SIZE."""
+        monkeypatch.setattr(auth.settings, "AUTH_TOKEN_CACHE_SIZE", 2)
+        tokens = [auth.create_access_token({"sub": f"user{i}"}) for i in range(3)]
+        for token in tokens:
+            auth.decode_token(token)
+        assert len(auth._verified_tokens) == 2
+        auth.decode_token(tokens[0])
+        assert counted_decode == [tokens[0], tokens[1], tokens[2], tokens[0]]
+
+
+@pytest.fixture
+def counted_user_lookups(monkeypatch):
+    """Count the users database lookups of get_current_user, starting from an empty user cache."""
+    calls = []
+    get_user = auth.get_user
+
+    def counting(username):
+        calls.append(username)
+        return get_user(username)
+
+    auth.invalidate_user()
+    monkeypatch.setattr(auth, "get_user", counting)
+    yield calls
+    auth.invalidate_user()
+
+
+def register_user() -> str:
+    """Register a new user and return its token."""
+    username = f"cached_{uuid.uuid4().hex[:8]}"
+    response = client.post(
+        "/api/v1/auth/register",
+        json={
+            "username": username,
+            "email": f"{username}@test.com",
+            "password": "testpass123",
+            "full_name": "Cached User"
+        }
+    )
+    assert response.status_code == 200
+    return auth.create_access_token({"sub": username})
+
+
+class TestUserCache:
+    """Tests for the authenticated user cache."""
+
+    def test_user_loaded_once(self, counted_user_lookups):
+        """Later requests find the user in the cache."""
+        token = register_user()
+        hits = metrics.USER_CACHE_LOOKUPS.labels(result="hit")._value.get()
+        for _ in range(3):
+            response = client.get("/api/v1/auth/me", headers={"Authorization": f"Bearer {token}"})
+            assert response.status_code == 200
+        assert len(counted_user_lookups) == 1
+        assert metrics.USER_CACHE_LOOKUPS.labels(result="hit")._value.get() == hits + 2
+
+    def test_disable_invalidates(self, counted_user_lookups):
+        """A disabled user is rejected on the next request."""
+        token = register_user()
+        headers = {"Authorization": f"Bearer {token}"}
+        assert client.get("/api/v1/auth/me", headers=headers).status_code == 200
+        assert auth.set_user_disabled(counted_user_lookups[0], True)
+        assert client.get("/api/v1/auth/me", headers=headers).status_code == 400
+
+    def test_role_change_invalidates(self, counted_user_lookups):
+        """A role change applies to the next request."""
+        token = register_user()
+        headers = {"Authorization": f"Bearer {token}"}
+        assert client.get("/api/v1/auth/me", headers=headers).json()["role"] == "user"
+        assert auth.set_user_role(counted_user_lookups[0], "viewer")
+        assert client.get("/api/v1/auth/me", headers=headers).json()["role"] == "viewer"
+        assert len(counted_user_lookups) == 2
+
+    def test_admin_update_applies_next_request(self, counted_user_lookups):
+        """Users changed through the admin endpoint see the change on their next request."""
+        token = register_user()
+        headers = {"Authorization": f"Bearer {token}"}
+        admin_headers = {"Authorization": f"Bearer {auth.create_access_token({'sub': 'admin'})}"}
+        assert client.get("/api/v1/auth/me", headers=headers).json()["role"] == "user"
+        username = counted_user_lookups[0]
+
+        response = client.patch(f"/api/v1/auth/users/{username}", json={"role": "admin"}, headers=admin_headers)
+        assert response.status_code == 200
+        assert response.json()["role"] == "admin"
+        assert client.get("/api/v1/auth/me", headers=headers).json()["role"] == "admin"
+
+        response = client.patch(f"/api/v1/auth/users/{username}", json={"role": "user", "disabled": True}, headers=admin_headers)
+        assert response.status_code == 200
+        assert client.get("/api/v1/auth/me", headers=headers).status_code == 400
+
+    def test_admin_update_rejected(self):
+        """Only admins update users, not their own account's access, and only existing users."""
+        token = register_user()
+        headers = {"Authorization": f"Bearer {token}"}
+        admin_headers = {"Authorization": f"Bearer {auth.create_access_token({'sub': 'admin'})}"}
+        assert client.patch("/api/v1/auth/users/admin", json={"disabled": True}, headers=headers).status_code == 403
+        assert client.patch("/api/v1/auth/users/admin", json={"disabled": True}, headers=admin_headers).status_code == 400
+        assert client.patch("/api/v1/auth/users/nobody_here", json={"disabled": True}, headers=admin_headers).status_code == 404
+        assert client.patch("/api/v1/auth/users/admin", json={"role": "root"}, headers=admin_headers).status_code == 422
+
+    def test_entries_expire(self, counted_user_lookups, monkeypatch):
+        """The user is loaded again after USER_CACHE_TTL_SECONDS."""
+        token = register_user()
+        headers = {"Authorization": f"Bearer {token}"}
+        client.get("/api/v1/auth/me", headers=headers)
+        later = time.monotonic() + auth.settings.USER_CACHE_TTL_SECONDS + 1
+        monkeypatch.setattr(auth.time, "monotonic", lambda: later)
+        client.get("/api/v1/auth/me", headers=headers)
+        assert len(counted_user_lookups) == 2
+
+    def test_unknown_user_not_cached(self, counted_user_lookups):
+        """A token for a missing user is rejected, then accepted once the user is created."""
+        username = f"later_{uuid.uuid4().hex[:8]}"
+        headers = {"Authorization": f"Bearer {auth.create_access_token({'sub': username})}"}
+        assert client.get("/api/v1/auth/me", headers=headers).status_code == 401
+        auth.create_user(auth.UserCreate(username=username, email=f"{username}@test.com", password="testpass123", full_name="Later"))
+        assert client.get("/api/v1/auth/me", headers=headers).status_code == 200
@@ -3,9 +3,17 @@ Tests for conversations database and endpoints.
 """
 from fastapi.testclient import TestClient
 from app.main import app
+import asyncio
+import json
 import pytest
 import uuid
 
+from app.core.config import settings
+from app.domain.models.chat_models import Message
+from app.domain.services.compaction_service import ConversationCompactor
+from app.infrastructure.database import conversations_db
+from app.infrastructure.llm.ollama_client import LLMStreamError, OllamaClient
+
 client = TestClient(app)
 
 
@@ -107,6 +115,131 @@ class TestConversationsEndpoints:
         assert response.json()["title"] == "Updated Title"
         assert len(response.json()["messages"]) == 2
     
+    def test_update_conversation_rewrites_changed_tail(self):
+        """Test that a PUT with an edited history replaces the differing messages."""
+        conv_id = str(uuid.uuid4())
+        headers = get_auth_headers()
+        client.post("/api/v1/conversations/", headers=headers, json={"id": conv_id, "mode": "chat"})
+        
+        client.put(
+            f"/api/v1/conversations/{conv_id}",
+            headers=headers,
+            json={"messages": [
+                {"role": "user", "content": "Hello"},
+                {"role": "assistant", "content": "Hi there!"}
+            ]}
+        )
+        response = client.put(
+            f"/api/v1/conversations/{conv_id}",
+            headers=headers,
+            json={"messages": [
+                {"role": "user", "content": "Hello"},
+                {"role": "assistant", "content": "Regenerated"},
+                {"role": "user", "content": "Thanks"}
+            ]}
+        )
+        assert response.status_code == 200
+        contents = [m["content"] for m in response.json()["messages"]]
+        assert contents == ["Hello", "Regenerated", "Thanks"]
+    
+    def test_conversation_etags(self):
+        """Test ETag / If-None-Match / If-Match handling on GET and PUT."""
+        headers = get_auth_headers()
+        conv_id = str(uuid.uuid4())
+        client.post("/api/v1/conversations/", headers=headers, json={"id": conv_id, "mode": "sql"})
+
+        response = client.get(f"/api/v1/conversations/{conv_id}", headers=headers)
+        etag = response.headers["ETag"]
+        assert etag == '"1"'
+
+        response = client.get(f"/api/v1/conversations/{conv_id}", headers={**headers, "If-None-Match": etag})
+        assert response.status_code == 304
+
+        messages = [{"role": "user", "content": "Bonjour"}]
+        response = client.put(
+            f"/api/v1/conversations/{conv_id}",
+            headers={**headers, "If-Match": etag},
+            json={"messages": messages}
+        )
+        assert response.status_code == 200
+        assert response.json()["version"] == 2
+        assert response.json()["messages"][0]["content"] == "Bonjour"
+        new_etag = response.headers["ETag"]
+
+        # A second tab still holding the first version cannot overwrite the save
+        response = client.put(
+            f"/api/v1/conversations/{conv_id}",
+            headers={**headers, "If-Match": etag},
+            json={"messages": []}
+        )
+        assert response.status_code == 412
+        assert response.headers["ETag"] == new_etag
+
+        response = client.get(f"/api/v1/conversations/{conv_id}", headers={**headers, "If-None-Match": etag})
+        assert response.status_code == 200
+        assert len(response.json()["messages"]) == 1
+
+        response = client.post(
+            f"/api/v1/conversations/{conv_id}/messages",
+            headers={**headers, "If-Match": new_etag},
+            json={"messages": [{"role": "assistant", "content": "Salut"}]}
+        )
+        assert response.json() == {"id": conv_id, "message_count": 2, "version": 3}
+
+        # Any tag of the header may match, "*" matches every version
+        response = client.post(
+            f"/api/v1/conversations/{conv_id}/messages",
+            headers={**headers, "If-Match": f'{etag}, W/"3", "9"'},
+            json={"messages": [{"role": "user", "content": "Encore"}]}
+        )
+        assert response.json()["version"] == 4
+        response = client.post(
+            f"/api/v1/conversations/{conv_id}/messages",
+            headers={**headers, "If-Match": '"2", "3"'},
+            json={"messages": []}
+        )
+        assert response.status_code == 412
+        response = client.put(
+            f"/api/v1/conversations/{conv_id}",
+            headers={**headers, "If-Match": "*"},
+            json={"messages": messages}
+        )
+        assert response.json()["version"] == 5
+
+        response = client.put(f"/api/v1/conversations/{uuid.uuid4()}", headers=headers, json={"messages": []})
+        assert response.status_code == 404
+
+    def test_append_messages(self):
+        """Test appending only the new turn to a conversation."""
+        conv_id = str(uuid.uuid4())
+        headers = get_auth_headers()
+        client.post("/api/v1/conversations/", headers=headers, json={"id": conv_id, "mode": "sql"})
+        
+        for i in range(2):
+            response = client.post(
+                f"/api/v1/conversations/{conv_id}/messages",
+                headers=headers,
+                json={"messages": [
+                    {"role": "user", "content": f"Question {i}"},
+                    {"role": "assistant", "content": f"Answer {i}"}
+                ]}
+            )
+            assert response.status_code == 200
+        assert response.json()["message_count"] == 4
+        
+        response = client.get(f"/api/v1/conversations/{conv_id}", headers=headers)
+        contents = [m["content"] for m in response.json()["messages"]]
+        assert contents == ["Question 0", "Answer 0", "Question 1", "Answer 1"]
+    
+    def test_append_messages_unknown_conversation(self):
+        """Test appending to a conversation that doesn't exist."""
+        response = client.post(
+            "/api/v1/conversations/nonexistent-id/messages",
+            headers=get_auth_headers(),
+            json={"messages": [{"role": "user", "content": "Hello"}]}
+        )
+        assert response.status_code == 404
+    
     def test_delete_conversation(self):
         """Test deleting a conversation."""
         # Create
@@ -151,6 +284,261 @@ class TestConversationsEndpoints:
         assert len(conversations) >= 1
         assert any("XYZ123" in c["title"] for c in conversations)
 
+    def test_list_conversations_pagination(self):
+        """Test paging through conversations with next_cursor."""
+        headers = get_auth_headers()
+        for _ in range(3):
+            client.post("/api/v1/conversations/", headers=headers, json={"id": str(uuid.uuid4()), "mode": "sql"})
+
+        first = client.get("/api/v1/conversations/?limit=2", headers=headers).json()
+        assert len(first["conversations"]) == 2
+        assert first["total"] >= 3
+        assert first["next_cursor"]
+
+        second = client.get(f"/api/v1/conversations/?limit=2&cursor={first['next_cursor']}", headers=headers).json()
+        first_ids = {c["id"] for c in first["conversations"]}
+        assert second["conversations"]
+        assert not first_ids & {c["id"] for c in second["conversations"]}
+        assert second["conversations"][0]["updated_at"] <= first["conversations"][-1]["updated_at"]
+
+        # Larger pages are lowered to 100 conversations
+        response = client.get("/api/v1/conversations/?limit=1000", headers=headers)
+        assert response.status_code == 200
+        assert len(response.json()["conversations"]) <= 100
+        assert client.get("/api/v1/conversations/?limit=0", headers=headers).status_code == 422
+
+    def test_listing_summary_columns(self):
+        """Test that message count, preview and size follow every write."""
+        from app.infrastructure.database import conversations_db
+
+        def summary(conv_id):
+            return next(c for c in conversations_db.get_user_conversations(4242, 100) if c.id == conv_id)
+
+        conv_id = str(uuid.uuid4())
+        conversations_db.create_conversation(4242, conv_id, "sql", "Résumé")
+        assert (summary(conv_id).message_count, summary(conv_id).preview, summary(conv_id).size_bytes) == (0, None, 0)
+
+        long_answer = "é" * 200
+        conversations_db.append_messages(conv_id, 4242, [
+            {"role": "user", "content": "Bonjour"},
+            {"role": "assistant", "content": long_answer}
+        ])
+        listed = summary(conv_id)
+        assert listed.message_count == 2
+        assert listed.preview == long_answer[:conversations_db.PREVIEW_LENGTH]
+        assert listed.size_bytes == len("Bonjour") + len(long_answer.encode("utf-8"))
+
+        conversations_db.update_conversation(conv_id, 4242, [{"role": "user", "content": "Bonjour"}])
+        listed = summary(conv_id)
+        assert (listed.message_count, listed.preview, listed.size_bytes) == (1, "Bonjour", 7)
+
+        conversations_db.delete_conversation(conv_id, 4242)
+
+    def test_search_conversations_by_content(self):
+        """Test full-text search over message contents, ranked, with a snippet."""
+        headers = get_auth_headers()
+        term = f"zq{uuid.uuid4().hex[:8]}"
+        weak_id, strong_id = str(uuid.uuid4()), str(uuid.uuid4())
+        for conv_id, title in ((weak_id, "Autre sujet"), (strong_id, f"Question {term}")):
+            client.post("/api/v1/conversations/", headers=headers, json={"id": conv_id, "mode": "sql", "title": title})
+        client.post(
+            f"/api/v1/conversations/{weak_id}/messages",
+            headers=headers,
+            json={"messages": [{"role": "user", "content": f"Liste des contrats échus {term} en 2024"}]}
+        )
+
+        # Accents are ignored and the last word matches as a prefix
+        response = client.get(f"/api/v1/conversations/search/query?q=echus {term[:6]}", headers=headers)
+        assert response.status_code == 200
+        conversations = response.json()["conversations"]
+        assert [c["id"] for c in conversations] == [weak_id]
+        assert f"<mark>{term}</mark>" in conversations[0]["snippet"]
+        assert conversations[0]["message_count"] == 1
+
+        # A title hit ranks above a message hit
+        response = client.get(f"/api/v1/conversations/search/query?q={term}", headers=headers)
+        assert [c["id"] for c in response.json()["conversations"]] == [strong_id, weak_id]
+
+    def test_search_index_follows_changes(self):
+        """Test that the search index tracks other users, renames and deletions."""
+        from app.infrastructure.database import conversations_db
+
+        term = f"zq{uuid.uuid4().hex[:8]}"
+        conv_id = str(uuid.uuid4())
+        conversations_db.create_conversation(4242, conv_id, "sql", f"Titre {term}")
+        conversations_db.append_messages(conv_id, 4242, [{"role": "user", "content": f"message {term}bis"}])
+
+        assert [c.id for c in conversations_db.search_conversations(4242, term)] == [conv_id]
+        assert conversations_db.search_conversations(4243, term) == []
+
+        conversations_db.update_conversation(conv_id, 4242, [], title="Renommée")
+        assert conversations_db.search_conversations(4242, f"{term}bis") == []
+        assert conversations_db.search_conversations(4242, term) == []
+        assert [c.id for c in conversations_db.search_conversations(4242, "renommee")] == [conv_id]
+
+        conversations_db.delete_conversation(conv_id, 4242)
+        assert conversations_db.search_conversations(4242, "renommee") == []
+        assert conversations_db.search_conversations(4242, "%_*\"") == []
+
+
+class RecordingChatService:
+    """Chat service double that records the history it was given."""
+
+    def __init__(self):
+        self.messages = None
+
+    async def generate_response(self, request):
+        self.messages = request.messages
+        for chunk in ("Voici ", "la réponse"):
+            yield chunk
+
+
+class FailingChatService:
+    """Chat service double whose stream fails after a first chunk."""
+
+    async def generate_response(self, request):
+        yield "Début "
+        raise LLMStreamError("⚠️ **Timeout**: The AI model is taking too long to respond.")
+
+
+class FakeLLM:
+    """LLM client double for background summaries."""
+
+    def __init__(self, summary: str):
+        self.summary = summary
+        self.prompts = []
+
+    async def complete(self, messages, num_predict, timeout=60.0):
+        self.prompts.append(messages[-1]["content"])
+        return {"message": {"role": "assistant", "content": self.summary}, "prompt_eval_count": 200, "eval_count": 10}
+
+
+class TestChatWithConversation:
+    """Tests for /chat with a stored conversation_id."""
+
+    @pytest.fixture
+    def service(self):
+        from app.api.v1.endpoints.chat import get_chat_service
+        service = RecordingChatService()
+        app.dependency_overrides[get_chat_service] = lambda: service
+        yield service
+        app.dependency_overrides.pop(get_chat_service, None)
+
+    def test_history_loaded_and_turn_saved(self, service, monkeypatch):
+        """Test that only the new message is sent and the whole turn is stored."""
+        monkeypatch.setattr(settings, "MAX_HISTORY_MESSAGES", 4)
+        conv_id = str(uuid.uuid4())
+        headers = get_auth_headers()
+        client.post("/api/v1/conversations/", headers=headers, json={"id": conv_id, "mode": "chat"})
+        client.post(f"/api/v1/conversations/{conv_id}/messages", headers=headers, json={"messages": [
+            {"role": "user" if i % 2 == 0 else "assistant", "content": f"Message {i}"} for i in range(6)
+        ]})
+
+        response = client.post("/api/v1/chat", headers=headers, json={
+            "conversation_id": conv_id,
+            "message": {"role": "user", "content": "Nouvelle question"}
+        })
+        assert response.status_code == 200
+        events = [line[6:] for line in response.text.split("\n\n") if line.startswith("data: ")]
+        assert events[-1] == "[DONE]"
+        assert json.loads(events[-2])["conversation"] == {"id": conv_id, "message_count": 8, "version": 3}
+
+        # Only the first message and the most recent ones are loaded, and the
+        # LLM window over them is the same as over the full history
+        assert [m.content for m in service.messages] == [
+            "Message 0", "Message 3", "Message 4", "Message 5", "Nouvelle question"
+        ]
+        full = [Message(role="user", content=f"Message {i}") for i in range(6)] + [service.messages[-1]]
+        window = OllamaClient()._limit_history
+        assert [m.content for m in window(service.messages)] == [m.content for m in window(full)]
+
+        conversation = client.get(f"/api/v1/conversations/{conv_id}", headers=headers).json()
+        assert [m["content"] for m in conversation["messages"][-2:]] == ["Nouvelle question", "Voici la réponse"]
+        assert conversation["messages"][-1]["role"] == "assistant"
+
+    def test_running_summary(self, service, monkeypatch):
+        """Test that old messages are folded into a summary sent ahead of the recent ones."""
+        monkeypatch.setattr(settings, "CONTEXT_SUMMARY_TRIGGER_TOKENS", 50)
+        monkeypatch.setattr(settings, "CONTEXT_SUMMARY_KEEP_MESSAGES", 2)
+        conv_id = str(uuid.uuid4())
+        headers = get_auth_headers()
+        client.post("/api/v1/conversations/", headers=headers, json={"id": conv_id, "mode": "chat"})
+        history = [
+            {"role": "user" if i % 2 == 0 else "assistant", "content": f"Message {i} " + "détail " * 12} for i in range(8)
+        ]
+        client.put(f"/api/v1/conversations/{conv_id}", headers=headers, json={"messages": history})
+
+        llm = FakeLLM("La table CLIENTS a été choisie.")
+        compactor = ConversationCompactor(llm)
+        assert asyncio.run(compactor.compact(conv_id))
+        assert "Message 5" in llm.prompts[0] and "Message 6" not in llm.prompts[0]
+        # The recent messages left are kept verbatim
+        assert not asyncio.run(compactor.compact(conv_id))
+
+        client.post("/api/v1/chat", headers=headers, json={
+            "conversation_id": conv_id,
+            "message": {"role": "user", "content": "Et ensuite ?"}
+        })
+        assert service.messages[0].role == "system"
+        assert "La table CLIENTS a été choisie." in service.messages[0].content
+        assert [m.content.split(" ")[1] for m in service.messages[1:3]] == ["6", "7"]
+        assert service.messages[-1].content == "Et ensuite ?"
+
+        # Rewriting a summarized message invalidates the summary
+        history[0]["content"] = "Message modifié"
+        client.put(f"/api/v1/conversations/{conv_id}", headers=headers, json={"messages": history})
+        assert conversations_db.get_compaction_source(conv_id).summary is None
+
+    def test_conversation_requires_owner(self, service):
+        """Test that a stored conversation needs an authenticated owner."""
+        body = {"conversation_id": "nonexistent-id", "message": {"role": "user", "content": "Bonjour"}}
+        assert client.post("/api/v1/chat", json=body).status_code == 401
+        assert client.post("/api/v1/chat", headers=get_auth_headers(), json=body).status_code == 404
+        assert client.post("/api/v1/chat", json={"conversation_id": "nonexistent-id"}).status_code == 422
+
+    def test_failed_reply_not_saved(self):
+        """Test that a failed stream is reported to the client and leaves the conversation untouched."""
+        from app.api.v1.endpoints.chat import get_chat_service
+        conv_id = str(uuid.uuid4())
+        headers = get_auth_headers()
+        client.post("/api/v1/conversations/", headers=headers, json={"id": conv_id, "mode": "chat"})
+        app.dependency_overrides[get_chat_service] = FailingChatService
+        try:
+            response = client.post("/api/v1/chat", headers=headers, json={
+                "conversation_id": conv_id,
+                "message": {"role": "user", "content": "Question"}
+            })
+        finally:
+            app.dependency_overrides.pop(get_chat_service, None)
+        events = [line[6:] for line in response.text.split("\n\n") if line.startswith("data: ")]
+        assert events[-1] == "[DONE]"
+        assert json.loads(events[-2]) == {"content": "⚠️ **Timeout**: The AI model is taking too long to respond.", "error": True}
+        assert client.get(f"/api/v1/conversations/{conv_id}", headers=headers).json()["messages"] == []
+
+    def test_reply_saved_after_disconnect(self, service):
+        """Test that the turn is still saved when the client goes away mid-stream."""
+        from app.api.v1.endpoints import chat as chat_module
+        from app.core.auth import get_current_user
+        from app.domain.models.chat_models import ChatRequest
+        from starlette.requests import Request
+        conv_id = str(uuid.uuid4())
+        headers = get_auth_headers()
+        client.post("/api/v1/conversations/", headers=headers, json={"id": conv_id, "mode": "chat"})
+
+        async def scenario():
+            user = await get_current_user(Request({"type": "http", "headers": []}), headers["Authorization"][7:])
+            request = ChatRequest(conversation_id=conv_id, message=Message(role="user", content="Question"))
+            response = await chat_module.chat(request, service, user)
+            stream = response.body_iterator
+            assert json.loads((await stream.__anext__())[6:]) == {"content": "Voici "}
+            # Client disconnect
+            await stream.aclose()
+            await asyncio.gather(*chat_module._background_replies)
+
+        asyncio.run(scenario())
+        messages = client.get(f"/api/v1/conversations/{conv_id}", headers=headers).json()["messages"]
+        assert [m["content"] for m in messages] == ["Question", "Voici la réponse"]
+
 
 class TestFeedbackEndpoint:
     """Tests for feedback endpoint."""
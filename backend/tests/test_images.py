@@ -0,0 +1,202 @@
+"""
+Tests for the chat image store and endpoints.
+"""
+from fastapi.testclient import TestClient
+from app.main import app
+import base64
+import hashlib
+import pytest
+import uuid
+
+from app.core.config import settings
+from app.domain.models.chat_models import Message
+from app.infrastructure.database import conversations_db
+from app.infrastructure.database.image_store import image_store
+from app.infrastructure.llm.ollama_client import OllamaClient
+
+client = TestClient(app)
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+
+
+def get_auth_headers():
+    """Helper to get authentication headers."""
+    response = client.post(
+        "/api/v1/auth/login",
+        json={"username": "admin", "password": "admin123"}
+    )
+    token = response.json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def get_other_user_headers():
+    """Register a new user and return its authentication headers."""
+    username = f"images_{uuid.uuid4().hex[:8]}"
+    client.post("/api/v1/auth/register", json={
+        "username": username, "email": f"{username}@test.com", "password": "testpass123", "full_name": "Images"
+    })
+    response = client.post("/api/v1/auth/login", json={"username": username, "password": "testpass123"})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(autouse=True)
+def isolated_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_store, "root", str(tmp_path))
+
+
+class TestImagesEndpoints:
+    """Tests for /api/v1/images endpoints."""
+
+    def test_upload_requires_auth(self):
+        response = client.post("/api/v1/images/", files={"file": ("a.png", PNG, "image/png")})
+        assert response.status_code == 401
+
+    def test_upload_and_get(self):
+        """Test that an image is stored once under its SHA-256 and served back."""
+        headers = get_auth_headers()
+        first = client.post("/api/v1/images/", headers=headers, files={"file": ("a.png", PNG, "image/png")})
+        second = client.post("/api/v1/images/", headers=headers, files={"file": ("b.png", PNG, "image/png")})
+        assert first.status_code == 201
+        assert first.json() == {"hash": hashlib.sha256(PNG).hexdigest(), "size": len(PNG), "media_type": "image/png"}
+        assert second.json()["hash"] == first.json()["hash"]
+
+        response = client.get(f"/api/v1/images/{first.json()['hash']}", headers=headers)
+        assert response.status_code == 200
+        assert response.content == PNG
+        assert response.headers["content-type"] == "image/png"
+        assert "immutable" in response.headers["cache-control"]
+
+    def test_rejected_uploads(self, monkeypatch):
+        """Test that non-images and oversized images are rejected."""
+        headers = get_auth_headers()
+        response = client.post("/api/v1/images/", headers=headers, files={"file": ("a.txt", b"hello", "text/plain")})
+        assert response.status_code == 415
+
+        monkeypatch.setattr(image_store, "max_bytes", 32)
+        response = client.post("/api/v1/images/", headers=headers, files={"file": ("a.png", PNG, "image/png")})
+        assert response.status_code == 413
+
+    def test_unknown_image(self):
+        headers = get_auth_headers()
+        assert client.get(f"/api/v1/images/{'0' * 64}", headers=headers).status_code == 404
+        assert client.get("/api/v1/images/..%2Fusers.db", headers=headers).status_code == 404
+
+    def test_image_readable_by_owners_only(self):
+        """Test that knowing a digest is not enough to read an image."""
+        image = PNG + uuid.uuid4().bytes
+        digest = hashlib.sha256(image).hexdigest()
+        headers = get_auth_headers()
+        assert client.post("/api/v1/images/", headers=headers, files={"file": ("a.png", image, "image/png")}).status_code == 201
+
+        other = get_other_user_headers()
+        assert client.get(f"/api/v1/images/{digest}").status_code == 401
+        assert client.get(f"/api/v1/images/{digest}", headers=other).status_code == 404
+
+        # Referencing the digest in one's own conversation is refused, and grants nothing
+        conv_id = str(uuid.uuid4())
+        client.post("/api/v1/conversations/", headers=other, json={"id": conv_id, "mode": "chat"})
+        response = client.post(f"/api/v1/conversations/{conv_id}/messages", headers=other, json={"messages": [
+            {"role": "user", "content": "Image", "images": [digest]}
+        ]})
+        assert response.status_code == 404
+        assert client.get(f"/api/v1/images/{digest}", headers=other).status_code == 404
+
+        # Sending the image itself does
+        client.post(f"/api/v1/conversations/{conv_id}/messages", headers=other, json={"messages": [
+            {"role": "user", "content": "Image", "images": [base64.b64encode(image).decode("ascii")]}
+        ]})
+        assert client.get(f"/api/v1/images/{digest}", headers=other).status_code == 200
+
+
+    def test_foreign_digests_refused(self):
+        """Test that digests of someone else's images are refused before reaching the model or a conversation."""
+        image = PNG + uuid.uuid4().bytes
+        digest = hashlib.sha256(image).hexdigest()
+        assert client.post("/api/v1/images/", headers=get_auth_headers(), files={"file": ("a.png", image, "image/png")}).status_code == 201
+        other = get_other_user_headers()
+        messages = [{"role": "user", "content": "Décris l'image", "images": [digest]}]
+
+        assert client.post("/api/v1/chat", json={"messages": messages}).status_code == 404
+        assert client.post("/api/v1/chat", headers=other, json={"messages": messages}).status_code == 404
+        conv_id = str(uuid.uuid4())
+        client.post("/api/v1/conversations/", headers=other, json={"id": conv_id, "mode": "chat"})
+        response = client.post("/api/v1/chat", headers=other, json={"conversation_id": conv_id, "message": messages[0]})
+        assert response.status_code == 404
+        response = client.put(f"/api/v1/conversations/{conv_id}", headers=other, json={"messages": messages})
+        assert response.status_code == 404
+        assert client.get(f"/api/v1/conversations/{conv_id}", headers=other).json()["messages"] == []
+
+
+class TestImageReferences:
+    """Tests for images referenced by digest in conversations and LLM requests."""
+
+    def test_inline_images_stored_by_digest(self):
+        """Test that inline base64 in saved messages is moved to the store."""
+        conv_id = str(uuid.uuid4())
+        conversations_db.create_conversation(4242, conv_id, "chat")
+        inline = base64.b64encode(PNG).decode("ascii")
+        conversations_db.append_messages(conv_id, 4242, [{"role": "user", "content": "Image", "images": [inline]}])
+
+        stored = conversations_db.get_conversation(conv_id, 4242).messages[0].images
+        assert stored == [hashlib.sha256(PNG).hexdigest()]
+        assert image_store.read(stored[0]) == PNG
+
+        # Saving the same history again (inline or by digest) rewrites nothing
+        saved = conversations_db.update_conversation(conv_id, 4242, [{"role": "user", "content": "Image", "images": [inline]}])
+        assert saved.messages[0].images == stored
+        conversations_db.delete_conversation(conv_id, 4242)
+
+    def test_llm_request_resolves_digests(self, monkeypatch):
+        """Test that digests become base64 only in the Ollama request, and old images are not re-sent."""
+        monkeypatch.setattr(settings, "MAX_HISTORY_MESSAGES", 3)
+        digest = image_store.put(PNG)
+        messages = [
+            Message(role="user", content="Première image", images=[digest]),
+            Message(role="assistant", content="Vu"),
+            Message(role="user", content="Suite"),
+            Message(role="assistant", content="Ok"),
+            Message(role="user", content="Et celle-ci ?", images=[digest, "f" * 64]),
+        ]
+
+        built = OllamaClient().build_messages(messages, "system")
+
+        assert [m["content"] for m in built] == ["system", "Première image", "Ok", "Et celle-ci ?"]
+        assert "images" not in built[1]
+        assert built[-1]["images"] == [base64.b64encode(PNG).decode("ascii")]
+
+    def test_inline_images_migrated_once(self, tmp_path, monkeypatch):
+        """Test that legacy inline images are moved to the store on the first startup only."""
+        monkeypatch.setattr(conversations_db, "DB_PATH", str(tmp_path / "conversations.db"))
+        conversations_db.init_conversations_db()
+        inline = base64.b64encode(PNG).decode("ascii")
+        conversations_db.create_conversation(4242, "c1", "chat")
+        conn = conversations_db._db().connection()
+        conn.execute(
+            "INSERT INTO conversation_messages (conversation_id, seq, role, content, images) VALUES ('c1', 0, 'user', 'Image', ?)",
+            (f'["{inline}"]',)
+        )
+        conn.execute("PRAGMA user_version = 0")
+        conn.commit()
+
+        conversations_db.init_conversations_db()
+        assert conversations_db.get_conversation("c1", 4242).messages[0].images == [hashlib.sha256(PNG).hexdigest()]
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == conversations_db._INLINE_IMAGES_MIGRATED
+
+        scans = []
+        monkeypatch.setattr(conversations_db.image_store, "intern", lambda images: scans.append(images) or images)
+        conversations_db.init_conversations_db()
+        assert scans == []
+
+    def test_existing_images_owned_after_upgrade(self, tmp_path, monkeypatch):
+        """Test that images already in conversations stay readable by their owners."""
+        monkeypatch.setattr(conversations_db, "DB_PATH", str(tmp_path / "conversations.db"))
+        conversations_db.init_conversations_db()
+        digest = image_store.put(PNG)
+        conversations_db.create_conversation(4242, "c1", "chat")
+        conversations_db.append_messages("c1", 4242, [{"role": "user", "content": "Image", "images": [digest]}])
+        with conversations_db._db().transaction() as conn:
+            conn.execute("DROP TABLE image_owners")
+
+        conversations_db.init_conversations_db()
+        assert conversations_db.can_read_image(digest, 4242)
+        assert not conversations_db.can_read_image(digest, 4243)
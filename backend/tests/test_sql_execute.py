@@ -0,0 +1,377 @@
+"""
+Tests for SQL execution endpoints and result encoding.
+"""
+from fastapi.testclient import TestClient
+from app.main import app
+from app.core.config import settings
+from app.infrastructure.database import result_format
+from app.core.sql_binds import parameterize_sql
+from datetime import datetime
+from decimal import Decimal
+import gzip
+import json
+import pytest
+import threading
+import time
+
+client = TestClient(app)
+
+
+def get_auth_headers():
+    """Helper to get authentication headers."""
+    response = client.post(
+        "/api/v1/auth/login",
+        json={"username": "admin", "password": "admin123"}
+    )
+    token = response.json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+class TestResultFormat:
+    """Tests for result set encoding helpers."""
+
+    ROWS = [
+        (1, "a", datetime(2024, 1, 2, 3, 4, 5), None),
+        (2, None, datetime(2024, 2, 3, 4, 5, 6), Decimal("1.50")),
+    ]
+    # As reported by oracle_client.json_ready_columns
+    JSON_READY = [True, True, False, False]
+
+    def test_converters_only_for_non_native_columns(self):
+        converters = result_format.column_converters(self.JSON_READY, 4)
+        assert converters[0] is None
+        assert converters[1] is None
+        assert converters[2] is not None
+        assert converters[3] is not None
+        assert result_format.column_converters(None, 2) == [None, None]
+
+    def test_converters_from_types_not_first_values(self):
+        # The first non-null value of AMOUNT is a str: the column is still converted
+        rows = [(None,), ("x",), (Decimal("2"),)]
+        assert result_format.to_columns(rows, 1, [False]) == [[None, "x", "2"]]
+
+    def test_json_ready_columns_from_description(self):
+        oracledb = pytest.importorskip("oracledb")
+        from app.infrastructure.database.oracle_client import json_ready_columns
+
+        description = [
+            ("ID", oracledb.DB_TYPE_NUMBER), ("NOM", oracledb.DB_TYPE_CHAR),
+            ("CREE_LE", oracledb.DB_TYPE_DATE), ("DONNEES", oracledb.DB_TYPE_LONG_RAW),
+        ]
+        assert json_ready_columns(description) == [True, True, True, False]
+        assert json_ready_columns(None) == []
+
+    def test_to_columns(self):
+        data = result_format.to_columns(self.ROWS, 4, self.JSON_READY)
+        assert data[0] == [1, 2]
+        assert data[1] == ["a", None]
+        assert data[2] == ["2024-01-02 03:04:05", "2024-02-03 04:05:06"]
+        assert data[3] == [None, "1.50"]
+
+    def test_to_records_matches_legacy_shape(self):
+        records = result_format.to_records(["ID", "NAME", "CREATED", "AMOUNT"], self.ROWS, self.JSON_READY)
+        assert records[0] == {"ID": 1, "NAME": "a", "CREATED": "2024-01-02 03:04:05", "AMOUNT": None}
+
+    def test_encode_arrow(self):
+        pa = pytest.importorskip("pyarrow")
+        body = result_format.encode_arrow(["ID", "NAME", "CREATED", "AMOUNT"], self.ROWS, self.JSON_READY)
+        table = pa.ipc.open_stream(body).read_all()
+        assert table.column_names == ["ID", "NAME", "CREATED", "AMOUNT"]
+        assert table.column("ID").to_pylist() == [1, 2]
+        assert table.column("CREATED").to_pylist() == ["2024-01-02 03:04:05", "2024-02-03 04:05:06"]
+        assert table.column("AMOUNT").to_pylist() == [None, "1.50"]
+
+    def test_accepts_json(self):
+        assert result_format.accepts_json(None)
+        assert result_format.accepts_json("application/vnd.apache.arrow.stream, application/json;q=0.5")
+        assert result_format.accepts_json("*/*")
+        assert not result_format.accepts_json("application/vnd.apache.arrow.stream")
+
+    def test_empty_result(self):
+        assert result_format.to_columns([], 2) == [[], []]
+        assert result_format.to_arrays([], 2) == []
+
+    def test_accepts_gzip(self):
+        assert result_format.accepts_gzip("gzip, deflate, br")
+        assert not result_format.accepts_gzip("gzip;q=0")
+        assert not result_format.accepts_gzip(None)
+
+
+class TestSQLExecuteEndpoint:
+    """Tests for /api/v1/sql/execute (mock mode without Oracle)."""
+
+    def test_default_rows_format(self):
+        response = client.post(
+            "/api/v1/sql/execute",
+            headers=get_auth_headers(),
+            json={"query": "SELECT 1 FROM dual"}
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["columns"] == ["info"]
+        assert isinstance(data["rows"][0], dict)
+
+    def test_columns_format(self):
+        response = client.post(
+            "/api/v1/sql/execute",
+            headers=get_auth_headers(),
+            json={"query": "SELECT 1 FROM dual", "format": "columns"}
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["format"] == "columns"
+        assert data["rows"] == []
+        assert data["data"][0][0].startswith("Base de données")
+
+    def test_arrow_stream(self):
+        pa = pytest.importorskip("pyarrow")
+        response = client.post(
+            "/api/v1/sql/execute",
+            headers={**get_auth_headers(), "Accept": result_format.ARROW_MEDIA_TYPE},
+            json={"query": "SELECT 1 FROM dual"}
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"] == result_format.ARROW_MEDIA_TYPE
+        assert pa.ipc.open_stream(response.content).read_all().column_names == ["info"]
+
+    def test_arrow_without_pyarrow(self, monkeypatch):
+        monkeypatch.setattr(result_format, "HAS_ARROW", False)
+        headers = get_auth_headers()
+        response = client.post(
+            "/api/v1/sql/execute",
+            headers={**headers, "Accept": result_format.ARROW_MEDIA_TYPE},
+            json={"query": "SELECT 1 FROM dual"}
+        )
+        assert response.status_code == 406
+        assert "pyarrow" in response.json()["detail"]
+
+        # JSON is served instead when the client also accepts it
+        response = client.post(
+            "/api/v1/sql/execute",
+            headers={**headers, "Accept": f"{result_format.ARROW_MEDIA_TYPE}, application/json;q=0.5"},
+            json={"query": "SELECT 1 FROM dual"}
+        )
+        assert response.status_code == 200
+        assert response.json()["columns"] == ["info"]
+
+    def test_gzip_variant(self):
+        body = result_format.encode_json(["C"], [("x" * 2000,)], "arrays")
+        compressed, encoding = result_format.maybe_gzip(body, "gzip")
+        assert encoding == "gzip"
+        assert json.loads(gzip.decompress(compressed))["data"] == [["x" * 2000]]
+
+
+class TestOutputTypeHandler:
+    """Tests for driver-level type conversion in OracleClient."""
+
+    class FakeCursor:
+        arraysize = 100
+
+        def var(self, typ, **kwargs):
+            return typ, kwargs
+
+    class FakeMetadata:
+        def __init__(self, type_code):
+            self.type_code = type_code
+
+    def test_handler_types(self):
+        oracledb = pytest.importorskip("oracledb")
+        from app.infrastructure.database.oracle_client import output_type_handler
+
+        cursor = self.FakeCursor()
+        typ, kwargs = output_type_handler(cursor, self.FakeMetadata(oracledb.DB_TYPE_DATE))
+        assert typ is oracledb.DB_TYPE_DATE
+        assert kwargs["outconverter"](datetime(2024, 3, 1, 8, 5)) == "2024-03-01 08:05:00"
+        typ, kwargs = output_type_handler(cursor, self.FakeMetadata(oracledb.DB_TYPE_TIMESTAMP))
+        assert kwargs["outconverter"](datetime(2024, 3, 1, 8, 5)) == "2024-03-01 08:05:00.000000"
+        assert output_type_handler(cursor, self.FakeMetadata(oracledb.DB_TYPE_ROWID))[0] is oracledb.DB_TYPE_VARCHAR
+        assert output_type_handler(cursor, self.FakeMetadata(oracledb.DB_TYPE_CLOB))[0] is oracledb.DB_TYPE_LONG
+        typ, kwargs = output_type_handler(cursor, self.FakeMetadata(oracledb.DB_TYPE_BLOB))
+        assert kwargs["outconverter"](b"\x01\xff") == "01ff"
+        assert output_type_handler(cursor, self.FakeMetadata(oracledb.DB_TYPE_NUMBER)) is None
+
+    def test_session_callback_keeps_nls_defaults(self):
+        from app.infrastructure.database.oracle_client import SESSION_TAG, _init_session
+
+        class FakeConnection:
+            def cursor(self):
+                raise AssertionError("no statement expected")
+
+        connection = FakeConnection()
+        _init_session(connection, SESSION_TAG)
+        assert connection.tag == SESSION_TAG
+        assert connection.stmtcachesize == settings.ORACLE_STMT_CACHE_SIZE
+
+
+class TestSQLJobsEndpoints:
+    """Tests for /api/v1/sql/jobs (mock mode without Oracle)."""
+
+    def wait_for(self, job_id, headers, timeout=5.0):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            job = client.get(f"/api/v1/sql/jobs/{job_id}", headers=headers).json()
+            if job["status"] not in ("pending", "running"):
+                return job
+            time.sleep(0.05)
+        raise AssertionError("job did not finish")
+
+    def test_submit_poll_and_download(self):
+        headers = get_auth_headers()
+        response = client.post(
+            "/api/v1/sql/jobs/",
+            headers=headers,
+            json={"query": "SELECT * FROM clients"}
+        )
+        assert response.status_code == 202
+        job = self.wait_for(response.json()["id"], headers)
+        assert job["status"] == "succeeded"
+        assert job["row_count"] == 1
+
+        result = client.get(f"/api/v1/sql/jobs/{job['id']}/result", headers=headers)
+        assert result.status_code == 200
+        lines = [json.loads(line) for line in result.text.splitlines()]
+        assert lines[0] == {"columns": ["info"]}
+        assert len(lines) == 2
+
+    def test_submit_blocked_query(self):
+        response = client.post(
+            "/api/v1/sql/jobs/",
+            headers=get_auth_headers(),
+            json={"query": "DELETE FROM clients"}
+        )
+        assert response.status_code == 403
+
+    def test_cancel_finished_job_conflicts(self):
+        headers = get_auth_headers()
+        job_id = client.post(
+            "/api/v1/sql/jobs/", headers=headers, json={"query": "SELECT 1 FROM dual"}
+        ).json()["id"]
+        self.wait_for(job_id, headers)
+        response = client.post(f"/api/v1/sql/jobs/{job_id}/cancel", headers=headers)
+        assert response.status_code == 409
+
+    def test_unknown_job(self):
+        response = client.get("/api/v1/sql/jobs/unknown", headers=get_auth_headers())
+        assert response.status_code == 404
+
+    def test_job_runs_query_as_written_when_rewrite_fails(self, tmp_path, monkeypatch):
+        from app.core import sql_binds
+        from app.domain.services import sql_job_service as service_module
+        from app.infrastructure.database.sql_jobs_db import SQLJob
+
+        def failing_rewrite(sql, lift_strings=None):
+            raise ValueError("unsupported")
+
+        executed = []
+
+        def stream(sql, max_rows, binds=None, on_connection=None):
+            executed.append((sql, binds))
+            yield ["N"]
+            yield [(1,)]
+
+        monkeypatch.setattr(sql_binds, "parameterize_sql", failing_rewrite)
+        monkeypatch.setattr(service_module.db_client, "pool", object())
+        monkeypatch.setattr(service_module.db_client, "stream", stream)
+        job = SQLJob(id="j1", user_id=1, username="admin", query="SELECT 1 AS n FROM dual WHERE 1 = 1",
+                     max_rows=10, status="running", created_at="2024-01-01T00:00:00")
+
+        columns, row_count = service_module.sql_job_service._spill(job, str(tmp_path / "j1.ndjson.gz"), threading.Event())
+        assert (columns, row_count) == (["N"], 1)
+        assert executed == [(job.query, {})]
+
+
+class TestParameterizeSQL:
+    """Tests for literal lifting into bind variables."""
+
+    def test_predicate_literals_become_binds(self):
+        result = parameterize_sql("SELECT * FROM clients WHERE client_id = 1234 AND nom = 'O''Brien'", lift_strings=True)
+        assert result.sql == "SELECT * FROM clients WHERE client_id = :b1 AND nom = :b2"
+        assert result.binds == {"b1": 1234, "b2": "O'Brien"}
+
+    def test_string_literals_kept_by_default(self):
+        # A CHAR column only matches a literal with blank-padded comparison
+        query = "SELECT * FROM clients WHERE client_id = 1234 AND code_pays = 'FR'"
+        result = parameterize_sql(query)
+        assert result.sql == "SELECT * FROM clients WHERE client_id = :b1 AND code_pays = 'FR'"
+        assert result.binds == {"b1": 1234}
+
+    def test_same_shape_for_different_literals(self):
+        first = parameterize_sql("SELECT * FROM clients WHERE client_id = 1")
+        second = parameterize_sql("select *  from clients where client_id = 42")
+        assert first.shape == second.shape
+        assert first.shape_id == second.shape_id
+
+    def test_literals_that_must_stay(self):
+        query = (
+            "SELECT 'x' AS k FROM t WHERE d > DATE '2024-01-01' "
+            "AND TO_CHAR(d, 'YYYY') = '2024' ORDER BY 1 FETCH FIRST 10 ROWS ONLY"
+        )
+        result = parameterize_sql(query, lift_strings=True)
+        assert result.binds == {"b1": "2024"}
+        assert "'x' AS k" in result.sql
+        assert "DATE '2024-01-01'" in result.sql
+        assert "TO_CHAR(d, 'YYYY')" in result.sql
+        assert result.sql.endswith("ORDER BY 1 FETCH FIRST 10 ROWS ONLY")
+
+    def test_subquery_and_decimal(self):
+        result = parameterize_sql("SELECT * FROM t WHERE x IN (SELECT y FROM u WHERE z = 3.5)")
+        assert result.binds == {"b1": Decimal("3.5")}
+
+    def test_existing_binds_untouched(self):
+        query = "SELECT * FROM t WHERE x = :id AND y = 3"
+        result = parameterize_sql(query)
+        assert result.sql == query
+        assert result.binds == {}
+
+
+class TestOraclePoolSizing:
+    """Tests for pool observability and adaptive sizing."""
+
+    class FakePool:
+        def __init__(self, max_size):
+            self.opened = 1
+            self.busy = 0
+            self.max = max_size
+
+        def acquire(self, tag=None):
+            self.busy += 1
+            return object()
+
+        def release(self, connection):
+            self.busy -= 1
+
+        def reconfigure(self, max):
+            self.max = max
+
+    def make_client(self):
+        from app.infrastructure.database.oracle_client import OracleClient
+        client_ = OracleClient()
+        client_.pool = self.FakePool(client_.base_max)
+        return client_
+
+    def test_grows_on_slow_acquire_up_to_ceiling(self):
+        db = self.make_client()
+        for _ in range(db.ceiling + 5):
+            db._grow_if_starved(10.0)
+        assert db.max_size == db.ceiling
+        assert db.pool.max == db.ceiling
+
+    def test_fast_acquire_does_not_grow(self):
+        db = self.make_client()
+        with db.acquire():
+            assert db.pool.busy == 1
+        assert db.pool.busy == 0
+        assert db.max_size == db.base_max
+
+    def test_shrinks_when_idle(self):
+        db = self.make_client()
+        db._grow_if_starved(10.0)
+        assert db.max_size == db.base_max + 1
+        db._last_pressure -= 10_000
+        db.shrink_if_idle()
+        assert db.max_size == db.base_max
+
+    def test_health_reports_pool(self):
+        response = client.get("/health")
+        assert "pool" in response.json()
+        assert "saturation" in response.json()["pool"]
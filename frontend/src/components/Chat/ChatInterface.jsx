@@ -1,7 +1,7 @@
 import React, { useState, useRef, useEffect } from 'react';
 import MessageBubble from './MessageBubble';
 import ChatInput from './ChatInput';
-import { streamChat, sendFeedback } from '../../services/api';
+import { streamChat, sendFeedback, uploadImage } from '../../services/api';
 import { Download, FileText } from 'lucide-react';
 import FeedbackModal from '../UI/FeedbackModal';
 import { useToast } from '../UI/Toast';
@@ -91,7 +91,9 @@ const ChatInterface = ({ mode, sessionId, onUpdateTitle }) => {
 
     const handleSendMessage = async (payload) => {
         const content = typeof payload === 'object' ? payload.content : payload;
-        const images = typeof payload === 'object' ? (payload.images || []) : [];
+        const rawImages = typeof payload === 'object' ? (payload.images || []) : [];
+        // Upload images once and keep only their hash in the history
+        const images = await Promise.all(rawImages.map(img => uploadImage(img).catch(() => img)));
         const userMessage = { role: 'user', content, images };
         
         setMessages(prev => [...prev, userMessage]);
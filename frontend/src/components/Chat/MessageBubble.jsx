@@ -1,10 +1,22 @@
-import React, { useState } from 'react';
+import React, { useEffect, useState } from 'react';
 import Markdown from 'react-markdown';
 import { Clipboard, ThumbsUp, ThumbsDown, RefreshCw, Copy, Play, Loader2 } from 'lucide-react';
 import { useToast } from '../UI/Toast';
-import { executeSQL } from '../../services/api';
+import { executeSQL, loadImageSrc } from '../../services/api';
 import SQLResultsModal from './SQLResultsModal';
 
+// Attached image, loaded with the auth header
+const AttachedImage = ({ image }) => {
+    const [src, setSrc] = useState(null);
+
+    useEffect(() => {
+        let active = true;
+        loadImageSrc(image).then(url => { if (active) setSrc(url); }).catch(() => {});
+        return () => { active = false; };
+    }, [image]);
+
+    return src ? <img src={src} alt="User attachment" className="max-w-[200px] rounded-lg border-2 border-white/20 shadow-sm" /> : null;
+};
 
 const MessageBubble = ({ role, content, isThinking, images, onFeedback, onRegenerate, isLastAssistantMessage = false }) => {
     const toast = useToast();
@@ -178,7 +190,7 @@ const MessageBubble = ({ role, content, isThinking, images, onFeedback, onRegene
                                 {images && images.length > 0 && (
                                     <div className="flex flex-wrap gap-2 mb-1">
                                         {images.map((img, i) => (
-                                            <img key={i} src={`data:image/png;base64,${img}`} alt="User attachment" className="max-w-[200px] rounded-lg border-2 border-white/20 shadow-sm" />
+                                            <AttachedImage key={i} image={img} />
                                         ))}
                                     </div>
                                 )}
@@ -116,11 +116,65 @@ export async function validateSQL(query) {
 // Conversations API (Centralized History)
 // ============================================
 
+// Upload a base64 image once; messages then reference it by its SHA-256 hash
+export async function uploadImage(base64) {
+    const token = getAuthToken();
+    const bytes = Uint8Array.from(atob(base64), c => c.charCodeAt(0));
+    const form = new FormData();
+    form.append("file", new Blob([bytes]), "image");
+
+    const response = await fetch(`${API_URL}/images/`, {
+        method: "POST",
+        headers: {
+            ...(token && { "Authorization": `Bearer ${token}` })
+        },
+        body: form,
+    });
+
+    if (!response.ok) {
+        const errorData = await response.json().catch(() => ({}));
+        throw new Error(errorData.detail || "Échec de l'envoi de l'image");
+    }
+
+    return (await response.json()).hash;
+}
+
+// Object URLs of the stored images already loaded, by hash
+const imageSources = new Map();
+
+// Source of a message image: stored images are referenced by hash and need
+// the auth header (fetched once into an object URL), older ones are inline base64
+export function loadImageSrc(image) {
+    if (!/^[0-9a-f]{64}$/.test(image)) {
+        return Promise.resolve(`data:image/png;base64,${image}`);
+    }
+    if (!imageSources.has(image)) {
+        const token = getAuthToken();
+        const source = fetch(`${API_URL}/images/${image}`, {
+            headers: {
+                ...(token && { "Authorization": `Bearer ${token}` })
+            },
+        })
+            .then(response => {
+                if (!response.ok) throw new Error("Image non disponible");
+                return response.blob();
+            })
+            .then(blob => URL.createObjectURL(blob))
+            .catch(error => {
+                imageSources.delete(image);
+                throw error;
+            });
+        imageSources.set(image, source);
+    }
+    return imageSources.get(image);
+}
+
 // Get all user conversations
-export async function getConversations(limit = 50) {
+export async function getConversations(limit = 50, cursor = null) {
     const token = getAuthToken();
+    const cursorParam = cursor ? `&cursor=${encodeURIComponent(cursor)}` : "";
     
-    const response = await fetch(`${API_URL}/conversations/?limit=${limit}`, {
+    const response = await fetch(`${API_URL}/conversations/?limit=${limit}${cursorParam}`, {
         headers: {
             ...(token && { "Authorization": `Bearer ${token}` })
         }